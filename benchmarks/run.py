@@ -0,0 +1,152 @@
+""" End-to-end grading benchmarks on synthetic labs.
+
+Usage (from the repository root):
+
+    python benchmarks/run.py
+    python benchmarks/run.py --sizes 10 100 --latency 0.002 --workers 4
+
+Every size is graded in a fresh subprocess (so that peak memory is per run)
+through the same YAML pipeline as the matgrade command, with MATLAB replaced
+by a fake engine that takes --latency seconds per call.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, "benchmarks"))
+
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument(
+    "--sizes", type = int, nargs = "+", default = [10, 100, 1000, 5000],
+    help = "numbers of students to benchmark"
+)
+parser.add_argument(
+    "--latency", type = float, default = 0.0,
+    help = "simulated seconds per engine call (default: 0)"
+)
+parser.add_argument(
+    "-w", "--workers", type = int, default = 1,
+    help = "number of engines to grade with"
+)
+parser.add_argument(
+    "-b", "--batch", action = "store_true",
+    help = "run all of a student's calls in a single engine call"
+)
+parser.add_argument(
+    "--json", help = "also write results to this file"
+)
+parser.add_argument("--single", type = int, help = argparse.SUPPRESS)
+
+
+#------------------------------------------------------------------------------
+# Single run (in its own process)
+
+def run(students, args):
+
+    import synthetic
+    from matgrade import load
+
+    path = tempfile.mkdtemp(prefix = "matgrade-bench-")
+    filename = synthetic.write_lab(path, students)
+    os.chdir(path)
+
+    factory, engines = synthetic.factory(args.latency)
+
+    options = argparse.Namespace(
+        workers = args.workers, batch = args.batch, no_cache = True,
+        resume = False, shard = None, output = []
+    )
+
+    start = time.perf_counter()
+
+    assessment = load(filename, options, factory)
+    assessment.grade("grades.csv")
+
+    wall = time.perf_counter() - start
+
+    if assessment.pool is not None:
+        assessment.pool.close()
+
+    # ru_maxrss is in kilobytes on Linux (and bytes on macOS)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss /= 1024
+
+    return {
+        "students": students,
+        "wall": wall,
+        "throughput": students / wall,
+        "calls": sum(e.calls for e in engines) / students,
+        "rss": rss / 1024,
+        "phases": assessment.timings,
+    }
+
+
+#------------------------------------------------------------------------------
+# Reporting
+
+def report(results):
+
+    phases = ["ingestion", "code", "evaluation", "aggregation", "output"]
+
+    header = "{:>8} {:>9} {:>11} {:>12} {:>9}".format(
+        "students", "wall (s)", "students/s", "calls/student", "rss (MB)"
+    )
+    header += "".join(" {:>11}".format(p) for p in phases)
+    print(header)
+
+    for r in results:
+
+        line = "{:>8} {:>9.3f} {:>11.1f} {:>12.2f} {:>9.1f}".format(
+            r["students"], r["wall"], r["throughput"], r["calls"], r["rss"]
+        )
+        line += "".join(
+            " {:>11.4f}".format(r["phases"].get(p, 0)) for p in phases
+        )
+        print(line)
+
+
+def main():
+
+    args = parser.parse_args()
+
+    if args.single is not None:
+        print(json.dumps(run(args.single, args)))
+        return
+
+    options = ["--latency", str(args.latency), "--workers", str(args.workers)]
+    if args.batch:
+        options.append("--batch")
+
+    results = []
+
+    for students in args.sizes:
+
+        output = subprocess.run(
+            [sys.executable, __file__, "--single", str(students)] + options,
+            stdout = subprocess.PIPE, check = True, universal_newlines = True
+        )
+
+        # Last line holds results (earlier ones are matgrade messages)
+        results.append(json.loads(output.stdout.strip().split("\n")[-1]))
+
+    report(results)
+
+    if args.json:
+        f = open(args.json, "w")
+        with f:
+            json.dump(results, f, indent = 2)
+
+
+if __name__ == "__main__":
+    main()
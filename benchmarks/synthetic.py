@@ -0,0 +1,187 @@
+""" Synthetic labs for benchmarking matgrade without MATLAB.
+
+A lab is the test_submissions plus_or_minus assignment scaled up to any
+number of students. Submissions are real m files, which the fake backend
+"runs" by reading back the offset and error line they were generated with.
+"""
+
+import os
+import re
+
+import numpy as np
+
+from matgrade.backends import ExecutionError, FakeBackend
+
+
+LAB = """solution: plus_or_minus.m
+submissions: submissions
+timeout: {timeout}
+cache: false
+
+variables:
+
+  x: "[1, 1]"
+
+checks:
+
+  shape:
+    shape: [["x", "x", "'plus'"]]
+    shape2: [["x", "x", "'both'"], 2]
+
+  absolute_value:
+    plus: [["200", "100", "'plus'"], 0.01]
+
+  relative_value:
+    minus: [["200", "100", "'minus'"], 0.01]
+    minus2: [["200", "100", "'both'"], 0.01, 2]
+
+  error:
+    error: ["1", "1", "'multiply'"]
+"""
+
+COMPONENTS = [
+    ("name", ["name"], "and"),
+    ("shape", ["shape"], "and"),
+    ("shape2", ["shape2"], "and"),
+    ("plus", ["plus"], "and"),
+    ("minus", ["minus"], "and"),
+    ("minus2", ["minus2"], "and"),
+    ("plus_or_minus", ["plus", "minus"], "or"),
+    ("plus_and_minus", ["plus", "minus"], "and"),
+    ("error", ["error"], "and"),
+]
+
+CODE = """function [z, w] = plus_or_minus(x, y, operation)
+submission = {i};
+offset = {offset};
+w = 0;
+if strcmp(operation, 'plus')
+    z = x + y + offset;
+elseif strcmp(operation, 'minus')
+    z = x - y + offset;
+elseif strcmp(operation, 'both')
+    z = x + y + offset;
+    w = x - y + offset;
+else
+{otherwise}
+end
+end
+"""
+
+# Submission variants, cycled through by student number
+VARIANTS = ["correct", "offset", "noerror", "duplicate"]
+
+
+#------------------------------------------------------------------------------
+# Writing labs
+
+def code(i, variant):
+
+    offset = 1 if variant == "offset" else 0
+
+    if variant == "noerror":
+        otherwise = "    z = 0;"
+    else:
+        otherwise = "    error('Unknown operation');"
+
+    # Duplicates all share the same code (and so are graded once)
+    if variant == "duplicate":
+        i = 0
+
+    return CODE.format(i = i, offset = offset, otherwise = otherwise)
+
+
+def write_lab(path, students, timeout = 0.5):
+
+    os.makedirs(os.path.join(path, "submissions"), exist_ok = True)
+
+    f = open(os.path.join(path, "plus_or_minus.m"), "w")
+    with f:
+        f.write(code(0, "correct"))
+
+    for i in range(students):
+
+        variant = VARIANTS[i % len(VARIANTS)]
+        filename = "58877-128227 - Student {} - Oct 3, 2021 1123 PM-{}".format(
+            i, "wrong_name.m" if i % 7 == 6 else "plus_or_minus.m"
+        )
+
+        f = open(os.path.join(path, "submissions", filename), "w")
+        with f:
+            f.write(code(i + 1, variant))
+
+    documents = [LAB.format(timeout = timeout)]
+
+    for name, checks, combination in COMPONENTS:
+        documents.append(
+            "name: {}\nchecks: [{}]\ncombination: {}\ngrade: 10\n".format(
+                name, ", ".join(checks), combination
+            )
+        )
+
+    filename = os.path.join(path, "lab.yaml")
+
+    f = open(filename, "w")
+    with f:
+        f.write("\n---\n\n".join(documents))
+
+    return filename
+
+
+#------------------------------------------------------------------------------
+# Fake engine
+
+re_offset = re.compile(r"offset = (\d+);")
+
+functions = {}
+
+
+def resolve(name, paths):
+
+    filename = os.path.join(paths[0], name + ".m")
+
+    if filename in functions:
+        return functions[filename]
+
+    if not os.path.exists(filename):
+        return None
+
+    f = open(filename)
+    with f:
+        lines = f.read().split("\n")
+
+    offset = float(re_offset.search("\n".join(lines)).group(1))
+
+    line = [i + 1 for i, l in enumerate(lines) if "error(" in l]
+    line = line[0] if line else None
+
+    def plus_or_minus(x, y, operation):
+
+        x, y = np.asarray(x, float), np.asarray(y, float)
+
+        if operation == "plus":
+            return x + y + offset, 0.0
+        elif operation == "minus":
+            return x - y + offset, 0.0
+        elif operation == "both":
+            return x + y + offset, x - y + offset
+        elif line is not None:
+            msg = "Error using {} (line {})\nUnknown operation"
+            raise ExecutionError(msg.format(name, line))
+
+        return 0.0, 0.0
+
+    functions[filename] = plus_or_minus
+
+    return plus_or_minus
+
+
+def factory(latency = 0.0):
+
+    engines = []
+
+    def start():
+        engines.append(FakeBackend(resolver = resolve, latency = latency))
+        return engines[-1]
+
+    return start, engines
@@ -1,16 +1,71 @@
 import argparse
+import importlib
+import os
 import sys
 import warnings
 
-import yaml
+from . import profiling
+from .plan import PlanError, compile_plan, report
+from .shard import ShardError, merge
+from .sinks import SinkError, open_sink
+from .watch import Watcher, watch
 
-from .assessment import Assessment, AssessmentError
-from .checks import NameCheck, ValueCheck, CheckError
+# Names re-exported from modules that need numpy (and MATLAB to be useful),
+# imported on first access so that validating or merging starts quickly
+lazy = {
+    "AsyncAssessment": "aio",
+    "Assessment": "assessment",
+    "AssessmentError": "assessment",
+    "ExecutionBackend": "backends",
+    "FakeBackend": "backends",
+    "MatlabBackend": "backends",
+    "SharedSessions": "backends",
+    "NameCheck": "checks",
+    "ValueCheck": "checks",
+    "CheckError": "checks",
+    "submit": "daemon",
+}
+
+
+def __getattr__(name):
+
+    if name not in lazy:
+        msg = "module {!r} has no attribute {!r}"
+        raise AttributeError(msg.format(__name__, name))
+
+    module = importlib.import_module("." + lazy[name], __name__)
+
+    return getattr(module, name)
+
+
+def read_documents(filename):
+
+    import yaml
+
+    with open(filename) as f:
+        content = f.read()
+
+        # Using older load_all syntax
+        return [d for d in yaml.load_all(content, yaml.Loader)]
 
 
 #------------------------------------------------------------------------------
 # Defining command-line arguments
 
+def shard_argument(text):
+
+    try:
+        index, count = [int(i) for i in text.split("/")]
+    except ValueError:
+        index, count = 0, 0
+
+    if count < 1 or not 1 <= index <= count:
+        msg = "shards are given as i/N with 1 <= i <= N (got {})"
+        raise argparse.ArgumentTypeError(msg.format(text))
+
+    return index, count
+
+
 parser = argparse.ArgumentParser()
 
 parser.add_argument("path", help = "path to yaml config file")
@@ -18,166 +73,327 @@ parser.add_argument("path", help = "path to yaml config file")
 msg = "MOSS userid (e.g. 98xxxxxxx) for optional plagiarism detection"
 parser.add_argument("-m", "--moss", help = msg)
 
+msg = "run local plagiarism detection (no network access required)"
+parser.add_argument("-p", "--plagiarism", action = "store_true", help = msg)
+
+msg = "folder of past submissions to include in plagiarism detection"
+parser.add_argument(
+    "-a", "--archive", action = "append", default = [], help = msg
+)
+
+msg = "number of MATLAB engines to grade with in parallel (default: 1)"
+parser.add_argument("-w", "--workers", type = int, default = 1, help = msg)
+
+msg = "run all of a student's MATLAB calls in a single engine round-trip"
+parser.add_argument("-b", "--batch", action = "store_true", help = msg)
+
+msg = "ignore (and do not update) results cached by previous runs"
+parser.add_argument("--no-cache", action = "store_true", help = msg)
+
+msg = "resume an interrupted run from its journal of completed checks"
+parser.add_argument("-r", "--resume", action = "store_true", help = msg)
+
+msg = "write per-check/per-student timings to a JSON (or .csv) file"
+parser.add_argument("--profile", help = msg)
+
+msg = "keep running and regrade students as new submissions arrive"
+parser.add_argument("--watch", action = "store_true", help = msg)
+
+msg = "use a shared MATLAB session (by name, or any) instead of starting one"
+parser.add_argument("-s", "--session", nargs = "?", const = "", help = msg)
+
+msg = "grade through a long-lived matgrade daemon holding warm engines"
+parser.add_argument("-d", "--daemon", action = "store_true", help = msg)
+
+msg = "only grade shard i of N (e.g. 1/4), writing shard-i-of-N.json"
+parser.add_argument("--shard", type = shard_argument, help = msg)
+
+msg = "also stream per-student results to a .csv, .jsonl or .parquet file"
+parser.add_argument(
+    "-o", "--output", action = "append", default = [], help = msg
+)
+
+# Combining shards with "matgrade merge"
+merge_parser = argparse.ArgumentParser(prog = "matgrade merge")
+
+msg = "shard results written with --shard"
+merge_parser.add_argument("shards", nargs = "+", help = msg)
+
+msg = "grades file to write (default: grades.csv)"
+merge_parser.add_argument(
+    "-o", "--output", default = "grades.csv", help = msg
+)
+
+# Validating a lab with "matgrade compile" (without starting MATLAB)
+compile_parser = argparse.ArgumentParser(prog = "matgrade compile")
+compile_parser.add_argument("path", help = "path to yaml config file")
+
 
 #------------------------------------------------------------------------------
 # Generating assessment from yaml input
 
 def matgrade():
 
+    if sys.argv[1:2] == ["merge"]:
+
+        args = merge_parser.parse_args(sys.argv[2:])
+
+        try:
+            n = merge(args.shards, args.output)
+        except ShardError as e:
+            details = e.args[0]
+            print(details["message"])
+            sys.exit()
+
+        print("Merged grades of {} student(s) into {}".format(n, args.output))
+        return
+
+    if sys.argv[1:2] == ["compile"]:
+
+        args = compile_parser.parse_args(sys.argv[2:])
+
+        try:
+            plan = compile_plan(read_documents(args.path))
+        except PlanError as e:
+            details = e.args[0]
+            print(details["message"])
+            sys.exit()
+
+        print(report(plan))
+        return
+
     args = parser.parse_args()
 
-    filename = args.path
+    if args.daemon:
 
-    with open(filename) as f:
-        content = f.read()
+        from .daemon import submit
 
-        # Using older load_all syntax
-        documents = [d for d in yaml.load_all(content, yaml.Loader)]
+        argv = [a for a in sys.argv[1:] if a not in ("-d", "--daemon")]
+
+        try:
+            print(submit(argv), end = "")
+        except Exception as e:
+            details = e.args[0]
+            print(details["message"])
+            sys.exit()
+
+        return
+
+    run(args)
+
+
+def run(args, factory = None):
+
+    from .backends import SharedSessions
+
+    if args.session is not None:
+        factory = SharedSessions(args.session or None)
+
+    if args.shard and args.watch:
+        print("Watch mode can not be combined with sharding")
+        sys.exit()
 
-    # Initializing general assessment from first document
-    solution = documents[0]["solution"]
-    submissions = documents[0]["submissions"]
+    if args.profile:
+        profiling.enable()
 
+    assessment = load(args.path, args, factory)
+
+    # Closed even when grading stops early (e.g. a failing daemon request),
+    # so that the journal and result cache are not left open
     try:
-        assessment = Assessment(solution, submissions)
+        generate(assessment, args)
+    finally:
+        assessment.close()
+
+
+def generate(assessment, args):
+
+    for filename in args.output:
+
+        try:
+            assessment.add_sink(open_sink(filename))
+        except SinkError as e:
+            details = e.args[0]
+            print(details["message"])
+            sys.exit()
+
+    #--------------------------------------------------------------------------
+    # Generating output
+
+    if args.shard:
+        index, count = args.shard
+        filename = "shard-{}-of-{}.json".format(index, count)
+
+        assessment.grade_shard(filename, index, count)
+    else:
+        assessment.grade("grades.csv")
+
+    if args.profile:
+        profiling.profiler.write(args.profile)
+        print(profiling.profiler.report())
+
+    if args.moss:
+
+        try:
+            assessment.check_plagiarism(args.moss, "plagiarism_report.html")
+        except Exception as e:
+            details = e.args[0]
+            print(details["message"])
+            sys.exit()
+
+    elif args.plagiarism:
+
+        try:
+            assessment.check_similarity(
+                "plagiarism_report.html", args.archive
+            )
+        except Exception as e:
+            details = e.args[0]
+            print(details["message"])
+            sys.exit()
+
+    if args.watch:
+
+        if not os.path.isdir(assessment.source):
+            print("Watch mode requires a submissions folder")
+            sys.exit()
+
+        print("Watching {} for new submissions".format(assessment.source))
+
+        try:
+            watch(assessment, "grades.csv", Watcher(assessment.source))
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            details = e.args[0]
+            print(details["message"])
+            sys.exit()
+
+
+def load(filename, args, factory = None):
+
+    from .assessment import Assessment
+
+    # The lab is validated as a whole before MATLAB is started
+    try:
+        plan = compile_plan(read_documents(filename))
+    except PlanError as e:
+        details = e.args[0]
+        print(details["message"])
+        sys.exit()
+
+    try:
+        assessment = Assessment(
+            plan["solution"], plan["submissions"], plan["timeout"],
+            args.workers, factory = factory, cheap_first = plan["cheap_first"],
+            batch = args.batch
+        )
     except Exception as e:
         details = e.args[0]
         print(details["message"])
         sys.exit()
 
-    # Adding variables 
-    if "variables" in documents[0]:
-        variables = documents[0]["variables"]
-
-        for name, call in variables.items():
-
-            try:
-                assessment.add_variable(name, call)
-            except Exception as e:
-                details = e.args[0]
-                print(details["message"])
-                sys.exit()
-
-    # Adding checks
-    if "checks" in documents[0]:
-        checks = documents[0]["checks"]
-
-        if "shape" in checks:
-            shape_checks = checks["shape"]
-
-            for name in shape_checks:
-                check = shape_checks[name]
-                if len(check) > 1:
-                    n = check[1]
-                else:
-                    n = 1
-
-                try:
-                    assessment.add_shape_check(name, check[0], n)
-                except Exception as e:
-                    details = e.args[0]
-                    print(details["message"])
-                    sys.exit()
-
-        if "absolute_value" in checks:
-            value_checks = checks["absolute_value"]
-
-            for name in value_checks:
-                check = value_checks[name]
-                if len(check) > 2:
-                    n = check[2]
-                else:
-                    n = 1
-
-                try:
-                    assessment.add_value_check(name, check[0], check[1], False, n)
-                except Exception as e:
-                    details = e.args[0]
-                    print(details["message"])
-                    sys.exit()
-
-        if "relative_value" in checks:
-            value_checks = checks["relative_value"]
-
-            for name in value_checks:
-                check = value_checks[name]
-                if len(check) > 2:
-                    n = check[2]
-                else:
-                    n = 1
-
-                try:
-                    assessment.add_value_check(name, check[0], check[1], True, n)
-                except Exception as e:
-                    details = e.args[0]
-                    print(details["message"])
-                    sys.exit()
-
-        if "error" in checks:
-            error_checks = checks["error"]
-
-            for name in error_checks:
-                check = error_checks[name]
-
-                try:
-                    assessment.add_error_check(name, check)
-                except Exception as e:
-                    details = e.args[0]
-                    print(details["message"])
-                    sys.exit()
+    assessment.plan = plan["digest"]
 
+    if assessment.duplicates > 0:
+        msg = "Found {} group(s) of identical submissions (graded once each)"
+        print(msg.format(assessment.duplicates))
 
-    #--------------------------------------------------------------------------
-    # Looping through the rest of documents and performing tasks
+    # Persistent result cache (and solution outputs)
+    if not args.no_cache and plan["cache"] is not None:
 
-    for task in documents[1:]:
+        try:
+            assessment.use_result_cache(**plan["cache"])
+        except Exception as e:
+            details = e.args[0]
+            print(details["message"])
+            sys.exit()
 
-        if "grade" in task:
+    # Journaling results as they complete (and optionally resuming)
+    # Shards keep separate journals (the folder may be shared)
+    suffix = ""
+    if args.shard:
+        suffix = ".{}-of-{}".format(*args.shard)
 
-            if "checks" not in task:
-                print("Each grade task must define checks")
-                sys.exit()
-            elif not isinstance(task["checks"], list):
-                checks = [task["checks"]]
-            else:
-                checks = task["checks"]
+    try:
+        assessment.use_journal(args.resume, suffix)
+    except Exception as e:
+        details = e.args[0]
+        print(details["message"])
+        sys.exit()
 
-            if "combination" not in task:
-                task["combination"] = "or"
-                f = lambda a, b: a and b
-            elif task["combination"] == "or":
-                f = lambda a, b: a or b
-            elif task["combination"] == "and":
-                f = lambda a, b: a and b
-            else:
-                print("Grade task combination may only be \"and\"/\"or\"")
-                sys.exit()
+    if args.resume:
+        msg = "Resuming from {} journaled result(s)"
+        print(msg.format(len(assessment.journal)))
+
+    # Deriving check timeouts from solution run times
+    if plan["calibration"] is not None:
+
+        try:
+            assessment.calibrate(**plan["calibration"])
+        except Exception as e:
+            details = e.args[0]
+            print(details["message"])
+            sys.exit()
 
-            if "name" not in task:
-                if task["combination"] == "or":
-                    name = " / ".join(checks)
-                elif task["combination"] == "and":
-                    name = " + ".join(checks)
-            else:
-                name = task["name"]
+    try:
 
-            value = task["grade"]
+        for name, source in plan["variables"]:
+            assessment.add_variable(name, source)
 
-            assessment.add_graded_component(name, checks, f, value)
+        for check in plan["checks"]:
+            add_check(assessment, check)
 
+        assessment.save_solutions()
 
-    #--------------------------------------------------------------------------
-    # Generating output
+    except Exception as e:
+        details = e.args[0]
+        print(details["message"])
+        sys.exit()
 
-    assessment.grade("grades.csv")
+    msg = "Calibrated timeout for \"{}\": {:.3g} s (solution took {:.3g} s)"
+    for name, calibrated in assessment.calibrated.items():
+        print(msg.format(
+            name, calibrated["timeout"], calibrated["solution_time"]
+        ))
 
-    if args.moss:
+    for component in plan["components"]:
 
         try:
-            assessment.check_plagiarism(args.moss, "plagiarism_report.html")
+            assessment.add_graded_component(
+                component["name"], component["checks"],
+                component["combination"], component["value"]
+            )
         except Exception as e:
             details = e.args[0]
             print(details["message"])
             sys.exit()
 
-        
+    return assessment
+
+
+def add_check(assessment, check):
+
+    name = check["name"]
+    kind = check["kind"]
+
+    if kind == "shape":
+        assessment.add_shape_check(
+            name, check["arguments"], check["n"], check["timeout"]
+        )
+
+    elif kind in ("absolute_value", "relative_value"):
+        assessment.add_value_check(
+            name, check["arguments"], check["tolerance"], check["relative"],
+            check["n"], check["timeout"]
+        )
+
+    elif kind == "property":
+        assessment.add_property_check(
+            name, check["arguments"], check["samples"], check["seed"],
+            check["tolerance"], check["relative"], check["n"],
+            check["timeout"]
+        )
+
+    else:
+        assessment.add_error_check(name, check["arguments"], check["timeout"])
@@ -0,0 +1,187 @@
+import asyncio
+import concurrent.futures
+import time
+
+from .assessment import AssessmentError
+from .grades import tabulate, write_grades
+from .pool import EnginePool, PoolError
+
+
+class AsyncAssessment:
+    """ Grades students of an assessment from asyncio code.
+
+    Every engine of a pool grades one student at a time (engine futures are
+    waited on in worker threads, never on the event loop), so at most
+    `engines` students are graded concurrently. Cancelling a grading task
+    cancels the engine call it is waiting on.
+    """
+
+    def __init__(self, assessment, engines = None):
+
+        self.assessment = assessment
+
+        if engines is None:
+            engines = assessment.workers
+
+        self.size = engines
+        self.pool = None
+        self.idle = None
+        self.executor = None
+        self.lock = None
+
+        # Results of checks shared between identical submissions
+        self.shared = {}
+
+    async def start(self):
+
+        # Created here, as it has to belong to the running loop
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+
+        async with self.lock:
+            if self.pool is None:
+                await self.start_pool()
+
+    async def start_pool(self):
+
+        assessment = self.assessment
+
+        try:
+            pool = EnginePool(
+                assessment.factory, self.size, assessment.path,
+                assessment.variables, assessment.timeout
+            )
+        except PoolError as e:
+            raise AssessmentError(e.args[0])
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.size)
+
+        # MATLAB startup is slow, so it stays off the event loop
+        loop = asyncio.get_running_loop()
+
+        try:
+            await loop.run_in_executor(self.executor, pool.start)
+        except PoolError as e:
+            self.executor.shutdown()
+            raise AssessmentError(e.args[0])
+
+        self.pool = pool
+        self.idle = asyncio.Queue()
+
+        for worker in pool.workers:
+            self.idle.put_nowait(worker)
+
+    async def close(self):
+
+        if self.pool is None:
+            return
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.pool.close)
+
+        self.executor.shutdown()
+        self.pool = None
+
+    async def __aenter__(self):
+
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_):
+
+        await self.close()
+
+    #--------------------------------------------------------------------------
+    # Grading
+
+    def run(self, worker, student):
+
+        assessment = self.assessment
+        call = assessment.calls[student]
+
+        checks = worker.bind(assessment.checks)
+        shared = self.shared.setdefault(call, {})
+
+        start = time.perf_counter()
+        results = assessment.evaluate_student(
+            student, call, assessment.submissions[student], checks, shared
+        )
+        assessment.durations[student] = time.perf_counter() - start
+
+        assessment.results.put(student, results)
+        assessment.emit(student, results)
+
+        return results
+
+    async def grade_student(self, student):
+
+        # Check results of a single student, as {check: passed}
+        if student not in self.assessment.calls:
+            msg = "No submission to grade for \"{}\""
+            raise AssessmentError({"message": msg.format(student)})
+
+        await self.start()
+
+        worker = await self.idle.get()
+        worker.watchdog.resume()
+
+        job = self.executor.submit(self.run, worker, student)
+
+        try:
+            results = await asyncio.wrap_future(job)
+
+        except asyncio.CancelledError:
+
+            # The engine call in progress is cancelled, and the engine is only
+            # handed out again once the worker thread has given up on it
+            worker.watchdog.interrupt()
+
+            try:
+                await asyncio.wrap_future(job)
+            except Exception:
+                pass
+
+            raise
+
+        finally:
+            self.idle.put_nowait(worker)
+
+        return results
+
+    async def as_completed(self, students = None):
+
+        # Yields (student, results) pairs as students finish grading
+        if students is None:
+            students = list(self.assessment.calls)
+
+        await self.start()
+
+        async def grade(student):
+            return student, await self.grade_student(student)
+
+        tasks = [asyncio.ensure_future(grade(s)) for s in students]
+
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+            await asyncio.gather(*tasks, return_exceptions = True)
+
+    async def grade(self, filename, students = None):
+
+        # Grades students (all by default) and writes grades of everyone
+        # graded so far, like Assessment.grade
+        async for _ in self.as_completed(students):
+            pass
+
+        assessment = self.assessment
+        assessment.publish()
+        graded = [s for s in assessment.submissions if s in assessment.results]
+
+        write_grades(
+            filename,
+            tabulate(assessment.components(), assessment.results, graded)
+        )
@@ -1,17 +1,32 @@
-import functools
 import hashlib
-import matlab.engine
+import json
+import math
 import os
-import pandas as pd
 import re
-import requests
 import socket
-import shutil
 import time
-import warnings
+import zipfile
 
+import numpy as np
+
+from . import profiling
+from .backends import BackendError, ExecutionError, MatlabBackend
+from .batch import HARNESS, HARNESS_CODE, run_batch, run_samples
+from .cache import CallCache, CacheError, ResultCache, fingerprint
 from .checks import NameCheck, ShapeCheck, ValueCheck, ErrorCheck, CheckError
-from .misc import run_matlab_function
+from .checks import PropertyCheck, generate_samples
+from .checks import clear_failure, last_failure
+from .ingest import IngestError, ingest, refresh
+from .grades import combine, tabulate, write_grades
+from .shard import shard, write_shard
+from .journal import Journal, JournalError
+from .misc import run_matlab_function, setup_engine, shape_of, sync_code
+from .misc import to_array
+from .plagiarism import SimilarityIndex
+from .pool import EnginePool, PoolError
+from .results import ResultMatrix
+from .variables import VariableError, define_variable, variable
+from .watchdog import EngineError, Watchdog
 
 
 class AssessmentError(Exception):
@@ -20,7 +35,12 @@ class AssessmentError(Exception):
 
 class Assessment:
 
-    def __init__(self, solution, submissions):
+    def __init__(self, solution, submissions, timeout = 0.5, workers = 1,
+                 factory = None, cheap_first = False, batch = False):
+
+        # Wall time of each grading phase (in seconds)
+        self.timings = {}
+        start = time.perf_counter()
 
         # Read in solution content
         try:
@@ -34,89 +54,115 @@ class Assessment:
 
         self.solution_call = "sol"
 
-        # Double check submissions folder
-        if not os.path.isdir(submissions):
-            msg = "Could not open submissions folder: {}"
-            raise AssessmentError({"message": msg.format(submissions)})
-
+        # Read in submissions (from a folder or an LMS zip archive), only
+        # keeping the latest ones
         try:
-            filenames = os.listdir(submissions)
-        except:
-            msg = "Could not open submissions folder: {}"
-            raise AssessmentError({"message": msg.format(submissions)})
+            self.records, self.submissions = ingest(submissions)
+        except IngestError as e:
+            raise AssessmentError(e.args[0])
 
-        # Read in submissions, only keeping the latest ones
-        self.hashes = {}
-        self.submissions = {}
-        self.calls = {}
-        self.timestamps = {}
-        self.functions = {}
+        # Ensure that there is at least on formattes submission
+        if len(self.submissions) == 0:
+            msg = "No valid submissions found."
+            raise AssessmentError({"message": msg})
 
-        # Initialize regex for commant replacement
-        re_comment = re.compile("%.*\n")
+        self.timings["ingestion"] = time.perf_counter() - start
+        start = time.perf_counter()
 
-        for filename in filenames:
+        self.hash_students()
 
-            # Skip directories
-            submission = os.path.join(submissions, filename)
-            if os.path.isdir(submission):
-                continue
+        # Working files live in the submissions folder (or next to archive)
+        self.source = submissions
 
-            # Parse file name
-            components = [s.strip() for s in filename.split(" - ")]
+        if os.path.isdir(submissions):
+            self.root = submissions
+        else:
+            self.root = os.path.dirname(os.path.abspath(submissions))
 
-            # Basic check on format
-            try:
-                assert(len(components) == 3)
-                ids = components[0].split("-")
-                float(ids[0])
-                float(ids[1])
-            except:
-                msg = "File does not match submission pattern: {}"
-                warnings.warn(msg.format(filename))
-                continue 
-
-            # Clip filename from time
-            combined = components[2].split("-")
-            timestamp = combined[0]
-            function = "-".join(combined[1:])
-
-            # Parse timestamp
-            timestamp = time.strptime(timestamp, "%b %d, %Y %I%M %p")
-
-            # If student has newer submission on record, ignore
-            student = components[1]
-            
-            if student not in self.timestamps:
-                pass
-            elif self.timestamps[student] > timestamp:
-                continue
+        # Generate m files for MATLAB code (kept between runs, so that only
+        # new or changed submissions are rewritten)
+        self.path = os.path.abspath(os.path.join(self.root, ".code"))
+        self.engine = None
 
-            # Read in content
-            try:
-                f = open(submission)
-            except:
-                msg = "Could not open submission file: {}"
-                raise AssessmentError({"message": msg.format(submission)})
+        self.group_submissions()
+        self.touched = self.write_code()
 
-            with f:
-                submission = f.read()
+        self.timings["code"] = time.perf_counter() - start
 
-            # Remove all comments to facilitate plagiarism submission checking 
-            submission = re_comment.sub("", submission)
+        self.checks = {}
+        self.graded_components = []
 
-            # And add in student hash as an id
-            student_id = hashlib.sha256(student.encode("utf-8")).hexdigest()
+        # Variables are recorded so they can be replayed into a fresh engine
+        self.variables = []
 
-            self.hashes[student] = student_id
-            self.submissions[student] = submission
-            self.timestamps[student] = timestamp
-            self.functions[student] = function
+        self.timeout = timeout
 
-        # Ensure that there is at least on formattes submission
-        if len(self.submissions) == 0:
-            msg = "No valid submissions found."
-            raise AssessmentError({"message": msg.format(submission)})
+        # Optional (factor, minimum, maximum, repeats) used to derive check
+        # timeouts from solution run times, and the resulting values
+        self.calibration = None
+        self.calibrated = {}
+
+        # Digest of the compiled lab plan, when loaded from one
+        self.plan = None
+
+        self.watchdog = Watchdog(timeout, restart = self.restart_engine)
+
+        # Engines are created through a factory so they can be swapped out
+        if factory is None:
+            factory = MatlabBackend
+
+        self.factory = factory
+        self.workers = workers
+        self.pool = None
+
+        # Whether to evaluate cheap (non-MATLAB) checks first in components
+        self.cheap_first = cheap_first
+
+        # Whether to run all of a student's calls in one harness call
+        self.batch = batch
+
+        # Identical calls made by different checks are only run once
+        self.cache = CallCache(self.variables)
+
+        # Optional persistent results from previous runs, with the solution
+        # outputs of the previous run and of this one (by call)
+        self.result_cache = None
+        self.solutions = None
+        self.outputs = {}
+
+        # Optional log of completed evaluations (for resuming runs)
+        self.journal = None
+
+        # Check results of every graded student (kept between grade calls)
+        # and how long each one took
+        self.results = ResultMatrix()
+        self.durations = {}
+
+        # Run time and error of checks that were run, by call and check
+        self.details = {}
+
+        # Outputs receiving every student's results as they complete
+        self.sinks = []
+
+        try:
+            self.engine = self.start_engine()
+        except BackendError as e:
+            raise AssessmentError(e.args[0])
+
+        # Initializing special name check (to perform filename comparisons)
+        functions = {s: r.function for s, r in self.records.items()}
+        self.checks["name"] = NameCheck(functions, solution)
+
+    #--------------------------------------------------------------------------
+    # Tracking submissions
+
+    def hash_students(self):
+
+        # Add in student hash as an id
+        self.hashes = {
+            student: hashlib.sha256(student.encode("utf-8")).hexdigest()
+            for student in self.records
+        }
 
         # Trim hashes to keep things readable (but unique)
         ids = [i for i in self.hashes.values()]
@@ -131,52 +177,252 @@ class Assessment:
 
                 break
 
-        # Generate m files for MATLAB code
-        self.path = os.path.abspath(os.path.join(submissions, ".code"))
+    def update(self, filenames = None):
+
+        # Picks up new or changed submissions (given the names of changed
+        # files, if known), returning the students that need regrading
+        if not os.path.isdir(self.source):
+            msg = "Submissions can only be updated from a folder: {}"
+            raise AssessmentError({"message": msg.format(self.source)})
+
+        try:
+            records, submissions, changed = refresh(
+                self.source, self.records, self.submissions, filenames
+            )
+        except IngestError as e:
+            raise AssessmentError(e.args[0])
+
+        if len(changed) == 0:
+            return changed
+
+        self.records = records
+        self.submissions = submissions
 
-        # Delete path if it exists and then create it
-        shutil.rmtree(self.path, ignore_errors = True)
-        os.mkdir(self.path)
+        if len(self.records) > 0:
+            self.hash_students()
+
+        self.group_submissions()
+        self.write_code()
+
+        # Updated in place, as bound copies of the check share the mapping
+        filenames = self.checks["name"].filenames
+        filenames.clear()
+        filenames.update({s: r.function for s, r in self.records.items()})
+
+        for student in changed:
+            self.results.discard(student)
+
+        return changed
+
+    #--------------------------------------------------------------------------
+    # Generating MATLAB code
+
+    def group_submissions(self):
+
+        # Byte-identical submissions share one function, named after its
+        # content so names do not change as submissions come and go
+        self.groups = {}
+        self.calls = {}
 
         # Add submissions in timestamp order for some traceability
-        order = [(t, s) for (s, t) in self.timestamps.items()]
+        order = [(r.timestamp, s) for (s, r) in self.records.items()]
         order.sort()
 
-        for i, (_, s) in enumerate(order):
-            call = "sub{}".format(i)
+        for _, s in order:
+            submission = self.submissions[s]
+
+            digest = hashlib.sha256(submission.encode("utf-8")).hexdigest()
+            call = "sub_" + digest[:16]
+
+            self.groups.setdefault(call, []).append(s)
+            self.calls[s] = call
+
+        # Number of groups shared by more than one student
+        self.duplicates = len([g for g in self.groups.values() if len(g) > 1])
+
+    def write_code(self):
+
+        files = {}
+
+        for call, students in self.groups.items():
+
+            student_ids = ", ".join(self.hashes[s] for s in students)
+            submission = self.submissions[students[0]]
+
+            if len(students) == 1:
+                header = "% Student: {}\n".format(student_ids)
+            else:
+                header = "% Students: {}\n".format(student_ids)
+
+            files[call + ".m"] = header + submission
+
+        files[self.solution_call + ".m"] = self.solution
+        files[HARNESS + ".m"] = HARNESS_CODE
+
+        touched = sync_code(self.path, files)
+
+        # Running engines may hold stale copies of rewritten functions
+        if self.engine is not None and len(touched) > 0:
+
+            engines = [self.engine]
+            if self.pool is not None:
+                engines += [w.engine for w in self.pool.workers]
+
+            for engine in engines:
+                engine.eval("clear " + " ".join(touched), nargout = 0)
+
+        return touched
+
+    #--------------------------------------------------------------------------
+    # Engine management
+
+    def start_engine(self):
+
+        return setup_engine(self.factory(), self.path, self.variables)
+
+    def restart_engine(self):
+
+        # Restarted in place, so checks keep a valid reference
+        self.engine.restart()
+        setup_engine(self.engine, self.path, self.variables)
+
+    #--------------------------------------------------------------------------
+    # Persistent result cache
+
+    def use_result_cache(self, max_entries = None, max_age = None):
+
+        filename = os.path.join(self.root, ".matgrade.sqlite")
+
+        try:
+            self.result_cache = ResultCache(filename, max_entries, max_age)
+        except CacheError as e:
+            raise AssessmentError(e.args[0])
+
+        self.load_solutions()
+
+    def solutions_file(self):
+
+        return os.path.join(self.root, ".matgrade.solutions.npz")
+
+    def load_solutions(self):
+
+        # Numeric solution outputs saved by a previous run (an unreadable
+        # file is simply rebuilt)
+        self.solutions = {}
+
+        try:
+            f = np.load(self.solutions_file(), allow_pickle = False)
 
-            f = open(os.path.join(self.path, call + ".m"), "w")
             with f:
-                student_id = self.hashes[s]
-                submission = self.submissions[s]
-                f.write("% Student: {}\n{}".format(student_id, submission))
+                self.solutions = {key: f[key] for key in f.files}
+
+        except (OSError, ValueError, zipfile.BadZipFile):
+            self.solutions = {}
+
+    def solution_key(self, arguments, n):
 
-            self.calls[s] = call 
+        content = json.dumps(
+            [self.solution, fingerprint(self.variables), arguments, n]
+        )
+
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def save_solutions(self):
+
+        # Only outputs of the current checks are kept, and the file is only
+        # rewritten when they changed (shards may save concurrently)
+        if self.solutions is None or \
+                set(self.outputs) == set(self.solutions):
+            return
+
+        filename = self.solutions_file()
+        temporary = "{}.{}.tmp".format(filename, os.getpid())
+
+        f = open(temporary, "wb")
 
-        f = open(os.path.join(self.path, self.solution_call + ".m"), "w")
         with f:
-            f.write(self.solution)
+            np.savez(f, **self.outputs)
 
-        self.checks = {}
-        self.graded_components = []
+        os.replace(temporary, filename)
+        self.solutions = dict(self.outputs)
 
-        self.engine = matlab.engine.start_matlab()
-        call = "addpath('{}')".format(self.path)
-        self.engine.eval(call)
+    def result_key(self, code, check):
 
-        # Initializing special name check (to perform filename comparisons)
-        self.checks["name"] = NameCheck(self.functions, solution)
+        if self.result_cache is None:
+            return None
+
+        spec = check.spec()
+        if spec is None:
+            return None
+
+        return self.result_cache.key(
+            code, spec, self.solution, fingerprint(self.variables)
+        )
+
+    #--------------------------------------------------------------------------
+    # Journal of completed evaluations
+
+    def use_journal(self, resume = False, suffix = ""):
+
+        filename = os.path.join(self.root, ".matgrade.journal" + suffix)
+
+        try:
+            self.journal = Journal(filename, resume)
+        except JournalError as e:
+            raise AssessmentError(e.args[0])
+
+    def journal_key(self, student, call, name, check):
+
+        if self.journal is None or name is None:
+            return None
+
+        # Call names are derived from code, and the file name matters for
+        # the name check
+        lab = self.solution + fingerprint(self.variables)
+        lab = hashlib.sha256(lab.encode("utf-8")).hexdigest()[:16]
+
+        return [
+            student, self.records[student].function, call, name,
+            check.spec(), lab
+        ]
+
+    def close(self):
+
+        # Releases engines (restoring borrowed ones, e.g. shared sessions)
+        # and the journal and result cache files
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+        if self.engine is not None:
+            self.engine.quit()
+            self.engine = None
+
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+        if self.result_cache is not None:
+            self.result_cache.close()
+            self.result_cache = None
 
     #--------------------------------------------------------------------------
     # Add MATLAB variables
 
     def add_variable(self, name, call):
-    
+
+        # Either a MATLAB expression or a {file: ..., name: ...} mapping
+        try:
+            source = variable(call)
+        except VariableError as e:
+            raise AssessmentError(e.args[0])
+
         try:
-            value = self.engine.eval(call)
-            self.engine.workspace[name] = value
+            define_variable(self.engine, name, source)
+            self.variables.append((name, source))
+            self.cache.fingerprint = fingerprint(self.variables)
 
-        except (matlab.engine.MatlabExecutionError, SyntaxError):
+        except ExecutionError:
 
             msg = "Defining variable \"{}\" with \"{}\" generated an error."
             raise AssessmentError({"message": msg.format(name, call)})
@@ -186,18 +432,105 @@ class Assessment:
             msg = "Defining variable \"{}\" with \"{}\" timed out."
             raise AssessmentError({"message": msg.format(name, call)})
 
+        except VariableError as e:
+            raise AssessmentError(e.args[0])
+
 
     #--------------------------------------------------------------------------
-    # Initializing assessment by adding checks
+    # Calibrating timeouts from the solution
+
+    def calibrate(self, factor = 10, minimum = 0.05, maximum = 5.0,
+                  repeats = 3):
+
+        if factor <= 0 or minimum <= 0 or maximum < minimum or repeats < 1:
+            msg = "Timeout calibration requires 0 < minimum <= maximum, " + \
+                  "a positive factor and at least one repeat."
+            raise AssessmentError({"message": msg})
+
+        self.calibration = (factor, minimum, maximum, repeats)
+
+    def measure_solution(self, arguments, n, timeout, samples = None):
+
+        # Median wall time of the solution (errors count as completed runs)
+        times = []
+
+        for _ in range(self.calibration[3]):
+
+            start = time.perf_counter()
+
+            try:
+                if samples is None:
+                    run_matlab_function(
+                        self.solution_call, arguments, n, self.engine,
+                        timeout, self.watchdog
+                    )
+                else:
+                    run_samples(
+                        self.solution_call, samples, n, self.engine, timeout,
+                        self.watchdog
+                    )
+            except ExecutionError:
+                pass
+            except TimeoutError:
+                msg = "Running solution with ({}) and nargout={} timed out."
+                arguments = ", ".join(arguments)
+                raise AssessmentError({"message": msg.format(arguments, n)})
+
+            times.append(time.perf_counter() - start)
+
+        times.sort()
+
+        return times[len(times) // 2]
+
+    def check_timeout(self, name, arguments, n, timeout, samples = None):
+
+        # Explicit timeouts take precedence over calibrated ones
+        if timeout is not None:
+            return timeout
+
+        if self.calibration is None:
+            return self.timeout
+
+        factor, minimum, maximum, _ = self.calibration
+
+        solution_time = self.measure_solution(arguments, n, maximum, samples)
+        timeout = min(max(factor*solution_time, minimum), maximum)
+
+        # Rounded up to a 1-2-5 series so that small run-to-run variations do
+        # not change check definitions (and invalidate cached results)
+        scale = 10**math.floor(math.log10(timeout))
+        for step in [1, 2, 5, 10]:
+            if step*scale >= timeout*(1 - 1e-9):
+                timeout = min(step*scale, maximum)
+                break
+
+        self.calibrated[name] = {
+            "solution_time": solution_time, "timeout": timeout
+        }
+
+        return timeout
 
-    def add_shape_check(self, name, arguments, n):
+    def run_solution(self, name, arguments, n, timeout):
+
+        timeout = self.check_timeout(name, arguments, n, timeout)
+
+        key = None
+
+        if self.solutions is not None:
+
+            key = self.solution_key(arguments, n)
+
+            if key in self.solutions:
+                self.outputs[key] = self.solutions[key]
+                return self.outputs[key], timeout
 
         try:
             solution = run_matlab_function(
-                self.solution_call, arguments, n, self.engine
+                self.solution_call, arguments, n, self.engine,
+                timeout, self.watchdog, self.cache
             )
 
-        except matlab.engine.MatlabExecutionError:
+        except ExecutionError:
             msg = "Running solution with ({}) and nargout={} generated an error."
             arguments = ", ".join(arguments)
             raise AssessmentError({"message": msg.format(arguments, n)})
@@ -208,53 +541,110 @@ class Assessment:
             arguments = ", ".join(arguments)
             raise AssessmentError({"message": msg.format(arguments, n)})
 
+        # Only numeric outputs are saved, and only where checks compare the
+        # saved array the same way as the engine's value
+        if key is not None:
+
+            output = to_array(solution)
+
+            if output is not None and shape_of(output) == shape_of(solution):
+                self.outputs[key] = output
+
+        return solution, timeout
+
+
+    #--------------------------------------------------------------------------
+    # Initializing assessment by adding checks
+
+    def add_shape_check(self, name, arguments, n, timeout = None):
+
+        solution, timeout = self.run_solution(name, arguments, n, timeout)
+
         # Add check and then update dictionary
         try:
-            check = ShapeCheck(arguments, solution, n, self.engine)
+            check = ShapeCheck(
+                arguments, solution, n, self.engine, timeout, self.watchdog,
+                self.cache
+            )
         except CheckError as e:
-            raise AssessmentError({"message": msg.format(e.args[0])})
+            raise AssessmentError(e.args[0])
 
         self.checks[name] = check
 
 
-    def add_value_check(self, name, arguments, tolerance, relative, n):
+    def add_value_check(self, name, arguments, tolerance, relative, n,
+                        timeout = None):
 
+        solution, timeout = self.run_solution(name, arguments, n, timeout)
+
+        # Add check and then update dictionary
         try:
-            solution = run_matlab_function(
-                self.solution_call, arguments, n, self.engine
+            check = ValueCheck(
+                arguments, solution, tolerance, relative, n, self.engine,
+                timeout, self.watchdog, self.cache
             )
+        except CheckError as e:
+            raise AssessmentError(e.args[0])
 
-        except matlab.engine.MatlabExecutionError:
-            msg = "Running solution with ({}) and nargout={} generated an error."
-            arguments = ", ".join(arguments)
-            raise AssessmentError({"message": msg.format(arguments, n)})
+        self.checks[name] = check
 
-        except TimeoutError:
 
-            msg = "Running solution with ({}) and nargout={} timed out."
-            arguments = ", ".join(arguments)
-            raise AssessmentError({"message": msg.format(arguments, n)})
+    def add_property_check(self, name, generators, samples, seed, tolerance,
+                           relative, n, timeout = None):
 
-        # Add check and then update dictionary
         try:
-            check = ValueCheck(
-                arguments, solution, tolerance, relative, n, self.engine
+            arguments = generate_samples(generators, samples, seed)
+        except CheckError as e:
+            raise AssessmentError(e.args[0])
+
+        if len(arguments) == 0:
+            msg = "\"{}\" check needs at least one sample."
+            raise AssessmentError({"message": msg.format(name)})
+
+        timeout = self.check_timeout(
+            name, arguments[0], n, timeout, arguments
+        )
+
+        # Solution is run once over all samples
+        try:
+            solution = run_samples(
+                self.solution_call, arguments, n, self.engine, timeout,
+                self.watchdog, self.cache
+            )
+
+        except ExecutionError:
+            msg = "Running solution on {} samples with nargout={} " + \
+                  "generated an error."
+            raise AssessmentError({"message": msg.format(samples, n)})
+
+        except TimeoutError:
+            msg = "Running solution on {} samples with nargout={} timed out."
+            raise AssessmentError({"message": msg.format(samples, n)})
+
+        try:
+            check = PropertyCheck(
+                arguments, solution, tolerance, relative, n, self.engine,
+                timeout, self.watchdog, self.cache
             )
         except CheckError as e:
-            raise AssessmentError({"message": msg.format(e.args[0])})
+            raise AssessmentError(e.args[0])
 
         self.checks[name] = check
 
 
-    def add_error_check(self, name, arguments):
+    def add_error_check(self, name, arguments, timeout = None):
+
+        timeout = self.check_timeout(name, arguments, 1, timeout)
 
-        self.checks[name] = ErrorCheck(arguments, self.engine)
+        self.checks[name] = ErrorCheck(
+            arguments, self.engine, timeout, self.watchdog, self.cache
+        )
 
 
     #--------------------------------------------------------------------------
     # Add a graded element
 
-    def add_graded_component(self, name, checks, f, value):
+    def add_graded_component(self, name, checks, combination, value):
 
         for check in checks:
             if check not in self.checks:
@@ -262,88 +652,395 @@ class Assessment:
                 msg = "\"{}\" check is undefined (referenced by \"{}\")"
                 raise AssessmentError({"message": msg.format(check, name)})
 
+        if combination not in ("and", "or"):
+            msg = "\"{}\" combination may only be \"and\"/\"or\" (got \"{}\")"
+            raise AssessmentError({"message": msg.format(name, combination)})
+
         self.graded_components.append({
             "name": name,
             "checks": checks,
-            "f": f,
+            "combination": combination,
             "value": value
         })
             
     #--------------------------------------------------------------------------
-    # Generate results of all grades
+    # Lazy evaluation of graded components
+
+    def order(self, checks):
+
+        if not self.cheap_first:
+            return checks
+
+        # Stable sort keeps the configured order among checks of equal cost
+        return sorted(checks, key = lambda check: self.checks[check].cost)
+
+    def combine(self, component, lookup):
+
+        checks = self.order(component["checks"])
+
+        return combine(dict(component, checks = checks), lookup)
+
+    def revive(self, watchdog):
+
+        # Restart the engine of a watchdog (a check's or a batch's) after it
+        # died
+        if watchdog is None:
+            watchdog = self.watchdog
+
+        try:
+            watchdog.restart()
+        except Exception as e:
+            msg = "Could not restart MATLAB engine: {}"
+            raise AssessmentError({"message": msg.format(e)})
+
+        watchdog.restarts += 1
+
+    def run_check(self, student, call, code, check_object, name):
+
+        # Engine death (e.g. student code calling exit) restarts the engine
+        # and the check is tried again, failing if the engine dies again
+        for _ in range(2):
+
+            try:
+                if profiling.profiler is None:
+                    return check_object.evaluate(student, call, code)
+                else:
+                    return profiling.profiler.measure(
+                        student, name, check_object.evaluate, student, call,
+                        code
+                    )
+            except EngineError:
+                self.revive(getattr(check_object, "watchdog", None))
+
+        return False
+
+    def evaluate_check(self, student, call, code, check_object, name = None):
+
+        entry = self.journal_key(student, call, name, check_object)
+
+        if entry is not None:
+            result = self.journal.get(entry)
+            if result is not None:
+                return result
+
+        key = self.result_key(code, check_object)
+
+        if key is not None:
+            result = self.result_cache.get(key)
+        else:
+            result = None
+
+        if result is None:
+
+            clear_failure()
+            start = time.perf_counter()
+
+            result = self.run_check(student, call, code, check_object, name)
+
+            # Timings and errors are only kept for streamed rows
+            if len(self.sinks) > 0:
+                self.details.setdefault(call, {})[name] = (
+                    time.perf_counter() - start, last_failure()
+                )
+
+            if key is not None:
+                self.result_cache.put(key, result)
 
-    def grade(self, filename):
+        if entry is not None:
+            self.journal.put(entry, result)
 
-        # First, evaluate all checks
-        checks = []
-        
-        for d in self.graded_components:
-            checks.extend(d["checks"])
+        return result
 
-        checks = set(checks)
+    def evaluate_student(self, student, call, code, checks, shared = None):
+
+        # In batch mode, every call that may be needed is made up front in a
+        # single round-trip and the outcomes are fed into the call cache
+        if self.batch:
+
+            pending = []
+
+            for component in self.graded_components:
+                for check in component["checks"]:
+
+                    check_object = checks[check]
+
+                    entry = self.journal_key(student, call, check, check_object)
+                    if entry is not None and \
+                            self.journal.get(entry) is not None:
+                        continue
+
+                    key = self.result_key(code, check_object)
+
+                    if key is None or self.result_cache.get(key) is None:
+                        pending.append(check_object)
+
+            try:
+                if profiling.profiler is None:
+                    run_batch(call, pending, self.cache)
+                else:
+                    profiling.profiler.measure(
+                        student, None, run_batch, call, pending, self.cache
+                    )
+            except EngineError as e:
+                self.revive(getattr(e, "watchdog", None))
+
+        # Check results are memoized so checks shared between components
+        # are only evaluated once (and, for checks that only depend on the
+        # code, once per group of identical submissions)
         results = {}
 
-        for student, call in self.calls.items():
+        if shared is None:
+            shared = {}
 
-            results[student] = {}
-            code = self.submissions[student]
+        def lookup(check):
+            if check in results:
+                return results[check]
 
-            for check in checks:
+            check_object = checks[check]
 
-                check_object = self.checks[check]
-                result = check_object.evaluate(student, call, code)
-                results[student][check] = result
+            if check_object.shared and check in shared:
+                result = shared[check]
+            else:
+                result = self.evaluate_check(
+                    student, call, code, check_object, check
+                )
 
-        # Then iterate over all grades and combine
-        grades = {}
-        grade_names = []
+            if check_object.shared:
+                shared[check] = result
+
+            results[check] = result
+            return result
 
         for component in self.graded_components:
+            self.combine(component, lookup)
 
-            grade_results = {}
+        return results
 
-            for student in results:
+    def evaluate_group(self, task, checks):
 
-                checks = component["checks"]
-                temp = [results[student][check] for check in checks]
-                result = functools.reduce(component["f"], temp)
-                if result:
-                    grade_results[student] = component["value"]
-                else:
-                    grade_results[student] = 0
+        call, students = task
+        code = self.submissions[students[0]]
+
+        shared = {}
+
+        # Each student's results go straight into the result matrix
+        for student in students:
+
+            start = time.perf_counter()
+            results = self.evaluate_student(
+                student, call, code, checks, shared
+            )
+            self.durations[student] = time.perf_counter() - start
+
+            self.results.put(student, results)
+            self.emit(student, results)
 
-            grades[component["name"]] = grade_results
-            grade_names.append(component["name"])
+    #--------------------------------------------------------------------------
+    # Streaming results of students as they complete
+
+    def add_sink(self, sink):
 
-        # Summing up total grade
-        totals = {}
+        self.sinks.append(sink)
 
-        for student in results:
+    def row(self, student, results):
 
-            totals[student] = 0
+        grades = {}
 
-            for value in grades.values():
-                totals[student] += value[student]
+        for component in self.components():
+            if combine(component, results.__getitem__):
+                grades[component["name"]] = component["value"]
+            else:
+                grades[component["name"]] = 0
 
-        grades["total"] = totals
-        grade_names.append("total")
+        details = self.details.get(self.calls[student], {})
+        checks = {}
 
-        # Converting grade content into lists
-        students = self.submissions.keys()
+        for check, passed in results.items():
+            duration, error = details.get(check, (None, None))
+            checks[check] = {"passed": passed, "time": duration, "error": error}
+
+        return {
+            "student": student,
+            "grades": grades,
+            "total": sum(grades.values()),
+            "checks": checks,
+            "duration": self.durations.get(student),
+        }
 
-        content = {"student": students}
+    def emit(self, student, results):
 
-        for name in grade_names:
-            content[name] = [grades[name][student] for student in students]
+        if len(self.sinks) == 0:
+            return
 
-        d = pd.DataFrame(data = content)
-        d.to_csv(filename, index = False)
+        row = self.row(student, results)
+
+        for sink in self.sinks:
+            sink.write(row)
+
+    def publish(self):
+
+        for sink in self.sinks:
+            sink.publish()
+
+    #--------------------------------------------------------------------------
+    # Generate results of all grades
+
+    def evaluate(self, students = None):
+
+        start = time.perf_counter()
+
+        # Groups of identical submissions are graded together (optionally
+        # only for some students, e.g. ones with new submissions)
+        if students is None:
+            tasks = list(self.groups.items())
+        else:
+            tasks = [
+                (call, [s for s in group if s in students])
+                for call, group in self.groups.items()
+            ]
+            tasks = [task for task in tasks if len(task[1]) > 0]
+
+        # First, evaluate checks as needed by each graded component
+        if self.workers > 1:
+
+            if self.pool is None:
+                self.pool = EnginePool(
+                    self.factory, self.workers, self.path, self.variables,
+                    self.timeout
+                )
+
+            # Groups of identical submissions are graded by a single worker
+            try:
+                self.pool.evaluate(tasks, self.checks, self.evaluate_group)
+            except PoolError as e:
+                raise AssessmentError(e.args[0])
+
+        else:
+
+            for task in tasks:
+                self.evaluate_group(task, self.checks)
+
+        self.publish()
+
+        if self.result_cache is not None:
+            self.result_cache.evict()
+
+        self.timings["evaluation"] = time.perf_counter() - start
+
+    def components(self):
+
+        # Graded components with checks in evaluation order, so aggregation
+        # only touches checks that were evaluated
+        return [
+            dict(component, checks = self.order(component["checks"]))
+            for component in self.graded_components
+        ]
+
+    def grade(self, filename, students = None):
+
+        self.evaluate(students)
+
+        start = time.perf_counter()
+
+        # Only students with current submissions are reported
+        students = [s for s in self.submissions if s in self.results]
+
+        content = tabulate(self.components(), self.results, students)
+
+        self.timings["aggregation"] = time.perf_counter() - start
+        start = time.perf_counter()
+
+        write_grades(filename, content)
+
+        self.timings["output"] = time.perf_counter() - start
+
+    #--------------------------------------------------------------------------
+    # Grading a share of students (to be merged with other shards)
+
+    def fingerprint(self):
+
+        # Identifies the configuration and submissions a shard was graded with.
+        # The plan digest leaves out calibrated timeouts (which depend on the
+        # machine a shard runs on)
+        if self.plan is not None:
+            configuration = self.plan
+        else:
+            checks = {
+                name: check.spec() or type(check).__name__
+                for name, check in self.checks.items()
+            }
+            configuration = [
+                self.solution, fingerprint(self.variables), checks,
+                self.components()
+            ]
+
+        students = sorted(
+            [s, self.records[s].function, self.calls[s]] for s in self.calls
+        )
+
+        content = json.dumps([configuration, students], sort_keys = True)
+
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def grade_shard(self, filename, index, count):
+
+        students = [s for s in self.submissions if shard(s, count) == index]
+        self.evaluate(students)
+
+        content = {
+            "fingerprint": self.fingerprint(),
+            "shard": [index, count],
+            "components": self.components(),
+            "results": {s: self.results.get(s) for s in students},
+            "timings": {
+                "phases": self.timings,
+                "students": {s: self.durations.get(s) for s in students},
+            },
+        }
+
+        write_shard(filename, content)
+
+    #--------------------------------------------------------------------------
+    # Check plagiarism locally via winnowed fingerprints
+
+    def check_similarity(self, filename, archives = (), threshold = 0.5):
+
+        index = SimilarityIndex()
+
+        # Submissions are indexed by id, as they would be for MOSS
+        for student, submission in self.submissions.items():
+            index.add(self.hashes[student], submission)
+
+        for archive in archives:
+
+            if not os.path.isdir(archive):
+                msg = "Could not open submission archive: {}"
+                raise AssessmentError({"message": msg.format(archive)})
+
+            index.add_folder(archive)
+
+        # Convert hashes back to student names
+        labels = {
+            student_id: "{} ({})".format(student, student_id)
+            for student, student_id in self.hashes.items()
+        }
+
+        html = index.report(index.pairs(threshold), labels)
+
+        # And write to file
+        f = open(filename, "w")
+
+        with f:
+            f.write(html)
 
     #--------------------------------------------------------------------------
     # Check plagiarism via moss
 
     def check_plagiarism(self, user_id, filename):
 
+        # Only needed for MOSS, so not imported with the package
+        import requests
+
         s = socket.socket()
         s.connect(('moss.stanford.edu', 7690))
 
@@ -0,0 +1,644 @@
+import math
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from .watchdog import EngineError
+
+
+class BackendError(Exception):
+    pass
+
+
+class ExecutionError(Exception):
+    pass
+
+
+class EngineTerminated(EngineError):
+    """ Raised when the engine is gone (e.g. after executed code called exit)."""
+    pass
+
+
+class ExecutionBackend:
+    """ Interface to a MATLAB-like engine.
+
+    eval() mirrors matlab.engine: it returns a value, or a future (with done,
+    cancel, cancelled and result(timeout)) when background is True. Errors
+    raised by executed code surface as ExecutionError.
+    """
+
+    def eval(self, command, nargout = 1, background = False, stdout = None,
+             stderr = None):
+        raise NotImplementedError
+
+    @property
+    def workspace(self):
+        raise NotImplementedError
+
+    def cancel(self, future):
+
+        # Every cancellation (e.g. by the watchdog) goes through the backend
+        return future.cancel()
+
+    def convert(self, array):
+
+        # Value the workspace accepts for a NumPy array
+        return array
+
+    def restart(self):
+        raise NotImplementedError
+
+    def quit(self):
+        pass
+
+
+#------------------------------------------------------------------------------
+# MATLAB engine
+
+def start_matlab():
+
+    # Imported here so that MATLAB is only required when actually used
+    try:
+        import matlab.engine
+    except ImportError:
+        msg = "MATLAB engine for Python (matlab.engine) is not installed."
+        raise BackendError({"message": msg})
+
+    return matlab.engine.start_matlab()
+
+
+def connect_matlab(name = None):
+
+    # Connects to a session shared from MATLAB via matlab.engine.shareEngine
+    try:
+        import matlab.engine
+    except ImportError:
+        msg = "MATLAB engine for Python (matlab.engine) is not installed."
+        raise BackendError({"message": msg})
+
+    names = matlab.engine.find_matlab()
+
+    if name is None and len(names) == 0:
+        msg = "No shared MATLAB sessions found (see matlab.engine.shareEngine)."
+        raise BackendError({"message": msg})
+    elif name is None:
+        name = names[0]
+    elif name not in names:
+        msg = "Could not find shared MATLAB session: {}"
+        raise BackendError({"message": msg.format(name)})
+
+    return matlab.engine.connect_matlab(name)
+
+
+def find_sessions():
+
+    try:
+        import matlab.engine
+    except ImportError:
+        return ()
+
+    return tuple(matlab.engine.find_matlab())
+
+
+def execution_errors():
+
+    import matlab.engine
+
+    return (matlab.engine.MatlabExecutionError, SyntaxError)
+
+
+def termination_errors():
+
+    import matlab.engine
+
+    # Raised for calls made to (or pending on) an engine that has exited
+    names = ["EngineError", "RejectedExecutionError"]
+
+    return tuple(
+        getattr(matlab.engine, n) for n in names if hasattr(matlab.engine, n)
+    )
+
+
+def terminated(error):
+
+    msg = "MATLAB engine terminated: {}"
+    return EngineTerminated({"message": msg.format(error)})
+
+
+class MatlabFuture:
+
+    def __init__(self, future):
+        self.future = future
+
+    def done(self):
+        return self.future.done()
+
+    def cancel(self):
+        return self.future.cancel()
+
+    def cancelled(self):
+        return self.future.cancelled()
+
+    def result(self, timeout = None):
+        try:
+            return self.future.result(timeout = timeout)
+        except execution_errors() as e:
+            raise ExecutionError(str(e))
+        except termination_errors() as e:
+            raise terminated(e)
+
+
+class MatlabBackend(ExecutionBackend):
+
+    def __init__(self, engine = None, start = start_matlab):
+
+        self.start = start
+
+        if engine is None:
+            engine = start()
+
+        self.engine = engine
+
+    def eval(self, command, nargout = 1, background = False, stdout = None,
+             stderr = None):
+
+        kwargs = {"nargout": nargout, "background": background}
+
+        if stdout is not None:
+            kwargs["stdout"] = stdout
+        if stderr is not None:
+            kwargs["stderr"] = stderr
+
+        try:
+            result = self.engine.eval(command, **kwargs)
+        except execution_errors() as e:
+            raise ExecutionError(str(e))
+        except termination_errors() as e:
+            raise terminated(e)
+
+        if background:
+            return MatlabFuture(result)
+
+        return result
+
+    @property
+    def workspace(self):
+        return self.engine.workspace
+
+    def convert(self, array):
+
+        import matlab
+
+        if array.dtype == bool:
+            kind, kwargs = matlab.logical, {}
+        elif np.iscomplexobj(array):
+            array = np.asarray(array, dtype = complex)
+            kind, kwargs = matlab.double, {"is_complex": True}
+        else:
+            array = np.asarray(array, dtype = float)
+            kind, kwargs = matlab.double, {}
+
+        # Recent releases construct arrays from the buffer, older ones only
+        # from (nested) sequences
+        try:
+            return kind(array, **kwargs)
+        except (TypeError, ValueError):
+            return kind(array.tolist(), **kwargs)
+
+    def restart(self):
+
+        self.quit()
+        self.engine = self.start()
+
+    def quit(self):
+
+        try:
+            self.engine.quit()
+        except Exception:
+            pass
+
+
+#------------------------------------------------------------------------------
+# Engines owned by someone else (shared sessions or a daemon)
+
+class IsolatedBackend(ExecutionBackend):
+    """ Borrows a running backend without disturbing it.
+
+    Instead of stopping the engine, quit() restores the MATLAB path recorded
+    when the backend was borrowed and clears variables created since.
+    """
+
+    def __init__(self, backend):
+
+        self.backend = backend
+        self.save()
+
+    def save(self):
+
+        self.path = self.backend.eval("path")
+        self.names = set(self.backend.eval("who"))
+
+    def eval(self, command, nargout = 1, background = False, stdout = None,
+             stderr = None):
+
+        return self.backend.eval(
+            command, nargout = nargout, background = background,
+            stdout = stdout, stderr = stderr
+        )
+
+    @property
+    def workspace(self):
+        return self.backend.workspace
+
+    def cancel(self, future):
+        return self.backend.cancel(future)
+
+    def convert(self, array):
+        return self.backend.convert(array)
+
+    def restart(self):
+
+        self.backend.restart()
+        self.save()
+
+    def quit(self):
+
+        path = "'{}'".format(self.path.replace("'", "''"))
+
+        try:
+            self.backend.eval("path({})".format(path), nargout = 0)
+
+            names = [n for n in self.backend.eval("who") if n not in self.names]
+            if len(names) > 0:
+                self.backend.eval("clear " + " ".join(names), nargout = 0)
+
+            self.backend.eval("clear functions", nargout = 0)
+        except Exception:
+            pass
+
+
+class SharedSessions:
+    """ Engine factory handing out distinct shared MATLAB sessions.
+
+    Sessions are isolated (see IsolatedBackend) and reconnected to on
+    restart. Once no unused session is left, private engines are started.
+    """
+
+    def __init__(self, name = None):
+
+        self.name = name
+        self.used = set()
+        self.lock = threading.Lock()
+
+    def __call__(self):
+
+        with self.lock:
+
+            if self.name is not None:
+                names = [self.name]
+            else:
+                names = find_sessions()
+
+            names = [n for n in names if n not in self.used]
+
+            if len(names) == 0 and self.name is not None:
+                msg = "Shared MATLAB session is already in use: {}"
+                raise BackendError({"message": msg.format(self.name)})
+            elif len(names) == 0:
+                return MatlabBackend()
+
+            self.used.add(names[0])
+
+        backend = MatlabBackend(start = lambda: connect_matlab(names[0]))
+
+        return IsolatedBackend(backend)
+
+
+#------------------------------------------------------------------------------
+# Scripted fake (for tests and benchmarks)
+
+class Hang(Exception):
+    """ Raised by fake functions to simulate a call that never returns."""
+    pass
+
+
+class Exit(Exception):
+    """ Raised by fake functions to simulate code that terminates MATLAB."""
+    pass
+
+
+class Stuck(Exception):
+    """ Raised by fake functions to simulate a call ignoring cancellation."""
+    pass
+
+
+class FakeFuture:
+
+    def __init__(self, value = None, error = None, delay = 0.0,
+                 cancellable = True):
+
+        self.value = value
+        self.error = error
+        self.ready = time.monotonic() + delay
+        self.cancellable = cancellable
+        self.is_cancelled = False
+
+        # Set on cancellation, so waiting threads wake up right away
+        self.event = threading.Event()
+
+    def done(self):
+        return time.monotonic() >= self.ready
+
+    def cancel(self):
+
+        if self.cancellable and not self.done():
+            self.is_cancelled = True
+            self.ready = time.monotonic()
+            self.event.set()
+
+        return True
+
+    def cancelled(self):
+        return self.is_cancelled
+
+    def result(self, timeout = None):
+
+        remaining = self.ready - time.monotonic()
+
+        if timeout is not None and remaining > timeout:
+            if not self.event.wait(timeout):
+                raise TimeoutError
+        elif remaining > 0:
+            self.event.wait(remaining)
+
+        if self.is_cancelled:
+            raise ExecutionError("Operation was cancelled.")
+        if self.error is not None:
+            raise self.error
+
+        return self.value
+
+
+class FakeBackend(ExecutionBackend):
+    """ Deterministic in-process backend mapping calls to Python callables.
+
+    Functions receive parsed arguments (floats, strings, NumPy arrays or
+    workspace values) and return one value or a tuple of outputs. They may
+    raise ExecutionError to simulate MATLAB errors, Hang to simulate calls
+    that only end when cancelled, Stuck for calls that never end or Exit to
+    terminate the engine (until it is restarted). Names that are not in
+    functions are passed to resolver(name, paths), which may return a
+    callable. Every eval takes at least latency seconds.
+    """
+
+    def __init__(self, functions = None, resolver = None, latency = 0.0):
+
+        if functions is None:
+            functions = {}
+
+        self.functions = dict(functions)
+        self.resolver = resolver
+        self.latency = latency
+
+        self.paths = []
+        self.variables = {}
+
+        self.calls = 0
+        self.cancels = 0
+        self.restarts = 0
+        self.terminated = False
+
+    @property
+    def workspace(self):
+        return self.variables
+
+    def cancel(self, future):
+
+        self.cancels += 1
+        return future.cancel()
+
+    def define(self, name, function):
+        self.functions[name] = function
+
+    def restart(self):
+
+        self.paths = []
+        self.variables = {}
+        self.restarts += 1
+        self.terminated = False
+
+    #--------------------------------------------------------------------------
+    # Evaluation
+
+    def eval(self, command, nargout = 1, background = False, stdout = None,
+             stderr = None):
+
+        self.calls += 1
+
+        if self.terminated:
+            raise terminated("engine has exited")
+
+        try:
+            value = self.execute(command.strip().rstrip(";"), nargout)
+            future = FakeFuture(value, delay = self.latency)
+        except Hang:
+            future = FakeFuture(delay = math.inf)
+        except Stuck:
+            future = FakeFuture(delay = math.inf, cancellable = False)
+        except Exit:
+            self.terminated = True
+            future = FakeFuture(error = terminated("exit"), delay = self.latency)
+        except ExecutionError as e:
+            future = FakeFuture(error = e, delay = self.latency)
+
+        if background:
+            return future
+
+        return future.result()
+
+    def execute(self, command, nargout):
+
+        match = re.match(r"addpath\('(.*)'\)$", command)
+        if match:
+            self.paths.append(match.group(1))
+            return None
+
+        if command == "path":
+            return os.pathsep.join(self.paths)
+
+        match = re.match(r"path\('(.*)'\)$", command)
+        if match:
+            path = match.group(1).replace("''", "'")
+            self.paths = [p for p in path.split(os.pathsep) if p != ""]
+            return None
+
+        if command == "who":
+            return list(self.variables)
+
+        if command in ("rehash", "clear functions"):
+            return None
+
+        if command == "clear all":
+            self.variables = {}
+            return None
+
+        match = re.match(r"(\w+)\s*=(?!=)(.*)$", command, re.DOTALL)
+        if match:
+            name, expression = match.groups()
+            self.variables[name] = self.execute(expression.strip(), 1)
+            return None
+
+        if command.startswith("clear "):
+            for name in command.split()[1:]:
+                self.variables.pop(name, None)
+            return None
+
+        match = re.match(r"(\w+)\((.*)\)$", command, re.DOTALL)
+        if match:
+            name, arguments = match.groups()
+
+            if name == "matgrade_batch":
+                return self.batch(arguments)
+
+            function = self.lookup(name)
+            if function is not None:
+                arguments = [self.parse(a) for a in split(arguments, ",")]
+                return self.call(function, arguments, nargout)
+
+        return self.parse(command)
+
+    def lookup(self, name):
+
+        if name in self.functions:
+            return self.functions[name]
+
+        if self.resolver is not None:
+            return self.resolver(name, self.paths)
+
+        return None
+
+    def call(self, function, arguments, nargout):
+
+        try:
+            value = function(*arguments)
+        except (ExecutionError, Hang, Stuck, Exit):
+            raise
+        except Exception as e:
+            raise ExecutionError(str(e))
+
+        if nargout <= 1:
+            return value[0] if isinstance(value, tuple) else value
+
+        if not isinstance(value, tuple) or len(value) < nargout:
+            raise ExecutionError("Too many output arguments.")
+
+        return value[:nargout]
+
+    def parse(self, text):
+
+        # Minimal MATLAB literals: variables, strings, numbers and matrices
+        text = text.strip()
+
+        if text == "":
+            raise ExecutionError("Empty expression.")
+
+        if text in self.variables:
+            return self.variables[text]
+
+        if len(text) > 1 and text[0] == "'" and text[-1] == "'":
+            return text[1:-1].replace("''", "'")
+
+        if text[0] == "[" and text[-1] == "]":
+            rows = [r for r in split(text[1:-1], ";") if r.strip() != ""]
+            values = [
+                [float(self.parse(v)) for v in split(r, ",")] for r in rows
+            ]
+            return np.array(values, ndmin = 2)
+
+        try:
+            return float(text)
+        except ValueError:
+            pass
+
+        msg = "Unrecognized function or variable '{}'."
+        raise ExecutionError(msg.format(text))
+
+    def batch(self, arguments):
+
+        # Equivalent of the generated matgrade_batch harness
+        name, table = split(arguments, ",", 1)
+        function = self.lookup(self.parse(name))
+
+        rows = split(table.strip()[1:-1], ";")
+        results = []
+        self.variables["matgrade_batch_results"] = []
+
+        for row in rows:
+
+            n, expressions = split(row, ",", 1)
+            n = int(float(n))
+            expressions = split(expressions.strip()[1:-1], ",")
+
+            result = {"value": None, "message": "", "line": 0.0, "time": 0.0}
+            start = time.perf_counter()
+
+            try:
+                if function is None:
+                    raise ExecutionError("Undefined function.")
+
+                inputs = [
+                    self.parse(self.parse(e)) for e in expressions
+                    if e.strip() != ""
+                ]
+                value = self.call(function, inputs, n)
+                result["value"] = value[n-1] if n > 1 else value
+
+            except ExecutionError as e:
+                line = re.search(r"(?<=line )\d+", str(e))
+                result["message"] = str(e)
+                result["line"] = float(line.group(0)) if line else 0.0
+
+            result["time"] = time.perf_counter() - start
+
+            results.append(result)
+            self.variables["matgrade_batch_results"] = list(results)
+
+        return results
+
+
+def split(text, separator, limit = -1):
+
+    # Split on separators outside of quotes and brackets
+    parts = []
+    depth = 0
+    quoted = False
+    current = ""
+
+    for i, character in enumerate(text):
+
+        if character == "'" and not quoted:
+            quoted = True
+        elif character == "'" and quoted:
+            quoted = False
+        elif not quoted and character in "([{":
+            depth += 1
+        elif not quoted and character in ")]}":
+            depth -= 1
+        elif not quoted and depth == 0 and character == separator and \
+                limit != 0:
+            parts.append(current)
+            current = ""
+            limit -= 1
+            continue
+
+        current += character
+
+    parts.append(current)
+
+    if len(parts) == 1 and parts[0].strip() == "":
+        return []
+
+    return parts
@@ -0,0 +1,217 @@
+import hashlib
+import io
+import json
+
+from . import profiling
+from .backends import ExecutionError
+from .watchdog import EngineError, default_watchdog
+
+HARNESS = "matgrade_batch"
+
+HARNESS_CODE = """function results = matgrade_batch(f, calls)
+% Runs each {nargout, {argument expressions}} row of calls against function f,
+% recording the last output, error message/line and run time. Progress is
+% mirrored to the base workspace so partial results survive a cancellation.
+
+assignin('base', 'matgrade_batch_results', {});
+results = cell(1, size(calls, 1));
+
+for i = 1:size(calls, 1)
+
+    n = calls{i, 1};
+    expressions = calls{i, 2};
+
+    result = struct('value', [], 'message', '', 'line', 0, 'time', 0);
+    outputs = cell(1, n);
+
+    start = tic;
+    try
+        inputs = cell(1, numel(expressions));
+        for j = 1:numel(expressions)
+            inputs{j} = evalin('base', expressions{j});
+        end
+
+        [outputs{:}] = feval(f, inputs{:});
+        result.value = outputs{n};
+    catch e
+        result.message = e.message;
+        for k = 1:numel(e.stack)
+            if strcmp(e.stack(k).name, f)
+                result.line = e.stack(k).line;
+                break
+            end
+        end
+    end
+    result.time = toc(start);
+
+    results{i} = result;
+    assignin('base', 'matgrade_batch_results', results);
+end
+
+end
+"""
+
+
+def quote(text):
+
+    return "'{}'".format(text.replace("'", "''"))
+
+
+def run_batch(function, checks, cache):
+
+    # Unique calls not yet cached, made by checks sharing the same engine
+    # (calls made by several checks get the longest of their deadlines)
+    pending = {}
+    engine = None
+    watchdog = None
+
+    for check in checks:
+        for arguments, n, timeout in check.calls():
+
+            engine = check.engine
+            watchdog = check.watchdog or default_watchdog
+
+            if timeout is None:
+                timeout = watchdog.timeout
+
+            key = cache.key(function, arguments, n)
+            if cache.cached(key, timeout) is not None:
+                continue
+
+            if key in pending:
+                timeout = max(timeout, pending[key][3])
+
+            pending[key] = (key, arguments, n, timeout)
+
+    if len(pending) == 0:
+        return 0
+
+    calls = list(pending.values())
+    timeouts = [t for _, _, _, t in calls]
+
+    rows = [
+        "{}, {{{}}}".format(n, ", ".join(quote(a) for a in arguments))
+        for _, arguments, n, _ in calls
+    ]
+    command = "{}({}, {{{}}})".format(HARNESS, quote(function), "; ".join(rows))
+
+    def run():
+
+        null = io.StringIO("")
+        future = engine.eval(
+            command, stdout = null, stderr = null, nargout = 1,
+            background = True
+        )
+
+        # The whole batch gets the combined deadline of its calls
+        return watchdog.wait(engine, future, sum(timeouts))
+
+    if profiling.profiler is not None:
+        run = profiling.profiler.wrap(run)
+
+    try:
+        results = run()
+    except EngineError as e:
+        # Callers restart the engine of the watchdog the batch ran on
+        e.watchdog = watchdog
+        raise
+    except TimeoutError:
+        results = partial_results(engine)
+        timed_out = True
+    except ExecutionError:
+        return 0
+    else:
+        timed_out = False
+
+    entries = {}
+
+    for (key, _, _, _), timeout, result in zip(calls, timeouts, results):
+
+        if result["time"] > timeout:
+            entries[key] = (None, TimeoutError(), timeout)
+        elif result["message"] != "":
+            entries[key] = (None, execution_error(function, result), timeout)
+        else:
+            entries[key] = (result["value"], None, timeout)
+
+    # The call that was running when the batch was cancelled (only given
+    # what was left of the combined deadline)
+    if timed_out and len(results) < len(calls):
+
+        index = len(results)
+        remaining = sum(timeouts) - sum(r["time"] for r in results)
+
+        entries[calls[index][0]] = (
+            None, TimeoutError(), max(0.0, min(timeouts[index], remaining))
+        )
+
+    with cache.lock:
+        cache.entries.update(entries)
+
+    return len(entries)
+
+
+def run_samples(function, samples, n, engine, timeout = None, watchdog = None,
+                cache = None):
+
+    # Calls function with every row of argument expressions in a single
+    # harness call (with one deadline), returning (value, message) pairs
+    if watchdog is None:
+        watchdog = default_watchdog
+
+    if timeout is None:
+        timeout = watchdog.timeout
+
+    def run():
+
+        rows = [
+            "{}, {{{}}}".format(n, ", ".join(quote(a) for a in arguments))
+            for arguments in samples
+        ]
+        command = "{}({}, {{{}}})".format(
+            HARNESS, quote(function), "; ".join(rows)
+        )
+
+        null = io.StringIO("")
+        future = engine.eval(
+            command, stdout = null, stderr = null, nargout = 1,
+            background = True
+        )
+
+        results = watchdog.wait(engine, future, timeout)
+
+        return [(r["value"], r["message"]) for r in results]
+
+    if profiling.profiler is not None:
+        run = profiling.profiler.wrap(run)
+
+    if cache is None:
+        return run()
+
+    # Samples are summarized, as keys are kept in memory
+    digest = hashlib.sha256(json.dumps(samples).encode("utf-8")).hexdigest()
+    key = cache.key(function, [HARNESS, digest], n)
+
+    return cache.run(key, run, timeout)
+
+
+def partial_results(engine):
+
+    try:
+        return list(engine.workspace["matgrade_batch_results"])
+    except Exception:
+        return []
+
+
+def execution_error(function, result):
+
+    # Mimic the engine message format so ErrorCheck can find the line
+    line = int(result["line"])
+
+    if line > 0:
+        message = "Error using {} (line {})\n{}"
+        message = message.format(function, line, result["message"])
+    else:
+        message = result["message"]
+
+    return ExecutionError(message)
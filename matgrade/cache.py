@@ -0,0 +1,214 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from .watchdog import EngineError, Interrupted
+
+
+class CacheError(Exception):
+    pass
+
+
+def fingerprint(variables):
+
+    # Variables are replayed in order, so the order is part of the fingerprint
+    content = "\n".join("{}={}".format(name, call) for name, call in variables)
+
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class CallCache:
+
+    def __init__(self, variables = ()):
+
+        self.fingerprint = fingerprint(variables)
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+        # Shared between engine pool workers
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key(self, function, arguments, n):
+
+        return (function, tuple(arguments), n, self.fingerprint)
+
+    def cached(self, key, deadline = None):
+
+        # Entries are (value, error, deadline the call was given). A call
+        # that timed out says nothing about a call allowed to run for longer
+        entry = self.entries.get(key)
+
+        if entry is None:
+            return None
+
+        _, error, given = entry
+
+        if isinstance(error, TimeoutError) and deadline is not None and \
+                given is not None and given < deadline:
+            return None
+
+        return entry
+
+    def run(self, key, f, deadline = None):
+
+        with self.lock:
+            entry = self.cached(key, deadline)
+
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if entry is None:
+
+            # Errors and timeouts are deterministic enough to be cached as
+            # well, but a dead engine (or an abandoned call) says nothing
+            # about the call itself
+            try:
+                entry = (f(), None, deadline)
+            except (EngineError, Interrupted):
+                raise
+            except Exception as e:
+                entry = (None, e, deadline)
+
+            with self.lock:
+                self.entries[key] = entry
+
+        value, error, _ = entry
+
+        if error is not None:
+            raise error
+
+        return value
+
+    def clear(self):
+
+        with self.lock:
+            self.entries = {}
+
+
+class ResultCache:
+
+    def __init__(self, filename, max_entries = None, max_age = None,
+                 timeout = 30.0):
+
+        self.filename = filename
+
+        # Limits on the number of entries and their age (in days)
+        self.max_entries = max_entries
+        self.max_age = max_age
+
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        # Last use of entries read since the last eviction, written then so
+        # that reads never hold a write lock on a cache shared by processes
+        self.used = {}
+
+        try:
+            self.connection = sqlite3.connect(
+                filename, timeout = timeout, check_same_thread = False
+            )
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, result INTEGER, used REAL)"
+            )
+            self.connection.commit()
+        except sqlite3.Error as e:
+            msg = "Could not open result cache {}: {}"
+            raise CacheError({"message": msg.format(filename, e)})
+
+    def key(self, code, spec, solution, variables):
+
+        # Code and solution are hashed separately so the key stays small
+        code = hashlib.sha256(code.encode("utf-8")).hexdigest()
+        solution = hashlib.sha256(solution.encode("utf-8")).hexdigest()
+        content = json.dumps([code, spec, solution, variables])
+
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT result FROM results WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.used[key] = time.time()
+
+        return bool(row[0])
+
+    def put(self, key, result):
+
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                (key, int(result), time.time())
+            )
+            self.connection.commit()
+
+    def flush(self):
+
+        # Called with the lock held
+        self.connection.executemany(
+            "UPDATE results SET used = ? WHERE key = ?",
+            [(used, key) for key, used in self.used.items()]
+        )
+        self.used = {}
+
+    def evict(self):
+
+        with self.lock:
+
+            self.flush()
+
+            if self.max_age is not None:
+                cutoff = time.time() - self.max_age*86400
+                self.connection.execute(
+                    "DELETE FROM results WHERE used < ?", (cutoff,)
+                )
+
+            # Least recently used entries go first
+            if self.max_entries is not None:
+                self.connection.execute(
+                    "DELETE FROM results WHERE key NOT IN ("
+                    "SELECT key FROM results ORDER BY used DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+
+            self.connection.commit()
+
+    def __len__(self):
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT COUNT(*) FROM results"
+            ).fetchone()
+
+        return row[0]
+
+    def clear(self):
+
+        with self.lock:
+            self.connection.execute("DELETE FROM results")
+            self.connection.commit()
+
+    def close(self):
+
+        with self.lock:
+            self.flush()
+            self.connection.commit()
+            self.connection.close()
@@ -1,15 +1,82 @@
+import copy
+import hashlib
+import json
 import re
+import threading
 
-import matlab.engine
+import numpy as np
 
-from .misc import run_matlab_function
+from .backends import ExecutionError
+from .batch import run_samples
+from .misc import run_matlab_function, shape_of, to_array
 
 
 class CheckError(Exception):
     pass
 
 
-class NameCheck:
+# Why the last check evaluated on this thread could not run its code
+failures = threading.local()
+
+
+def failure(error):
+
+    # Records the error (or timeout) a check ran into and fails the check
+    if isinstance(error, TimeoutError):
+        failures.message = "Timed out"
+    else:
+        failures.message = str(error)
+
+    return False
+
+
+def last_failure():
+
+    # Message of the last failure since clear_failure() (None if none)
+    return getattr(failures, "message", None)
+
+
+def clear_failure():
+
+    failures.message = None
+
+
+class Check:
+
+    # Relative evaluation cost, used to run cheap checks first
+    cost = 1
+
+    # Whether the result only depends on the submitted code (and can be
+    # shared between students with identical submissions)
+    shared = True
+
+    def bind(self, engine, watchdog):
+
+        # Shallow copy evaluating through a different engine (e.g. pool worker)
+        check = copy.copy(self)
+
+        if hasattr(check, "engine"):
+            check.engine = engine
+            check.watchdog = watchdog
+
+        return check
+
+    def spec(self):
+
+        # Stable description for persistent caching (None if not cacheable)
+        return None
+
+    def calls(self):
+
+        # MATLAB calls made by evaluate(), as (arguments, nargout, timeout)
+        return []
+
+
+class NameCheck(Check):
+
+    # Static (no MATLAB execution), but depends on the file name
+    cost = 0
+    shared = False
 
     def __init__(self, filenames, solution):
 
@@ -21,39 +88,45 @@ class NameCheck:
         return self.filenames[student] == self.solution
 
 
-class ShapeCheck:
+class ShapeCheck(Check):
 
-    def __init__(self, arguments, solution, n, engine):
+    def __init__(self, arguments, solution, n, engine, timeout = None,
+                 watchdog = None, cache = None):
 
         self.arguments = arguments
         self.solution = solution
         self.n = n
         self.engine = engine
+        self.timeout = timeout
+        self.watchdog = watchdog
+        self.cache = cache
+
+    def spec(self):
+
+        return json.dumps(["shape", self.arguments, self.n, self.timeout])
+
+    def calls(self):
+
+        return [(self.arguments, self.n, self.timeout)]
 
     def evaluate(self, _student, call, _code):
 
         try:
             value = run_matlab_function(
                 call, self.arguments, self.n, self.engine,
+                self.timeout, self.watchdog, self.cache
             )
-        except (matlab.engine.MatlabExecutionError, TimeoutError):
-            return False
+        except (ExecutionError, TimeoutError) as e:
+            return failure(e)
 
         # Either both value and solution have no size of rows/columns match
-        if "size" in self.solution.__dir__():
-            if "size" in value.__dir__():
-                if value.size == self.solution.size:
-                    return True
-        else:
-            if "size" not in value.__dir__():
-                return True
-        
-        return False
+        return shape_of(value) == shape_of(self.solution)
 
 
-class ValueCheck:
+class ValueCheck(Check):
 
-    def __init__(self, arguments, solution, tolerance, relative, n, engine):
+    def __init__(self, arguments, solution, tolerance, relative, n, engine,
+                 timeout = None, watchdog = None, cache = None):
 
         self.arguments = arguments
         self.solution = solution
@@ -61,42 +134,250 @@ class ValueCheck:
         self.relative = relative
         self.n = n
         self.engine = engine
+        self.timeout = timeout
+        self.watchdog = watchdog
+        self.cache = cache
+
+        # Solution is converted once so comparisons can be done locally
+        self.expected = to_array(solution)
+
+        if self.expected is None:
+            msg = "Solution output with ({}) is not numeric."
+            arguments = ", ".join(arguments)
+            raise CheckError({"message": msg.format(arguments)})
+
+    def spec(self):
+
+        return json.dumps([
+            "value", self.arguments, self.tolerance, self.relative, self.n,
+            self.timeout
+        ])
+
+    def calls(self):
+
+        return [(self.arguments, self.n, self.timeout)]
 
     def evaluate(self, _student, call, _code):
 
         try:
             value = run_matlab_function(
-                call, self.arguments, self.n, self.engine
+                call, self.arguments, self.n, self.engine,
+                self.timeout, self.watchdog, self.cache
             )
-        except (matlab.engine.MatlabExecutionError, TimeoutError):
+        except (ExecutionError, TimeoutError) as e:
+            return failure(e)
+
+        value = to_array(value)
+
+        if value is None or value.shape != self.expected.shape:
             return False
 
-        # Compare percent deviations
-        diff = self.engine.minus(value, self.solution)
+        return self.compare(value, self.expected)
 
-        # If relative, divide this difference by the solution
+    def compare(self, value, expected):
+
+        # Non-finite entries (NaN/Inf) must match exactly
+        value_finite = np.isfinite(value)
+        expected_finite = np.isfinite(expected)
+
+        if np.any(value_finite != expected_finite):
+            return False
+
+        special = ~expected_finite
+        if np.any(special):
+            same = (value[special] == expected[special])
+            same |= np.isnan(value[special]) & np.isnan(expected[special])
+
+            if not np.all(same):
+                return False
+
+        # Absolute value of a complex difference is its modulus
+        diff = np.abs(value[expected_finite] - expected[expected_finite])
+
+        # If relative, divide this difference by the solution (with exact
+        # matches of a zero solution counting as no deviation)
         if self.relative:
-            diff = self.engine.rdivide(diff, self.solution)
+            scale = np.abs(expected[expected_finite])
+
+            with np.errstate(divide = "ignore", invalid = "ignore"):
+                diff = np.where(diff == 0, 0.0, diff / scale)
+
+        if diff.size == 0:
+            return True
+
+        return bool(np.max(diff) < self.tolerance)
+
+
+#------------------------------------------------------------------------------
+# Randomized value checks
+
+def literal(value):
 
-        diff = self.engine.abs(diff)
-        diff = self.engine.max(diff)
+    # MATLAB expression for a (real) scalar or matrix
+    if np.ndim(value) == 0:
+        value = float(value)
+        return str(int(value)) if value.is_integer() else repr(value)
 
-        return diff < self.tolerance
+    rows = [", ".join(literal(v) for v in row) for row in value]
+    return "[{}]".format("; ".join(rows))
 
 
-class ErrorCheck:
+def generate_samples(generators, samples, seed = 0):
 
-    def __init__(self, arguments, engine):
+    # Generators are MATLAB expressions (used as is) or mappings with a
+    # range, size (rows, columns) and whether values are integers
+    random = np.random.RandomState(seed)
+    columns = []
+
+    for generator in generators:
+
+        if isinstance(generator, str):
+            columns.append([generator]*samples)
+            continue
+
+        try:
+            low, high = generator.get("range", [0, 1])
+            rows, cols = generator.get("size", [1, 1])
+            integer = bool(generator.get("integer", False))
+
+            if integer:
+                values = random.randint(
+                    low, high + 1, size = (samples, rows, cols)
+                )
+            else:
+                values = random.uniform(low, high, size = (samples, rows, cols))
+
+        except (AttributeError, TypeError, ValueError):
+            msg = "Invalid sample generator: {}"
+            raise CheckError({"message": msg.format(generator)})
+
+        if rows == 1 and cols == 1:
+            columns.append([literal(v[0, 0]) for v in values])
+        else:
+            columns.append([literal(v) for v in values])
+
+    return [list(arguments) for arguments in zip(*columns)]
+
+
+class PropertyCheck(ValueCheck):
+    """ Compares outputs over many generated argument sets at once.
+
+    Each side is run over all samples in a single harness call. Samples on
+    which the solution errors must make the submission error as well.
+    """
+
+    def __init__(self, samples, solution, tolerance, relative, n, engine,
+                 timeout = None, watchdog = None, cache = None):
+
+        self.samples = samples
+        self.tolerance = tolerance
+        self.relative = relative
+        self.n = n
+        self.engine = engine
+        self.timeout = timeout
+        self.watchdog = watchdog
+        self.cache = cache
+
+        self.errors = np.array([message != "" for _, message in solution])
+        self.expected = []
+
+        for arguments, (value, message) in zip(samples, solution):
+
+            if message != "":
+                continue
+
+            expected = to_array(value)
+
+            if expected is None:
+                msg = "Solution output with ({}) is not numeric."
+                arguments = ", ".join(arguments)
+                raise CheckError({"message": msg.format(arguments)})
+
+            self.expected.append(expected)
+
+        # Outputs of the same shape are compared as one array
+        shapes = set(e.shape for e in self.expected)
+
+        if len(shapes) == 1:
+            self.stacked = np.stack(self.expected)
+        else:
+            self.stacked = None
+
+    def spec(self):
+
+        samples = json.dumps(self.samples).encode("utf-8")
+
+        return json.dumps([
+            "property", hashlib.sha256(samples).hexdigest(), self.tolerance,
+            self.relative, self.n, self.timeout
+        ])
+
+    def calls(self):
+
+        # Already a single call (made outside of batches)
+        return []
+
+    def evaluate(self, _student, call, _code):
+
+        try:
+            results = run_samples(
+                call, self.samples, self.n, self.engine, self.timeout,
+                self.watchdog, self.cache
+            )
+        except (ExecutionError, TimeoutError) as e:
+            return failure(e)
+
+        errors = np.array([message != "" for _, message in results])
+
+        if len(results) != len(self.samples) or \
+                np.any(errors != self.errors):
+            return False
+
+        values = [
+            to_array(value) for value, message in results if message == ""
+        ]
+
+        for value, expected in zip(values, self.expected):
+            if value is None or value.shape != expected.shape:
+                return False
+
+        if len(values) == 0:
+            return True
+
+        if self.stacked is not None:
+            return self.compare(np.stack(values), self.stacked)
+
+        return all(self.compare(v, e) for v, e in zip(values, self.expected))
+
+
+class ErrorCheck(Check):
+
+    def __init__(self, arguments, engine, timeout = None, watchdog = None,
+                 cache = None):
 
         self.arguments = arguments
         self.engine = engine
+        self.timeout = timeout
+        self.watchdog = watchdog
+        self.cache = cache
         self.re_line = re.compile(r"(?<=line )\d+")
 
+    def spec(self):
+
+        return json.dumps(["error", self.arguments, self.timeout])
+
+    def calls(self):
+
+        return [(self.arguments, 1, self.timeout)]
+
     def evaluate(self, _student, call, code):
 
         try:
-            run_matlab_function(call, self.arguments, 1, self.engine)
-        except matlab.engine.MatlabExecutionError as e:
+            run_matlab_function(
+                call, self.arguments, 1, self.engine,
+                self.timeout, self.watchdog, self.cache
+            )
+        except ExecutionError as e:
 
             # Find error line
             line = self.re_line.search(str(e))
@@ -115,8 +396,8 @@ class ErrorCheck:
             if line in lines:
                 return True
 
-        except TimeoutError:
+        except TimeoutError as e:
 
-            return False
+            return failure(e)
 
         return False
@@ -0,0 +1,304 @@
+import argparse
+import contextlib
+import getpass
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from . import profiling
+from .backends import IsolatedBackend, MatlabBackend
+
+
+class DaemonError(Exception):
+    pass
+
+
+def default_address():
+
+    folder = os.environ.get("XDG_RUNTIME_DIR", tempfile.gettempdir())
+    name = "matgrade-{}.sock".format(getpass.getuser())
+
+    return os.path.join(folder, name)
+
+
+#------------------------------------------------------------------------------
+# Warm engines
+
+class WarmEngines:
+    """ Engine factory lending out long-lived engines to grading jobs.
+
+    Engines are only started when every existing one is lent out, and are
+    isolated (see IsolatedBackend) so jobs do not see each other's paths or
+    variables.
+    """
+
+    def __init__(self, factory = MatlabBackend):
+
+        self.factory = factory
+        self.idle = []
+        self.leases = []
+        self.lock = threading.Lock()
+
+    def __call__(self):
+
+        with self.lock:
+            if len(self.idle) > 0:
+                backend = self.idle.pop()
+            else:
+                backend = None
+
+        if backend is None:
+            backend = self.factory()
+
+        lease = IsolatedBackend(backend)
+
+        with self.lock:
+            self.leases.append(lease)
+
+        return lease
+
+    def release(self):
+
+        with self.lock:
+            leases = self.leases
+            self.leases = []
+
+        for lease in leases:
+            lease.quit()
+
+            with self.lock:
+                self.idle.append(lease.backend)
+
+    def close(self):
+
+        self.release()
+
+        for backend in self.idle:
+            backend.quit()
+
+        self.idle = []
+
+
+#------------------------------------------------------------------------------
+# Server
+
+def handle(request, engines):
+
+    # Imported here, as the command-line interface itself uses the client
+    from . import parser, run
+
+    output = io.StringIO()
+
+    cwd = os.getcwd()
+
+    try:
+        with contextlib.redirect_stdout(output):
+
+            try:
+                args = parser.parse_args(request["argv"])
+            except SystemExit:
+                return {"output": "Could not parse arguments\n"}
+
+            if args.watch:
+                print("Watch mode can not be run through the daemon")
+                return {"output": output.getvalue()}
+
+            os.chdir(request["cwd"])
+            run(args, engines)
+
+    except SystemExit:
+        pass
+    except Exception as e:
+        output.write("Grading failed: {}\n".format(e))
+    finally:
+        profiling.disable()
+        engines.release()
+        os.chdir(cwd)
+
+    return {"output": output.getvalue()}
+
+
+def serve(address = None, factory = MatlabBackend, engines = 1, idle = 600.0):
+
+    if address is None:
+        address = default_address()
+
+    if not hasattr(socket, "AF_UNIX"):
+        msg = "The matgrade daemon requires Unix domain sockets."
+        raise DaemonError({"message": msg})
+
+    warm = WarmEngines(factory)
+
+    # Engines are started up front, so the first job is fast too
+    for _ in range(engines):
+        warm.idle.append(factory())
+
+    if os.path.exists(address):
+        os.remove(address)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(address)
+    server.listen()
+
+    # Shut down once no job has arrived for idle seconds
+    server.settimeout(idle)
+
+    try:
+        while True:
+
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                break
+
+            with connection:
+
+                connection.settimeout(None)
+                f = connection.makefile("rw")
+
+                with f:
+                    line = f.readline()
+
+                    # Clients checking whether the daemon is up send nothing
+                    if line == "":
+                        continue
+
+                    request = json.loads(line)
+
+                    if request.get("command") == "stop":
+                        f.write(json.dumps({"output": ""}) + "\n")
+                        break
+
+                    f.write(json.dumps(handle(request, warm)) + "\n")
+    finally:
+        server.close()
+        warm.close()
+
+        if os.path.exists(address):
+            os.remove(address)
+
+
+#------------------------------------------------------------------------------
+# Client
+
+def send(address, request):
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        with client:
+            client.connect(address)
+            f = client.makefile("rw")
+
+            with f:
+                f.write(json.dumps(request) + "\n")
+                f.flush()
+
+                return json.loads(f.readline())
+
+    except (OSError, ValueError) as e:
+        msg = "Could not reach the matgrade daemon at {}: {}"
+        raise DaemonError({"message": msg.format(address, e)})
+
+
+def listening(address):
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    with client:
+        try:
+            client.connect(address)
+        except OSError:
+            return False
+
+    return True
+
+
+def start(address, wait = 120.0):
+
+    # Detached, so the daemon outlives this command
+    subprocess.Popen(
+        [sys.executable, "-m", "matgrade.daemon", "--socket", address],
+        stdin = subprocess.DEVNULL, stdout = subprocess.DEVNULL,
+        stderr = subprocess.DEVNULL, start_new_session = True
+    )
+
+    deadline = time.monotonic() + wait
+
+    # The socket is only bound once engines are started
+    while time.monotonic() < deadline:
+        if listening(address):
+            return
+        time.sleep(0.1)
+
+    msg = "Timed out waiting for the matgrade daemon to start."
+    raise DaemonError({"message": msg})
+
+
+def submit(argv, cwd = None, address = None):
+
+    # Runs a grading job in the daemon (started if needed) and returns its
+    # printed output
+    if address is None:
+        address = default_address()
+
+    if cwd is None:
+        cwd = os.getcwd()
+
+    request = {"argv": argv, "cwd": cwd}
+
+    if not listening(address):
+
+        # Left behind by a daemon that died without cleaning up
+        if os.path.exists(address):
+            os.remove(address)
+
+        start(address)
+
+    return send(address, request)["output"]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(prog = "matgrade-daemon")
+
+    msg = "socket to listen on (default: {})".format(default_address())
+    parser.add_argument("--socket", help = msg)
+
+    msg = "number of MATLAB engines to start up front (default: 1)"
+    parser.add_argument("--engines", type = int, default = 1, help = msg)
+
+    msg = "seconds without jobs before shutting down (default: 600)"
+    parser.add_argument("--idle", type = float, default = 600.0, help = msg)
+
+    msg = "stop a running daemon"
+    parser.add_argument("--stop", action = "store_true", help = msg)
+
+    args = parser.parse_args()
+    address = args.socket or default_address()
+
+    if args.stop:
+
+        try:
+            send(address, {"command": "stop"})
+        except DaemonError:
+            print("No matgrade daemon is listening on {}".format(address))
+
+        return
+
+    try:
+        serve(address, engines = args.engines, idle = args.idle)
+    except Exception as e:
+        details = e.args[0]
+        print(details["message"])
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
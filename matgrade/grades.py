@@ -0,0 +1,48 @@
+import csv
+import os
+
+
+def combine(component, lookup):
+
+    # Generators make any/all short-circuit, so later checks are only
+    # evaluated when they can still change the outcome
+    results = (lookup(check) for check in component["checks"])
+
+    if component["combination"] == "or":
+        return any(results)
+    else:
+        return all(results)
+
+
+def tabulate(components, matrix, students):
+
+    # Grades of the given students from their results (a ResultMatrix)
+    grades, totals = matrix.grades(components, students)
+
+    content = {"student": list(students)}
+
+    for i, component in enumerate(components):
+        content[component["name"]] = grades[:, i].tolist()
+
+    content["total"] = totals.tolist()
+
+    return content
+
+
+def write_grades(filename, content):
+
+    # Written row by row next to the target and moved into place, so that
+    # readers never see a partial file
+    f = open(filename + ".tmp", "w", newline = "")
+
+    with f:
+        write_rows(f, content)
+
+    os.replace(filename + ".tmp", filename)
+
+
+def write_rows(f, content):
+
+    writer = csv.writer(f, lineterminator = "\n")
+    writer.writerow(content.keys())
+    writer.writerows(zip(*content.values()))
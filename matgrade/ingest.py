@@ -0,0 +1,234 @@
+import collections
+import os
+import re
+import time
+import warnings
+import zipfile
+
+
+class IngestError(Exception):
+    pass
+
+
+# Parsed "<ids> - <Student> - <Mon DD, YYYY HHMM AM>-<function>" file name,
+# with the location of its content (path on disk or archive member)
+Submission = collections.namedtuple(
+    "Submission", ["ids", "student", "timestamp", "function", "source"]
+)
+
+# Regex for comment removal
+re_comment = re.compile("%.*\n")
+
+
+def parse_filename(filename, source):
+
+    # Parse file name
+    components = [s.strip() for s in filename.split(" - ")]
+
+    # Basic check on format
+    try:
+        assert(len(components) == 3)
+        ids = components[0].split("-")
+        float(ids[0])
+        float(ids[1])
+    except:
+        msg = "File does not match submission pattern: {}"
+        warnings.warn(msg.format(filename))
+        return None
+
+    # Clip filename from time
+    combined = components[2].split("-")
+    function = "-".join(combined[1:])
+
+    # Parse timestamp
+    try:
+        timestamp = time.strptime(combined[0], "%b %d, %Y %I%M %p")
+    except ValueError:
+        msg = "File does not match submission pattern: {}"
+        warnings.warn(msg.format(filename))
+        return None
+
+    return Submission(components[0], components[1], timestamp, function, source)
+
+
+def latest(records):
+
+    # Only keep the newest submission of every student
+    newest = {}
+
+    for record in records:
+
+        if record is None:
+            continue
+
+        student = record.student
+        if student in newest and newest[student].timestamp > record.timestamp:
+            continue
+
+        newest[student] = record
+
+    return newest
+
+
+#------------------------------------------------------------------------------
+# Folders
+
+def scan_folder(path):
+
+    try:
+        filenames = os.listdir(path)
+    except OSError:
+        msg = "Could not open submissions folder: {}"
+        raise IngestError({"message": msg.format(path)})
+
+    records = []
+
+    for filename in filenames:
+
+        # Skip directories and hidden files (e.g. the result cache)
+        source = os.path.join(path, filename)
+        if os.path.isdir(source) or filename.startswith("."):
+            continue
+
+        records.append(parse_filename(filename, source))
+
+    return latest(records)
+
+
+def read_folder(records):
+
+    contents = {}
+
+    for student, record in records.items():
+
+        try:
+            f = open(record.source)
+        except OSError:
+            msg = "Could not open submission file: {}"
+            raise IngestError({"message": msg.format(record.source)})
+
+        with f:
+            contents[student] = f.read()
+
+    return contents
+
+
+#------------------------------------------------------------------------------
+# LMS archives (read in place, without extraction)
+
+def scan_archive(path):
+
+    try:
+        archive = zipfile.ZipFile(path)
+    except (OSError, zipfile.BadZipFile):
+        msg = "Could not open submissions archive: {}"
+        raise IngestError({"message": msg.format(path)})
+
+    # First pass only looks at member names (the central directory)
+    records = []
+
+    with archive:
+        for info in archive.infolist():
+
+            filename = os.path.basename(info.filename)
+            if info.is_dir() or filename == "" or filename.startswith("."):
+                continue
+
+            records.append(parse_filename(filename, info.filename))
+
+    return latest(records)
+
+
+def read_archive(path, records):
+
+    contents = {}
+
+    # Second pass decompresses only the newest member of every student
+    with zipfile.ZipFile(path) as archive:
+        for student, record in records.items():
+
+            try:
+                data = archive.read(record.source)
+            except (KeyError, zipfile.BadZipFile):
+                msg = "Could not read submission file: {}"
+                raise IngestError({"message": msg.format(record.source)})
+
+            contents[student] = data.decode("utf-8", errors = "replace")
+
+    return contents
+
+
+#------------------------------------------------------------------------------
+# Either
+
+def ingest(path):
+
+    if os.path.isdir(path):
+        records = scan_folder(path)
+        contents = read_folder(records)
+    elif zipfile.is_zipfile(path):
+        records = scan_archive(path)
+        contents = read_archive(path, records)
+    else:
+        msg = "Could not open submissions folder: {}"
+        raise IngestError({"message": msg.format(path)})
+
+    # Remove all comments to facilitate plagiarism submission checking
+    for student, content in contents.items():
+        contents[student] = strip_comments(content)
+
+    return records, contents
+
+
+def strip_comments(content):
+
+    return re_comment.sub("", content)
+
+
+#------------------------------------------------------------------------------
+# Incremental updates (e.g. while watching a folder)
+
+def refresh(path, records, contents, filenames = None):
+
+    # Only file names reported as changed are parsed (and their contents
+    # read), unless files were removed or nothing is known about the changes
+    if filenames is None:
+        modified = None
+    else:
+        modified = set(os.path.join(path, f) for f in filenames)
+
+    if modified is None or not all(os.path.isfile(s) for s in modified):
+        updated = scan_folder(path)
+    else:
+        parsed = [
+            parse_filename(os.path.basename(s), s) for s in sorted(modified)
+            if not os.path.basename(s).startswith(".")
+        ]
+        updated = latest(list(records.values()) + parsed)
+
+    changed = set(s for s in records if s not in updated)
+    pending = {}
+
+    for student, record in updated.items():
+
+        if student not in records or records[student] != record or \
+                modified is None or record.source in modified:
+            pending[student] = record
+
+    updated_contents = {
+        s: c for s, c in contents.items() if s in updated and s not in pending
+    }
+
+    for student, content in read_folder(pending).items():
+
+        content = re_comment.sub("", content)
+        updated_contents[student] = content
+
+        # Files that were only touched do not count as changes
+        old = records.get(student)
+
+        if old is None or old.function != pending[student].function or \
+                content != contents.get(student):
+            changed.add(student)
+
+    return updated, updated_contents, changed
@@ -0,0 +1,76 @@
+import json
+import os
+import threading
+
+
+class JournalError(Exception):
+    pass
+
+
+class Journal:
+    """ Append-only log of check results, one JSON line per evaluation.
+
+    Results are flushed as soon as they are recorded, so that an interrupted
+    run can be resumed from the last completed (student, check) pair.
+    """
+
+    def __init__(self, filename, resume = False):
+
+        self.filename = filename
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        complete = True
+
+        if resume and os.path.exists(filename):
+            complete = self.load()
+
+        try:
+            self.f = open(filename, "a" if resume else "w")
+        except OSError:
+            msg = "Could not open results journal: {}"
+            raise JournalError({"message": msg.format(filename)})
+
+        # Start on a fresh line after a partially written one
+        if not complete:
+            self.f.write("\n")
+
+    def load(self):
+
+        f = open(self.filename)
+        line = "\n"
+
+        with f:
+            for line in f:
+
+                # The last line may be incomplete after a crash
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+
+                self.entries[json.dumps(entry["key"])] = entry["result"]
+
+        return line.endswith("\n")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+
+        with self.lock:
+            return self.entries.get(json.dumps(key))
+
+    def put(self, key, result):
+
+        line = json.dumps({"key": key, "result": result})
+
+        with self.lock:
+            self.entries[json.dumps(key)] = result
+            self.f.write(line + "\n")
+            self.f.flush()
+
+    def close(self):
+
+        with self.lock:
+            self.f.close()
@@ -1,35 +1,164 @@
 import io
-import multiprocessing
 import os
-import time
 
+import numpy as np
 
-def run_matlab_function(function, arguments, n, engine):
+from . import profiling
+from .variables import define_variable
+from .watchdog import default_watchdog
 
-    # Suppressing all MATLAB output
-    null = io.StringIO("")
 
-    command = "{}({})".format(function, ", ".join(arguments))
-    future = engine.eval(
-        command, stdout = null, stderr = null, nargout = n, background = True
-    )
+def setup_engine(engine, path, variables):
 
-    start = time.perf_counter()
+    call = "addpath('{}')".format(path)
+    engine.eval(call, nargout = 0)
 
-    while (not future.done()) and ((time.perf_counter() - start) < 0.5):
-        pass
+    # Replay variable definitions in order
+    for name, source in variables:
+        define_variable(engine, name, source)
 
-    if not future.done():
-        future.cancel()
+    return engine
 
-        # Leaving some time for process to cancel
-        # (as not doing this seemed to mess up follow-up calls)
-        time.sleep(2.0)
-        raise TimeoutError
 
-    value = future.result()
+def sync_code(path, files):
 
-    if n > 1:
-        value = value[n-1]
+    # Only (re)write m files whose content changed and remove stale ones,
+    # returning the names of the affected functions
+    touched = []
 
-    return value            
+    os.makedirs(path, exist_ok = True)
+
+    for filename in sorted(os.listdir(path)):
+        if filename.endswith(".m") and filename not in files:
+
+            # Other processes (e.g. shards) may be syncing the same folder
+            try:
+                os.remove(os.path.join(path, filename))
+            except FileNotFoundError:
+                pass
+
+            touched.append(filename[:-2])
+
+    for filename, content in files.items():
+        full = os.path.join(path, filename)
+
+        try:
+            f = open(full)
+        except OSError:
+            current = None
+        else:
+            with f:
+                current = f.read()
+
+        if current == content:
+            continue
+
+        # Written next to the target and moved into place
+        temporary = "{}.{}.tmp".format(full, os.getpid())
+
+        f = open(temporary, "w")
+        with f:
+            f.write(content)
+
+        os.replace(temporary, full)
+        touched.append(filename[:-2])
+
+    return touched
+
+
+def run_matlab_function(function, arguments, n, engine, timeout = None,
+                        watchdog = None, cache = None):
+
+    if watchdog is None:
+        watchdog = default_watchdog
+
+    if timeout is None:
+        timeout = watchdog.timeout
+
+    def run():
+
+        # Suppressing all MATLAB output
+        null = io.StringIO("")
+
+        command = "{}({})".format(function, ", ".join(arguments))
+        future = engine.eval(
+            command, stdout = null, stderr = null, nargout = n,
+            background = True
+        )
+
+        # Raises TimeoutError (after confirming cancellation) on deadline
+        value = watchdog.wait(engine, future, timeout)
+
+        if n > 1:
+            value = value[n-1]
+
+        return value
+
+    if profiling.profiler is not None:
+        run = profiling.profiler.wrap(run)
+
+    if cache is None:
+        return run()
+
+    # Identical calls (including ones that fail) only reach the engine once
+    # (unless they timed out with a shorter deadline)
+    key = cache.key(function, arguments, n)
+
+    return cache.run(key, run, timeout)
+
+
+def to_array(value):
+
+    # Converts MATLAB output to a (at least 2D) numeric array, or None
+
+    if isinstance(value, np.ndarray):
+        array = value
+
+    elif isinstance(value, (bool, int, float, complex)):
+        array = np.asarray(value)
+
+    else:
+
+        # Recent MATLAB releases expose the buffer protocol (zero-copy)
+        try:
+            array = np.asarray(memoryview(value))
+        except TypeError:
+            array = None
+
+        # Older releases keep real data in a column-major array.array
+        data = getattr(value, "_data", None)
+        size = getattr(value, "size", None)
+
+        if array is not None:
+            pass
+        elif data is not None and size is not None and \
+                not getattr(value, "_is_complex", False):
+            array = np.frombuffer(data, dtype = data.typecode)
+            array = array.reshape(size, order = "F")
+        else:
+            try:
+                array = np.asarray(value)
+            except (TypeError, ValueError):
+                return None
+
+    if array.dtype.kind not in "biufc":
+        return None
+
+    if array.dtype.kind == "b":
+        array = array.astype(float)
+
+    return np.atleast_2d(array)
+
+
+def shape_of(value):
+
+    # Dimensions of array output (None for scalars and non-array values)
+    if isinstance(value, np.ndarray):
+        shape = np.atleast_2d(value).shape
+    else:
+        shape = getattr(value, "size", None)
+
+    if not isinstance(shape, tuple) or shape == (1, 1):
+        return None
+
+    return tuple(shape)
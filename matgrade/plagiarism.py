@@ -0,0 +1,220 @@
+import collections
+import html
+import itertools
+import os
+import re
+import zlib
+
+from .ingest import read_folder, scan_folder, strip_comments
+
+# MATLAB keywords are kept as-is, other identifiers are normalized so that
+# renaming variables does not hide copied structure
+KEYWORDS = {
+    "break", "case", "catch", "classdef", "continue", "else", "elseif", "end",
+    "for", "function", "global", "if", "otherwise", "parfor", "persistent",
+    "return", "spmd", "switch", "try", "while",
+}
+
+re_token = re.compile(
+    r"""(?P<comment>%[^\n]*)
+      | (?P<string>"[^"\n]*"|(?<![\w\)\]\}'.])'[^'\n]*')
+      | (?P<number>\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+      | (?P<name>[A-Za-z_]\w*)
+      | (?P<operator>\.\*|\./|\.\^|\.'|==|~=|<=|>=|&&|\|\||[^\s\w])
+    """,
+    re.VERBOSE
+)
+
+
+def tokenize(code):
+
+    tokens = []
+
+    for match in re_token.finditer(code):
+
+        kind = match.lastgroup
+        text = match.group(0)
+
+        if kind == "comment":
+            continue
+        elif kind == "string":
+            tokens.append("S")
+        elif kind == "number":
+            tokens.append("N")
+        elif kind == "name":
+            tokens.append(text if text in KEYWORDS else "V")
+        else:
+            tokens.append(text)
+
+    return tokens
+
+
+def fingerprints(code, k = 5, window = 4):
+
+    # Hashes of every k-gram of tokens (crc32 is stable across runs)
+    tokens = tokenize(code)
+    hashes = [
+        zlib.crc32(" ".join(tokens[i:i + k]).encode())
+        for i in range(len(tokens) - k + 1)
+    ]
+
+    if len(hashes) == 0:
+        return set()
+
+    if len(hashes) <= window:
+        return {min(hashes)}
+
+    # Winnowing: keep the (rightmost) minimum hash of every window
+    selected = set()
+    previous = None
+
+    for i in range(len(hashes) - window + 1):
+
+        current = hashes[i:i + window]
+        position = i + window - 1 - current[::-1].index(min(current))
+
+        if position != previous:
+            selected.add(hashes[position])
+            previous = position
+
+    return selected
+
+
+class SimilarityIndex:
+
+    def __init__(self, k = 5, window = 4, max_share = 0.1, min_limit = 10):
+
+        self.k = k
+        self.window = window
+
+        # Fingerprints shared by more than this fraction of documents (e.g.
+        # function signatures, starter code) are ignored, unless the number
+        # of documents is below min_limit
+        self.max_share = max_share
+        self.min_limit = min_limit
+
+        self.names = []
+        self.codes = []
+        self.current = []
+        self.fingerprints = []
+        self.index = {}
+
+    def add(self, name, code, current = True):
+
+        document = len(self.names)
+        selected = fingerprints(code, self.k, self.window)
+
+        self.names.append(name)
+        self.codes.append(code)
+        self.current.append(current)
+        self.fingerprints.append(selected)
+
+        for fingerprint in selected:
+            self.index.setdefault(fingerprint, []).append(document)
+
+        return document
+
+    def add_folder(self, path, label = None):
+
+        # Archived submissions (e.g. previous terms), compared against but
+        # not reported amongst themselves. Like graded submissions, only the
+        # latest one of every student is kept, without comments, and hidden
+        # folders (e.g. generated code, including the solution) are skipped
+        if label is None:
+            label = os.path.basename(os.path.normpath(path))
+
+        for root, folders, _ in os.walk(path):
+
+            folders[:] = sorted(f for f in folders if not f.startswith("."))
+
+            records = scan_folder(root)
+            contents = read_folder(records)
+
+            for student in sorted(records):
+
+                name = "{}/{}".format(
+                    label, os.path.basename(records[student].source)
+                )
+                self.add(name, strip_comments(contents[student]),
+                         current = False)
+
+    def pairs(self, threshold = 0.5):
+
+        limit = max(self.min_limit, int(self.max_share*len(self.names)))
+        shared = collections.Counter()
+
+        # Number of informative fingerprints per document
+        sizes = [len(f) for f in self.fingerprints]
+
+        # Candidate pairs only come from fingerprints they have in common
+        for documents in self.index.values():
+
+            if len(documents) > limit:
+                for document in documents:
+                    sizes[document] -= 1
+                continue
+
+            shared.update(itertools.combinations(documents, 2))
+
+        results = []
+
+        for (a, b), count in shared.items():
+
+            # Archived submissions are not compared amongst themselves
+            if not (self.current[a] or self.current[b]):
+                continue
+
+            smallest = min(sizes[a], sizes[b])
+            similarity = count/smallest
+
+            if similarity >= threshold:
+                results.append((similarity, count, a, b))
+
+        results.sort(key = lambda r: (-r[0], -r[1]))
+
+        return [
+            (self.names[a], self.names[b], similarity, count)
+            for similarity, count, a, b in results
+        ]
+
+    def report(self, pairs, labels = None):
+
+        # Render pairs as html (optionally relabelling document names)
+        if labels is None:
+            labels = {}
+
+        positions = {name: i for i, name in enumerate(self.names)}
+
+        rows = []
+        details = []
+
+        for i, (a, b, similarity, count) in enumerate(pairs):
+
+            label_a = html.escape(labels.get(a, a))
+            label_b = html.escape(labels.get(b, b))
+
+            rows.append(
+                "<tr><td><a href=\"#pair{}\">{}</a></td><td>{}</td>"
+                "<td>{:.0f}%</td><td>{}</td></tr>".format(
+                    i, label_a, label_b, 100*similarity, count
+                )
+            )
+
+            code_a = html.escape(self.codes[positions[a]])
+            code_b = html.escape(self.codes[positions[b]])
+
+            details.append(
+                "<h2 id=\"pair{}\">{} / {} ({:.0f}%)</h2>\n"
+                "<table><tr><td><pre>{}</pre></td><td><pre>{}</pre></td>"
+                "</tr></table>".format(
+                    i, label_a, label_b, 100*similarity, code_a, code_b
+                )
+            )
+
+        return (
+            "<html><head><title>Similarity report</title></head><body>\n"
+            "<h1>Similarity report</h1>\n"
+            "<table border=\"1\"><tr><th>Submission</th><th>Submission</th>"
+            "<th>Similarity</th><th>Shared fingerprints</th></tr>\n"
+            "{}\n</table>\n{}\n</body></html>\n"
+        ).format("\n".join(rows), "\n".join(details))
@@ -0,0 +1,258 @@
+import hashlib
+import json
+
+from .cache import fingerprint
+from .variables import VariableError, variable
+
+
+class PlanError(Exception):
+    pass
+
+
+# Check types in the order they are added by load()
+KINDS = ["shape", "absolute_value", "relative_value", "property", "error"]
+
+
+def parse_check(kind, name, check):
+
+    # Returns the definition of a check, less its name, kind and timeout
+    if kind == "property":
+
+        if not isinstance(check, dict) or "arguments" not in check \
+                or "tolerance" not in check:
+            msg = "Property check \"{}\" must define arguments and a tolerance"
+            raise PlanError({"message": msg.format(name)})
+
+        return {
+            "arguments": list(check["arguments"]),
+            "n": check.get("n", 1),
+            "samples": check.get("samples", 100),
+            "seed": check.get("seed", 0),
+            "tolerance": check["tolerance"],
+            "relative": bool(check.get("relative", False))
+        }
+
+    if kind == "error":
+
+        if not isinstance(check, list):
+            check = [check]
+
+        return {"arguments": check, "n": 1}
+
+    # Shape checks are [arguments, n], value checks [arguments, tolerance, n]
+    position = 1 if kind == "shape" else 2
+
+    if not isinstance(check, list) or len(check) < position or \
+            not isinstance(check[0], list):
+        msg = "\"{}\" {} check must start with a list of arguments"
+        raise PlanError({"message": msg.format(name, kind)})
+
+    if len(check) > position:
+        n = check[position]
+    else:
+        n = 1
+
+    definition = {"arguments": check[0], "n": n}
+
+    if kind != "shape":
+        definition["tolerance"] = check[1]
+        definition["relative"] = kind == "relative_value"
+
+    return definition
+
+
+def parse_cache(settings):
+
+    # Result cache limits, or None when disabled
+    cache = settings.get("cache", {})
+
+    if cache is True or cache is None:
+        cache = {}
+
+    if cache is False:
+        return None
+    elif not isinstance(cache, dict):
+        msg = "Cache settings must be a mapping (or false to disable)"
+        raise PlanError({"message": msg})
+
+    return {
+        "max_entries": cache.get("max_entries"),
+        "max_age": cache.get("max_age")
+    }
+
+
+def parse_calibration(settings):
+
+    # Keyword arguments of Assessment.calibrate, or None when disabled
+    calibration = settings.get("calibrate", False)
+
+    if calibration is True:
+        calibration = {}
+
+    if calibration is False or calibration is None:
+        return None
+    elif not isinstance(calibration, dict):
+        msg = "Timeout calibration settings must be a mapping (or true/false)"
+        raise PlanError({"message": msg})
+
+    parsed = {}
+    for key, name in [("factor", "factor"), ("min", "minimum"),
+                      ("max", "maximum"), ("repeats", "repeats")]:
+        if key in calibration:
+            parsed[name] = calibration[key]
+
+    return parsed
+
+
+def compile_plan(documents):
+
+    # Validates a lab (parsed yaml documents) without starting MATLAB,
+    # returning everything load() needs to build its assessment, along with
+    # the distinct solution calls made by checks
+    settings = documents[0]
+
+    for key in ["solution", "submissions"]:
+        if key not in settings:
+            msg = "The first document must define \"{}\""
+            raise PlanError({"message": msg.format(key)})
+
+    try:
+        f = open(settings["solution"])
+    except OSError:
+        msg = "Could not open solution file: {}"
+        raise PlanError({"message": msg.format(settings["solution"])})
+
+    with f:
+        code = f.read()
+
+    # Default and per-check timeouts (in seconds)
+    timeout = settings.get("timeout", 0.5)
+    timeouts = dict(settings.get("timeouts") or {})
+
+    for value in [timeout] + list(timeouts.values()):
+        if not isinstance(value, (int, float)) or value <= 0:
+            msg = "Timeouts must be positive numbers (in seconds)"
+            raise PlanError({"message": msg})
+
+    # File variables are opened (and hashed) once, here
+    variables = []
+
+    for name, call in (settings.get("variables") or {}).items():
+
+        try:
+            variables.append((name, variable(call)))
+        except VariableError as e:
+            raise PlanError(e.args[0])
+
+    checks = []
+    calls = []
+    names = set(["name"])
+
+    defined = settings.get("checks") or {}
+
+    for kind in KINDS:
+        for name, check in (defined.get(kind) or {}).items():
+
+            if name in names:
+                msg = "\"{}\" check is defined more than once"
+                raise PlanError({"message": msg.format(name)})
+
+            names.add(name)
+
+            definition = parse_check(kind, name, check)
+            definition.update(
+                {"name": name, "kind": kind, "timeout": timeouts.get(name)}
+            )
+            checks.append(definition)
+
+            # Error checks never run the solution (and property checks run
+            # it once over all of their samples)
+            call = [definition["arguments"], definition["n"]]
+
+            if kind == "property":
+                call += [definition["samples"], definition["seed"]]
+
+            if kind != "error" and call not in calls:
+                calls.append(call)
+
+    for name in timeouts:
+        if name not in names:
+            msg = "Timeout given for undefined check \"{}\""
+            raise PlanError({"message": msg.format(name)})
+
+    components = []
+
+    for task in documents[1:]:
+
+        if "grade" not in task:
+            continue
+
+        if "checks" not in task:
+            raise PlanError({"message": "Each grade task must define checks"})
+        elif not isinstance(task["checks"], list):
+            component_checks = [task["checks"]]
+        else:
+            component_checks = task["checks"]
+
+        # Checks must all pass unless stated otherwise
+        combination = task.get("combination", "and")
+
+        if combination not in ("and", "or"):
+            msg = "Grade task combination may only be \"and\"/\"or\""
+            raise PlanError({"message": msg})
+
+        separator = " / " if combination == "or" else " + "
+        name = task.get("name", separator.join(component_checks))
+
+        for check in component_checks:
+            if check not in names:
+                msg = "\"{}\" check is undefined (referenced by \"{}\")"
+                raise PlanError({"message": msg.format(check, name)})
+
+        components.append({"name": name, "checks": component_checks,
+                           "combination": combination, "value": task["grade"]})
+
+    content = json.dumps([code, fingerprint(variables), checks, components])
+
+    return {
+        "solution": settings["solution"],
+        "submissions": settings["submissions"],
+        "digest": hashlib.sha256(content.encode("utf-8")).hexdigest(),
+        "timeout": timeout,
+        "cheap_first": bool(settings.get("cheap_first", False)),
+        "cache": parse_cache(settings),
+        "calibration": parse_calibration(settings),
+        "variables": variables,
+        "checks": checks,
+        "calls": calls,
+        "components": components
+    }
+
+
+def report(plan):
+
+    msg = "Solution {} (plan {})"
+    lines = [msg.format(plan["solution"], plan["digest"][:16])]
+
+    msg = "{} variable(s), {} check(s), {} distinct solution call(s)"
+    lines.append(msg.format(
+        len(plan["variables"]), len(plan["checks"]), len(plan["calls"])
+    ))
+
+    for check in plan["checks"]:
+        msg = "  {} ({}): ({}), nargout={}"
+        lines.append(msg.format(
+            check["name"], check["kind"],
+            ", ".join(str(a) for a in check["arguments"]),
+            check["n"]
+        ))
+
+    total = sum(c["value"] for c in plan["components"])
+    lines.append("{} graded component(s) worth {}".format(
+        len(plan["components"]), total
+    ))
+
+    for component in plan["components"]:
+        lines.append("  {}: {}".format(component["name"], component["value"]))
+
+    return "\n".join(lines)
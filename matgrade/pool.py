@@ -0,0 +1,174 @@
+import queue
+import threading
+
+from .misc import setup_engine
+from .watchdog import Watchdog
+
+
+class PoolError(Exception):
+    pass
+
+
+def evaluate_all(task, checks):
+
+    student, call, code = task
+
+    return {
+        student: {
+            name: check.evaluate(student, call, code)
+            for name, check in checks.items()
+        }
+    }
+
+
+class Worker:
+
+    def __init__(self, pool, engine):
+
+        self.pool = pool
+        self.engine = engine
+        self.watchdog = Watchdog(pool.timeout, restart = self.restart)
+        self.checks = {}
+
+    def restart(self):
+
+        # Restarted in place, so bound checks keep a valid reference
+        self.engine.restart()
+        setup_engine(self.engine, self.pool.path, self.pool.variables)
+
+    def bind(self, checks):
+
+        self.checks = {
+            name: check.bind(self.engine, self.watchdog)
+            for name, check in checks.items()
+        }
+
+        return self.checks
+
+    def run(self, tasks, checks, grade, results, errors):
+
+        self.bind(checks)
+
+        while True:
+            try:
+                task = tasks.get_nowait()
+            except queue.Empty:
+                return
+
+            # Tasks may cover several students (e.g. identical submissions),
+            # and grade functions may record results themselves (returning
+            # None)
+            try:
+                outcome = grade(task, self.checks)
+                if outcome is not None:
+                    results.update(outcome)
+            except Exception as e:
+                errors.append(e)
+                return
+
+
+class EnginePool:
+
+    def __init__(self, factory, workers, path, variables, timeout = 0.5):
+
+        if workers < 1:
+            msg = "Engine pool requires at least one worker (got {})."
+            raise PoolError({"message": msg.format(workers)})
+
+        self.factory = factory
+        self.size = workers
+        self.path = path
+        self.variables = variables
+        self.timeout = timeout
+        self.workers = []
+
+    #--------------------------------------------------------------------------
+    # Engine lifecycle
+
+    def start_engine(self):
+
+        return setup_engine(self.factory(), self.path, self.variables)
+
+    def start(self):
+
+        if len(self.workers) > 0:
+            return
+
+        # MATLAB startup is slow, so engines are started concurrently
+        engines = [None] * self.size
+        errors = []
+
+        def start(i):
+            try:
+                engines[i] = self.start_engine()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [
+            threading.Thread(target = start, args = (i,))
+            for i in range(self.size)
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        if len(errors) > 0:
+            self.workers = [Worker(self, e) for e in engines if e is not None]
+            self.close()
+
+            msg = "Could not start engine pool: {}"
+            raise PoolError({"message": msg.format(errors[0])})
+
+        self.workers = [Worker(self, engine) for engine in engines]
+
+    def close(self):
+
+        for worker in self.workers:
+            try:
+                worker.engine.quit()
+            except Exception:
+                pass
+
+        self.workers = []
+
+    #--------------------------------------------------------------------------
+    # Evaluation
+
+    def evaluate(self, tasks, checks, grade = None):
+
+        # Default to evaluating every check for every student
+        if grade is None:
+            grade = evaluate_all
+
+        self.start()
+
+        # Students are pulled from a shared queue so that slow shards
+        # (e.g. ones full of timeouts) do not hold up the others
+        pending = queue.Queue()
+        for task in tasks:
+            pending.put(task)
+
+        results = {}
+        errors = []
+
+        threads = [
+            threading.Thread(
+                target = worker.run,
+                args = (pending, checks, grade, results, errors)
+            )
+            for worker in self.workers
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        if len(errors) > 0:
+            raise errors[0]
+
+        return results
@@ -0,0 +1,179 @@
+import csv
+import json
+import threading
+import time
+
+
+# Active profiler (None when profiling is disabled, which is the default)
+profiler = None
+
+
+def enable():
+
+    global profiler
+    profiler = Profiler()
+
+    return profiler
+
+
+def disable():
+
+    global profiler
+    profiler = None
+
+
+#------------------------------------------------------------------------------
+# Recording
+
+class Profiler:
+    """ Records wall time, engine round-trips, timeouts and errors per check
+    evaluation. Engine calls are attributed to the evaluation running in the
+    same thread (or to setup, e.g. solution calls, outside of evaluations).
+    """
+
+    fields = [
+        "student", "check", "time", "calls", "engine_time", "timeouts",
+        "errors", "passed"
+    ]
+
+    def __init__(self):
+
+        self.records = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+        self.setup = self.record(None, None)
+
+    def record(self, student, check):
+
+        return {
+            "student": student, "check": check, "time": 0.0, "calls": 0,
+            "engine_time": 0.0, "timeouts": 0, "errors": 0, "passed": None
+        }
+
+    def measure(self, student, check, f, *args):
+
+        record = self.record(student, check)
+
+        previous = getattr(self.local, "record", None)
+        self.local.record = record
+
+        start = time.perf_counter()
+
+        try:
+            result = f(*args)
+            if isinstance(result, bool):
+                record["passed"] = result
+        finally:
+            record["time"] = time.perf_counter() - start
+            self.local.record = previous
+
+            with self.lock:
+                self.records.append(record)
+
+        return result
+
+    def wrap(self, f):
+
+        # Times a single engine round-trip
+        def run():
+
+            record = getattr(self.local, "record", None)
+            if record is None:
+                record = self.setup
+
+            start = time.perf_counter()
+
+            try:
+                return f()
+            except TimeoutError:
+                record["timeouts"] += 1
+                raise
+            except Exception:
+                record["errors"] += 1
+                raise
+            finally:
+                record["calls"] += 1
+                record["engine_time"] += time.perf_counter() - start
+
+        return run
+
+    #--------------------------------------------------------------------------
+    # Roll-ups
+
+    def rollup(self, field):
+
+        totals = {}
+
+        for record in self.records:
+
+            name = record[field]
+            if name is None:
+                name = "(batch)"
+
+            if name not in totals:
+                totals[name] = {
+                    "evaluations": 0, "time": 0.0, "calls": 0,
+                    "engine_time": 0.0, "timeouts": 0, "errors": 0
+                }
+
+            total = totals[name]
+            total["evaluations"] += 1
+
+            for key in ["time", "calls", "engine_time", "timeouts", "errors"]:
+                total[key] += record[key]
+
+        return totals
+
+    def summary(self):
+
+        return {
+            "setup": {k: self.setup[k] for k in self.fields[3:7]},
+            "checks": self.rollup("check"),
+            "students": self.rollup("student"),
+            "evaluations": self.records,
+        }
+
+    def report(self, n = 5):
+
+        summary = self.summary()
+        lines = []
+
+        msg = "{:<40} {:>9.3f} s {:>6} call(s) {:>4} timeout(s) {:>4} error(s)"
+
+        for title, totals in [
+            ("Slowest checks", summary["checks"]),
+            ("Slowest students", summary["students"])
+        ]:
+
+            lines.append(title + ":")
+
+            slowest = sorted(
+                totals.items(), key = lambda item: item[1]["time"],
+                reverse = True
+            )
+
+            for name, total in slowest[:n]:
+                lines.append(msg.format(
+                    str(name)[:40], total["time"], total["calls"],
+                    total["timeouts"], total["errors"]
+                ))
+
+        return "\n".join(lines)
+
+    def write(self, filename):
+
+        # CSV holds one row per evaluation, JSON the full summary
+        if filename.endswith(".csv"):
+
+            f = open(filename, "w", newline = "")
+            with f:
+                writer = csv.DictWriter(f, fieldnames = self.fields)
+                writer.writeheader()
+                writer.writerows(self.records)
+
+        else:
+
+            f = open(filename, "w")
+            with f:
+                json.dump(self.summary(), f, indent = 2)
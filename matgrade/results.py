@@ -0,0 +1,131 @@
+import threading
+
+import numpy as np
+
+# Outcome codes (checks that were never needed stay unknown)
+PASS = 1
+FAIL = 0
+UNKNOWN = -1
+
+
+class ResultMatrix:
+    """ Check outcomes of every student, as a students x checks int8 matrix.
+
+    Rows and columns are added as students are graded and checks defined, so
+    each outcome takes a single byte. Graded components reduce over column
+    index sets and totals are a product with the component values.
+    """
+
+    def __init__(self, checks = ()):
+
+        self.rows = {}
+        self.columns = {}
+
+        # Students may be added concurrently by pool workers
+        self.lock = threading.Lock()
+
+        # Rows of discarded students, reused before new ones are added
+        self.free = []
+        self.matrix = np.full((0, 0), UNKNOWN, dtype = np.int8)
+
+        self.add_checks(checks)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, student):
+        return student in self.rows
+
+    def resize(self, rows, columns):
+
+        old = self.matrix
+        if rows <= old.shape[0] and columns <= old.shape[1]:
+            return
+
+        # Capacity is doubled, so adding students one at a time stays cheap
+        shape = (
+            max(rows, 2*old.shape[0]) if rows > old.shape[0] else old.shape[0],
+            max(columns, old.shape[1])
+        )
+
+        self.matrix = np.full(shape, UNKNOWN, dtype = np.int8)
+        self.matrix[:old.shape[0], :old.shape[1]] = old
+
+    def add_checks(self, checks):
+
+        for check in checks:
+            if check not in self.columns:
+                self.columns[check] = len(self.columns)
+
+        self.resize(self.matrix.shape[0], len(self.columns))
+
+    def put(self, student, outcomes):
+
+        # Results of a newly graded student, as {check: passed}
+        with self.lock:
+
+            self.add_checks(outcomes)
+
+            if student in self.rows:
+                pass
+            elif len(self.free) > 0:
+                self.rows[student] = self.free.pop()
+            else:
+                self.rows[student] = len(self.rows)
+                self.resize(len(self.rows), len(self.columns))
+
+            row = self.matrix[self.rows[student]]
+            row[:] = UNKNOWN
+
+            for check, passed in outcomes.items():
+                row[self.columns[check]] = PASS if passed else FAIL
+
+    def update(self, results):
+
+        # Results of several students, as {student: {check: passed}}
+        for student, outcomes in results.items():
+            self.put(student, outcomes)
+
+    def discard(self, student):
+
+        with self.lock:
+            if student in self.rows:
+                self.free.append(self.rows.pop(student))
+
+    def get(self, student):
+
+        # Evaluated checks of a student, as {check: passed}
+        row = self.matrix[self.rows[student]]
+
+        return {
+            check: bool(row[column] == PASS)
+            for check, column in self.columns.items()
+            if row[column] != UNKNOWN
+        }
+
+    def grades(self, components, students):
+
+        # Component grades (students x components) and totals of students
+        rows = np.array([self.rows[s] for s in students], dtype = np.intp)
+        passed = self.matrix[rows] == PASS
+
+        achieved = np.zeros((len(students), len(components)), dtype = bool)
+
+        for i, component in enumerate(components):
+
+            index = [self.columns[c] for c in component["checks"]
+                     if c in self.columns]
+
+            # Checks are only evaluated while they can change the outcome,
+            # so unknown entries never decide a component
+            if component["combination"] == "or":
+                achieved[:, i] = passed[:, index].any(axis = 1)
+            else:
+                achieved[:, i] = passed[:, index].all(axis = 1)
+
+        # Values keep their own type, so integer grades stay integers when
+        # another component is worth a fraction
+        values = np.array([c["value"] for c in components], dtype = object)
+        grades = np.where(achieved, values, 0)
+
+        return grades, grades.sum(axis = 1)
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+
+from .grades import tabulate, write_grades
+
+
+class ShardError(Exception):
+    pass
+
+
+def shard(student, count):
+
+    # Based on the full student hash, so that the partition does not depend
+    # on which other students are present
+    digest = hashlib.sha256(student.encode("utf-8")).hexdigest()
+
+    return int(digest, 16) % count + 1
+
+
+def write_shard(filename, content):
+
+    f = open(filename + ".tmp", "w")
+    with f:
+        json.dump(content, f, indent = 1)
+
+    os.replace(filename + ".tmp", filename)
+
+
+def read_shard(filename):
+
+    try:
+        f = open(filename)
+    except OSError:
+        msg = "Could not open shard results: {}"
+        raise ShardError({"message": msg.format(filename)})
+
+    with f:
+        try:
+            content = json.load(f)
+        except ValueError:
+            msg = "Shard results are not valid JSON: {}"
+            raise ShardError({"message": msg.format(filename)})
+
+    for key in ["fingerprint", "shard", "components", "results"]:
+        if key not in content:
+            msg = "Shard results are missing \"{}\": {}"
+            raise ShardError({"message": msg.format(key, filename)})
+
+    return content
+
+
+#------------------------------------------------------------------------------
+# Combining shards
+
+def merge(filenames, output):
+
+    shards = [read_shard(filename) for filename in filenames]
+
+    if len(shards) == 0:
+        raise ShardError({"message": "No shard results to merge."})
+
+    # Shards must come from the same configuration and submissions
+    first = shards[0]
+
+    for filename, content in zip(filenames, shards):
+        if content["fingerprint"] != first["fingerprint"]:
+            msg = "Shard was graded with a different configuration or " + \
+                  "submissions: {}"
+            raise ShardError({"message": msg.format(filename)})
+
+    count = first["shard"][1]
+    indices = sorted(content["shard"][0] for content in shards)
+
+    if any(content["shard"][1] != count for content in shards) or \
+            indices != list(range(1, count + 1)):
+        msg = "Expected each of {} shard(s) exactly once (got {})."
+        raise ShardError({"message": msg.format(count, indices)})
+
+    # Imported here, as numpy is not needed to read or validate shards
+    from .results import ResultMatrix
+
+    results = ResultMatrix()
+    for content in shards:
+        results.update(content["results"])
+
+    # Students are listed in a stable order regardless of shard
+    students = sorted(results.rows)
+
+    write_grades(output, tabulate(first["components"], results, students))
+
+    return len(students)
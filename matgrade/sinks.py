@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+import time
+
+from .grades import write_rows
+
+
+class SinkError(Exception):
+    pass
+
+
+class Sink:
+    """ Per-student results, published while students are being graded.
+
+    Rows are kept by student (so regraded students replace their row) and
+    the whole file is rewritten, to a temporary file moved into place, at
+    most every interval seconds and whenever publish() is called. Readers
+    therefore only ever see complete files.
+    """
+
+    def __init__(self, filename, interval = 1.0):
+
+        self.filename = filename
+        self.interval = interval
+
+        self.rows = {}
+        self.published = None
+        self.lock = threading.Lock()
+
+    def write(self, row):
+
+        # Rows are {"student", "grades": {component: value}, "total",
+        # "checks": {check: {"passed", "time", "error"}}, "duration"}
+        with self.lock:
+            self.rows[row["student"]] = row
+
+            due = self.published is None or \
+                time.monotonic() - self.published >= self.interval
+
+        if due:
+            self.publish()
+
+    def publish(self):
+
+        with self.lock:
+            rows = list(self.rows.values())
+            self.published = time.monotonic()
+
+            self.dump(self.filename + ".tmp", rows)
+            os.replace(self.filename + ".tmp", self.filename)
+
+    def dump(self, filename, rows):
+        raise NotImplementedError
+
+
+class CSVSink(Sink):
+
+    def dump(self, filename, rows):
+
+        content = {"student": [row["student"] for row in rows]}
+
+        names = []
+        if len(rows) > 0:
+            names = list(rows[0]["grades"])
+
+        for name in names:
+            content[name] = [row["grades"][name] for row in rows]
+
+        content["total"] = [row["total"] for row in rows]
+
+        f = open(filename, "w", newline = "")
+
+        with f:
+            write_rows(f, content)
+
+
+class JSONLinesSink(Sink):
+
+    def dump(self, filename, rows):
+
+        f = open(filename, "w")
+
+        with f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+
+
+class ParquetSink(Sink):
+
+    def __init__(self, filename, interval = 1.0):
+
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            msg = "Parquet output requires the pyarrow package: {}"
+            raise SinkError({"message": msg.format(filename)})
+
+        super().__init__(filename, interval)
+
+    def dump(self, filename, rows):
+
+        import pyarrow
+        import pyarrow.parquet
+
+        columns = {"student": [row["student"] for row in rows]}
+
+        names = []
+        checks = []
+
+        for row in rows:
+            names += [n for n in row["grades"] if n not in names]
+            checks += [c for c in row["checks"] if c not in checks]
+
+        for name in names:
+            columns[name] = [row["grades"].get(name) for row in rows]
+
+        columns["total"] = [row["total"] for row in rows]
+        columns["duration"] = [row["duration"] for row in rows]
+
+        # Pass/fail of every check (null where it was not needed)
+        for check in checks:
+            columns["passed:" + check] = [
+                row["checks"][check]["passed"] if check in row["checks"]
+                else None
+                for row in rows
+            ]
+
+        table = pyarrow.table(columns)
+        pyarrow.parquet.write_table(table, filename)
+
+
+sinks = {
+    ".csv": CSVSink,
+    ".jsonl": JSONLinesSink,
+    ".parquet": ParquetSink,
+}
+
+
+def open_sink(filename, interval = 1.0):
+
+    extension = os.path.splitext(filename)[1].lower()
+
+    if extension not in sinks:
+        msg = "Result output must be a .csv, .jsonl or .parquet file: {}"
+        raise SinkError({"message": msg.format(filename)})
+
+    return sinks[extension](filename, interval)
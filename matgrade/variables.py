@@ -0,0 +1,121 @@
+import hashlib
+import os
+import threading
+
+
+class VariableError(Exception):
+    pass
+
+
+def quote(text):
+
+    return "'{}'".format(text.replace("'", "''"))
+
+
+class FileVariable:
+    """ Variable read from a .mat or .npy file instead of a MATLAB expression.
+
+    .mat files are loaded by the engine itself. .npy files are memory-mapped
+    once and converted by the backend (from the array buffer where MATLAB
+    supports it), then assigned to every engine without further copies.
+    """
+
+    def __init__(self, filename, field = None):
+
+        self.filename = os.path.abspath(filename)
+        self.extension = os.path.splitext(filename)[1].lower()
+
+        # Name of the variable within a .mat file (defaults to the name the
+        # variable is defined as)
+        self.field = field
+
+        if self.extension not in (".mat", ".npy"):
+            msg = "Variable files must be .mat or .npy files: {}"
+            raise VariableError({"message": msg.format(filename)})
+
+        # File contents are part of cache fingerprints
+        digest = hashlib.sha256()
+
+        try:
+            f = open(self.filename, "rb")
+        except OSError:
+            msg = "Could not open variable file: {}"
+            raise VariableError({"message": msg.format(filename)})
+
+        with f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+
+        self.digest = digest.hexdigest()
+
+        self.array = None
+        self.converted = {}
+        self.lock = threading.Lock()
+
+    def __str__(self):
+
+        return "file({}, {})".format(self.digest, self.field or "")
+
+    def load(self):
+
+        import numpy as np
+
+        try:
+            return np.load(self.filename, mmap_mode = "r", allow_pickle = False)
+        except ValueError:
+            msg = "Variable file does not hold a numeric array: {}"
+            raise VariableError({"message": msg.format(self.filename)})
+
+    def define(self, engine, name):
+
+        if self.extension == ".mat":
+
+            field = quote(self.field or name)
+            command = "{} = getfield(load({}, {}), {});".format(
+                name, quote(self.filename), field, field
+            )
+
+            engine.eval(command, nargout = 0)
+            return
+
+        # Converted once per kind of backend (e.g. for every pool worker)
+        with self.lock:
+
+            if self.array is None:
+                self.array = self.load()
+
+            kind = type(engine)
+            if kind not in self.converted:
+                self.converted[kind] = engine.convert(self.array)
+
+            value = self.converted[kind]
+
+        engine.workspace[name] = value
+
+
+def variable(source):
+
+    # Variables are MATLAB expressions or {file: ..., name: ...} mappings
+    # (or file variables already opened, e.g. when validating a lab)
+    if isinstance(source, FileVariable):
+        return source
+
+    if isinstance(source, dict):
+
+        if "file" not in source:
+            msg = "File variables must define a file (got {})"
+            raise VariableError({"message": msg.format(source)})
+
+        return FileVariable(source["file"], source.get("name"))
+
+    return str(source)
+
+
+def define_variable(engine, name, source):
+
+    # Expressions are assigned within the engine, so values are not copied
+    # through Python
+    if isinstance(source, str):
+        engine.eval("{} = {};".format(name, source), nargout = 0)
+    else:
+        source.define(engine, name)
@@ -0,0 +1,133 @@
+import os
+import time
+
+
+#------------------------------------------------------------------------------
+# Detecting changes
+
+class Watcher:
+    """ Reports names of files created, changed or removed in a folder.
+
+    Uses inotify (via the optional inotify_simple package) where available
+    and falls back to comparing folder listings every interval seconds.
+    Hidden files (e.g. generated code and the result cache) are ignored.
+    """
+
+    def __init__(self, path, interval = 1.0, debounce = 2.0, max_delay = 30.0,
+                 polling = False):
+
+        self.path = path
+        self.interval = interval
+
+        # Changes are collected until the folder is quiet for debounce
+        # seconds (but for no longer than max_delay seconds)
+        self.debounce = debounce
+        self.max_delay = max_delay
+
+        self.inotify = None
+
+        if not polling:
+            try:
+                from inotify_simple import INotify, flags
+            except ImportError:
+                pass
+            else:
+                self.inotify = INotify()
+                self.inotify.add_watch(
+                    path, flags.CLOSE_WRITE | flags.MOVED_TO | flags.DELETE |
+                    flags.MOVED_FROM
+                )
+
+        self.snapshot = self.scan()
+
+    def scan(self):
+
+        snapshot = {}
+
+        for entry in os.scandir(self.path):
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+
+            stat = entry.stat()
+            snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+
+        return snapshot
+
+    def poll(self, timeout):
+
+        # Names changed since the last call (waiting up to timeout seconds)
+        if self.inotify is not None:
+
+            events = self.inotify.read(timeout = int(timeout*1000))
+
+            return set(
+                e.name for e in events
+                if e.name != "" and not e.name.startswith(".")
+            )
+
+        time.sleep(timeout)
+
+        previous = self.snapshot
+        self.snapshot = self.scan()
+
+        names = set(previous) | set(self.snapshot)
+
+        return set(n for n in names if previous.get(n) != self.snapshot.get(n))
+
+    def wait(self):
+
+        # Blocks until something changes and the folder has settled
+        changed = set()
+
+        while len(changed) == 0:
+            changed = self.poll(self.interval)
+
+        start = time.monotonic()
+
+        while time.monotonic() - start < self.max_delay:
+
+            more = self.poll(self.debounce)
+            if len(more) == 0:
+                break
+
+            changed |= more
+
+        return changed
+
+    def close(self):
+
+        if self.inotify is not None:
+            self.inotify.close()
+
+
+#------------------------------------------------------------------------------
+# Regrading
+
+def watch(assessment, filename, watcher, limit = 50, rounds = None):
+
+    # Students with new submissions are queued and graded at most limit at a
+    # time, so a bulk upload is worked through without rescanning in between
+    pending = set()
+    count = 0
+
+    while rounds is None or count < rounds:
+
+        if len(pending) == 0:
+            changes = watcher.wait()
+        else:
+            changes = watcher.poll(0)
+
+        if len(changes) > 0:
+            pending |= assessment.update(changes)
+
+        if len(pending) == 0:
+            continue
+
+        students = set(sorted(pending)[:limit])
+        pending -= students
+
+        assessment.grade(filename, students)
+        count += 1
+
+        msg = "Regraded {} student(s) ({} pending)"
+        print(msg.format(len(students), len(pending)))
@@ -0,0 +1,147 @@
+import threading
+import warnings
+
+
+class EngineError(Exception):
+    pass
+
+
+class Interrupted(Exception):
+    """ Raised by calls abandoned through Watchdog.interrupt()."""
+    pass
+
+
+class Watchdog:
+
+    def __init__(self, timeout = 0.5, grace = 2.0, probe = 5.0, restart = None):
+
+        # Default deadline for a single call (seconds)
+        self.timeout = timeout
+
+        # How long to wait for the engine to acknowledge a cancellation
+        self.grace = grace
+
+        # Deadline for the trivial call used to check engine health
+        self.probe_timeout = probe
+
+        # Optional callable used to replace an unresponsive engine
+        self.restart = restart
+
+        self.timeouts = 0
+        self.restarts = 0
+
+        # Engine and future being waited on (cancelled when interrupted from
+        # elsewhere)
+        self.current = None
+        self.interrupted = False
+        self.lock = threading.Lock()
+
+    #--------------------------------------------------------------------------
+    # Waiting on futures
+
+    def wait(self, engine, future, timeout = None):
+
+        if timeout is None:
+            timeout = self.timeout
+
+        with self.lock:
+            interrupted = self.interrupted
+            if not interrupted:
+                self.current = (engine, future)
+
+        if interrupted:
+            engine.cancel(future)
+            raise Interrupted
+
+        # Blocking wait with a deadline (no polling)
+        try:
+            return future.result(timeout = timeout)
+        except Exception as e:
+            if self.interrupted:
+                raise Interrupted
+            if not self.expired(e, future):
+                raise
+        finally:
+            with self.lock:
+                self.current = None
+
+        self.timeouts += 1
+        self.recover(engine, future)
+
+        raise TimeoutError
+
+    def expired(self, error, future):
+
+        # MATLAB futures signal an elapsed deadline with TimeoutError, but the
+        # future itself is the more reliable source of truth (unless the
+        # engine is gone altogether)
+        if isinstance(error, EngineError):
+            return False
+
+        return isinstance(error, TimeoutError) or not future.done()
+
+    #--------------------------------------------------------------------------
+    # Cancellation and recovery
+
+    def interrupt(self):
+
+        # Cancels the call being waited on (and any later one) from another
+        # thread, until resume() is called
+        with self.lock:
+            self.interrupted = True
+            current = self.current
+
+        if current is not None:
+            engine, future = current
+            engine.cancel(future)
+
+    def resume(self):
+
+        with self.lock:
+            self.interrupted = False
+
+    def cancel(self, engine, future):
+
+        engine.cancel(future)
+
+        # Block until the engine confirms the cancellation instead of sleeping
+        # for a fixed amount of time
+        try:
+            future.result(timeout = self.grace)
+        except Exception as e:
+            if self.expired(e, future):
+                return False
+
+        return True
+
+    def probe(self, engine):
+
+        try:
+            future = engine.eval("1;", nargout = 0, background = True)
+            future.result(timeout = self.probe_timeout)
+        except Exception:
+            return False
+
+        return True
+
+    def recover(self, engine, future):
+
+        if self.cancel(engine, future) and self.probe(engine):
+            return
+
+        if self.restart is None:
+            msg = "MATLAB engine did not recover from a cancelled call."
+            warnings.warn(msg)
+            return
+
+        try:
+            self.restart()
+        except Exception as e:
+            msg = "Could not restart MATLAB engine: {}"
+            raise EngineError({"message": msg.format(e)})
+
+        self.restarts += 1
+
+
+# Shared instance for calls made without an explicit watchdog
+default_watchdog = Watchdog()
@@ -0,0 +1,104 @@
+import pytest
+import os
+import re
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+from matgrade.backends import FakeBackend, Hang
+
+
+def resolve(name, paths):
+    """ Returns the constant assigned to "z" in the called m file."""
+
+    for path in paths:
+
+        filename = os.path.join(path, name + ".m")
+
+        if os.path.exists(filename):
+            break
+    else:
+        return None
+
+    with open(filename) as f:
+        value = float(re.search(r"z = (\d+)", f.read()).group(1))
+
+    return lambda *arguments: value
+
+
+class FakeEngine(FakeBackend):
+
+    def __init__(self):
+
+        super().__init__(resolver = resolve)
+        self.commands = []
+
+    def execute(self, command, nargout):
+
+        if not command.startswith("addpath"):
+            self.commands.append(command)
+
+        return super().execute(command, nargout)
+
+
+class HangingEngine(FakeEngine):
+
+    def __init__(self):
+
+        super().__init__()
+
+        # Submissions returning 9 never finish
+        def hanging(name, paths):
+
+            function = resolve(name, paths)
+            if function is None or function() != 9:
+                return function
+
+            def hang(*arguments):
+                raise Hang
+
+            return hang
+
+        self.resolver = hanging
+
+
+def write_lab(path, submissions):
+
+    with open(os.path.join(path, "f.m"), "w") as f:
+        f.write("function z = f(x)\nz = 1\nend\n")
+
+    folder = os.path.join(path, "submissions")
+    os.mkdir(folder)
+
+    for student, (function, value) in submissions.items():
+
+        filename = "1-1 - {} - Oct 3, 2021 1123 PM-{}".format(
+            student, function
+        )
+
+        with open(os.path.join(folder, filename), "w") as f:
+            f.write("% Comment\nfunction z = f(x)\nz = {}\nend\n".format(value))
+
+    return "f.m", "submissions"
+
+
+def read_grades(filename):
+
+    with open(filename) as f:
+        lines = [line.strip().split(",") for line in f]
+
+    return {line[0]: line[1:] for line in lines}
+
+
+@pytest.fixture
+def fake_engines():
+    """ Factory of FakeEngines, along with the engines it created."""
+
+    engines = []
+
+    def factory():
+        engines.append(FakeEngine())
+        return engines[-1]
+
+    return factory, engines
@@ -0,0 +1,101 @@
+import pytest
+import asyncio
+import os
+import time
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+from matgrade import Assessment, AssessmentError, AsyncAssessment
+
+from conftest import HangingEngine, read_grades, write_lab
+
+
+@pytest.fixture
+def lab(tmp_path):
+
+    os.chdir(str(tmp_path))
+
+    write_lab(str(tmp_path), {
+        "Student {}".format(i): ("f.m", 9 if i == 0 else 2 - i % 2)
+        for i in range(6)
+    })
+
+    # Long enough that only cancellation can end the hanging call
+    assessment = Assessment(
+        "f.m", "submissions", timeout = 30, factory = HangingEngine
+    )
+    assessment.add_value_check("a", ["'a'"], 0.01, False, 1)
+    assessment.add_graded_component("a", ["a"], "and", 10)
+
+    return assessment
+
+
+def test_grade(lab):
+    """ Students are yielded as they complete, and grades written. """
+
+    students = ["Student {}".format(i) for i in range(1, 6)]
+
+    async def grade():
+
+        async with AsyncAssessment(lab, engines = 2) as grader:
+
+            completed = [s async for s, _ in grader.as_completed(students)]
+            results = await grader.grade_student("Student 1")
+
+            await grader.grade("grades.csv", students)
+
+        return completed, results
+
+    completed, results = asyncio.run(grade())
+
+    assert sorted(completed) == students
+    assert results == {"a": True}
+
+    grades = read_grades("grades.csv")
+
+    assert grades["Student 1"] == ["10", "10"]
+    assert grades["Student 2"] == ["0", "0"]
+    assert "Student 0" not in grades
+
+
+def test_cancel(lab):
+    """ Cancelling a student cancels its engine call and frees the engine. """
+
+    async def grade():
+
+        async with AsyncAssessment(lab, engines = 1) as grader:
+
+            task = asyncio.ensure_future(grader.grade_student("Student 0"))
+            await asyncio.sleep(0.2)
+
+            start = time.monotonic()
+            task.cancel()
+
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+            elapsed = time.monotonic() - start
+
+            # The single engine is available again
+            results = await grader.grade_student("Student 1")
+
+        return elapsed, results
+
+    elapsed, results = asyncio.run(grade())
+
+    assert elapsed < 5
+    assert results == {"a": True}
+    assert "Student 0" not in lab.results
+
+
+def test_unknown_student(lab):
+    """ Only students with submissions can be graded. """
+
+    async def grade():
+        async with AsyncAssessment(lab) as grader:
+            await grader.grade_student("Student X")
+
+    with pytest.raises(AssessmentError):
+        asyncio.run(grade())
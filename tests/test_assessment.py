@@ -0,0 +1,271 @@
+import pytest
+import os
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+from matgrade import Assessment, AssessmentError
+
+from conftest import FakeEngine, read_grades, write_lab
+
+
+@pytest.fixture
+def lab(tmp_path, fake_engines):
+
+    factory, engines = fake_engines
+
+    os.chdir(str(tmp_path))
+
+    solution, submissions = write_lab(str(tmp_path), {
+        "Student A": ("f.m", 1),
+        "Student B": ("f.m", 2),
+        "Student C": ("g.m", 1),
+    })
+
+    assessment = Assessment(solution, submissions, factory = factory)
+    assessment.add_value_check("a", ["'a'"], 0.01, False, 1)
+    assessment.add_value_check("b", ["'b'"], 0.01, False, 1)
+
+    return assessment, engines[0]
+
+
+#------------------------------------------------------------------------------
+# Graded components
+
+def test_or_short_circuit(lab):
+    """ "or" components should stop at the first passing check."""
+
+    assessment, engine = lab
+    assessment.add_graded_component("a / b", ["a", "b"], "or", 10)
+    assessment.grade("grades.csv")
+
+    calls = [c for c in engine.commands if not c.startswith("sol")]
+    grades = read_grades("grades.csv")
+
+    # Passing students skip "b", failing ones have to try it
+    assert len([c for c in calls if "'b'" in c]) == 1
+    assert grades["Student A"] == ["10", "10"]
+    assert grades["Student B"] == ["0", "0"]
+
+
+def test_and_short_circuit(lab):
+    """ "and" components should stop at the first failing check."""
+
+    assessment, engine = lab
+    assessment.add_graded_component("name + a", ["name", "a"], "and", 10)
+    assessment.grade("grades.csv")
+
+    calls = [c for c in engine.commands if not c.startswith("sol")]
+    grades = read_grades("grades.csv")
+
+    # Student C fails the name check and is never run
+    assert len(calls) == 2
+    assert grades["Student C"] == ["0", "0"]
+    assert grades["Student A"] == ["10", "10"]
+
+
+def test_shared_checks(lab):
+    """ Checks shared between components should only be evaluated once."""
+
+    assessment, engine = lab
+    assessment.add_graded_component("a", ["a"], "and", 10)
+    assessment.add_graded_component("a + b", ["a", "b"], "and", 10)
+    assessment.cache.clear()
+    assessment.grade("grades.csv")
+
+    # One call per distinct submission (A and C share the same code)
+    calls = [c for c in engine.commands if not c.startswith("sol")]
+    assert len([c for c in calls if "'a'" in c]) == 2
+
+
+def test_combination(lab):
+    """ Only "and"/"or" combinations should be accepted."""
+
+    assessment, engine = lab
+
+    with pytest.raises(AssessmentError):
+        assessment.add_graded_component("a ? b", ["a", "b"], "xor", 10)
+
+
+def test_batch(tmp_path):
+    """ Batch mode should make each student's calls in one round-trip."""
+
+    os.chdir(str(tmp_path))
+
+    solution, submissions = write_lab(str(tmp_path), {
+        "Student A": ("f.m", 1),
+        "Student B": ("f.m", 2),
+        "Student C": ("g.m", 1),
+    })
+
+    assessment = Assessment(
+        solution, submissions, factory = FakeEngine, batch = True
+    )
+    assessment.add_value_check("a", ["'a'"], 0.01, False, 1)
+    assessment.add_value_check("b", ["'b'"], 0.01, False, 1)
+    assessment.add_graded_component("name + a", ["name", "a"], "and", 10)
+    assessment.add_graded_component("b", ["b"], "and", 5)
+    assessment.grade("grades.csv")
+
+    grades = read_grades("grades.csv")
+
+    assert grades["Student A"] == ["10", "5", "15"]
+    assert grades["Student B"] == ["0", "0", "0"]
+    assert grades["Student C"] == ["0", "5", "5"]
+
+
+#------------------------------------------------------------------------------
+# Identical submissions
+
+def test_duplicates(tmp_path, fake_engines):
+    """ Identical submissions should be written and run only once."""
+
+    factory, engines = fake_engines
+
+    os.chdir(str(tmp_path))
+
+    solution, submissions = write_lab(str(tmp_path), {
+        "Student A": ("f.m", 1),
+        "Student B": ("f.m", 1),
+        "Student C": ("g.m", 1),
+        "Student D": ("f.m", 2),
+    })
+
+    assessment = Assessment(solution, submissions, factory = factory)
+    assessment.add_value_check("a", ["'a'"], 0.01, False, 1)
+    assessment.add_graded_component("name + a", ["name", "a"], "and", 10)
+    assessment.grade("grades.csv")
+
+    assert assessment.duplicates == 1
+    assert len(os.listdir(os.path.join(submissions, ".code"))) == 4
+
+    calls = [c for c in engines[0].commands if not c.startswith("sol")]
+    grades = read_grades("grades.csv")
+
+    # Student C fails the name check despite sharing code with A and B
+    assert len(calls) == 2
+    assert grades["Student A"] == ["10", "10"]
+    assert grades["Student B"] == ["10", "10"]
+    assert grades["Student C"] == ["0", "0"]
+    assert grades["Student D"] == ["0", "0"]
+
+
+#------------------------------------------------------------------------------
+# Timeout calibration
+
+def test_calibrated_timeouts(lab):
+    """ Check timeouts should scale with (clamped) solution run times."""
+
+    assessment, engine = lab
+    assessment.calibrate(factor = 5, minimum = 0.01, maximum = 1.0)
+
+    engine.latency = 0.02
+    assessment.add_value_check("slow", ["'c'"], 0.01, False, 1)
+    assessment.add_value_check("fixed", ["'d'"], 0.01, False, 1, 0.3)
+
+    engine.latency = 0.0
+    assessment.add_error_check("fast", ["'e'"])
+
+    calibrated = assessment.calibrated
+
+    # Rounded up to 0.1/0.2 depending on call overhead
+    assert calibrated["slow"]["solution_time"] >= 0.02
+    assert calibrated["slow"]["timeout"] in (0.1, 0.2)
+    assert assessment.checks["slow"].timeout == calibrated["slow"]["timeout"]
+
+    # Explicit timeouts are kept and fast solutions hit the minimum
+    assert "fixed" not in calibrated
+    assert assessment.checks["fixed"].timeout == 0.3
+    assert assessment.checks["fast"].timeout == 0.01
+
+
+def test_invalid_calibration(lab):
+    """ Calibration bounds should be validated."""
+
+    assessment, _ = lab
+
+    with pytest.raises(AssessmentError):
+        assessment.calibrate(minimum = 1.0, maximum = 0.5)
+
+
+#------------------------------------------------------------------------------
+# Generated code
+
+def test_incremental_code(lab, tmp_path):
+    """ Re-runs should keep call names and only rewrite changed files."""
+
+    assessment, _ = lab
+    calls = dict(assessment.calls)
+
+    # Nothing changes on a second run
+    again = Assessment("f.m", "submissions", factory = FakeEngine)
+    assert again.touched == []
+    assert again.calls == calls
+
+    # A new submission only adds its own function
+    filename = "1-1 - Student D - Oct 3, 2021 1123 PM-f.m"
+    with open(str(tmp_path / "submissions" / filename), "w") as f:
+        f.write("function z = f(x)\nz = 4\nend\n")
+
+    again = Assessment("f.m", "submissions", factory = FakeEngine)
+    assert again.touched == [again.calls["Student D"]]
+    assert all(again.calls[s] == c for s, c in calls.items())
+
+    # Changed functions are replaced and cleared from running engines
+    old = again.calls["Student D"]
+    again.submissions["Student D"] = "function z = f(x)\nz = 5\nend\n"
+    again.group_submissions()
+
+    touched = again.write_code()
+    new = again.calls["Student D"]
+
+    assert sorted(touched) == sorted([old, new])
+    assert again.engine.commands[-1] == "clear " + " ".join(touched)
+    assert not os.path.exists(
+        str(tmp_path / "submissions" / ".code" / (old + ".m"))
+    )
+
+
+#------------------------------------------------------------------------------
+# Variables
+
+def test_variables(lab, tmp_path):
+    """ Variables are defined in the engine, from expressions or files."""
+
+    import numpy as np
+
+    assessment, engine = lab
+    np.save(str(tmp_path / "data.npy"), np.arange(6.0).reshape(2, 3))
+
+    assessment.add_variable("x", "[1, 2]")
+    assessment.add_variable("y", {"file": "data.npy"})
+
+    assert "x = [1, 2]" in engine.commands
+    assert engine.workspace["x"].tolist() == [[1, 2]]
+    assert engine.workspace["y"].tolist() == [[0, 1, 2], [3, 4, 5]]
+
+    # .mat files are loaded by the engine itself
+    with open(str(tmp_path / "data.mat"), "wb") as f:
+        f.write(b"MATLAB")
+
+    with pytest.raises(AssessmentError):
+        assessment.add_variable("z", {"file": "data.mat", "name": "w"})
+
+    command = "z = getfield(load('{}', 'w'), 'w')"
+    assert command.format(tmp_path / "data.mat") in engine.commands
+
+    with pytest.raises(AssessmentError):
+        assessment.add_variable("w", {"file": "data.txt"})
+
+    # Restarted engines get the same variables (and file contents are part
+    # of the cache fingerprint)
+    fingerprint = assessment.cache.fingerprint
+    assessment.restart_engine()
+
+    assert engine.workspace["y"].shape == (2, 3)
+
+    np.save(str(tmp_path / "data.npy"), np.zeros(2))
+    assessment.add_variable("y", {"file": "data.npy"})
+
+    assert assessment.cache.fingerprint != fingerprint
@@ -0,0 +1,197 @@
+import pytest
+import os
+import time
+
+import numpy as np
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+from matgrade import parser, run
+from matgrade.backends import ExecutionError, FakeBackend, Hang
+from matgrade.backends import IsolatedBackend
+from matgrade.batch import run_batch
+from matgrade.cache import CallCache
+from matgrade.checks import ErrorCheck, ShapeCheck, ValueCheck
+from matgrade.misc import run_matlab_function, setup_engine
+from matgrade.watchdog import Watchdog
+
+from conftest import FakeEngine, read_grades, write_lab
+
+
+LAB = """solution: f.m
+submissions: submissions
+
+variables:
+  x: "[1, 2]"
+
+checks:
+  absolute_value:
+    a: [["'a'"], 0.01]
+
+---
+
+checks: a
+grade: 10
+"""
+
+
+def plus_or_minus(x, y, op):
+
+    if op == "plus":
+        return x + y
+    elif op == "minus":
+        return x - y
+    elif op == "both":
+        return x + y, x - y
+    elif op == "loop":
+        raise Hang
+    else:
+        raise ExecutionError("Error using sub0 (line 11)\\nInvalid operation")
+
+
+#------------------------------------------------------------------------------
+# FakeBackend
+
+def test_fake_literals():
+    """ Variables, strings, numbers and matrices should be parsed."""
+
+    engine = FakeBackend()
+    setup_engine(engine, "/code", [("x", "[1, 2; 3, 4]")])
+
+    assert engine.paths == ["/code"]
+    assert engine.workspace["x"].shape == (2, 2)
+    assert engine.eval("'it''s'") == "it's"
+    assert engine.eval("2.5") == 2.5
+
+    with pytest.raises(ExecutionError):
+        engine.eval("y")
+
+
+def test_fake_calls():
+    """ Calls should be mapped to callables with nargout handling."""
+
+    engine = FakeBackend({"f": plus_or_minus})
+    engine.workspace["x"] = np.array([[1.0, 1.0]])
+
+    assert run_matlab_function("f", ["200", "100", "'plus'"], 1, engine) == 300
+    assert run_matlab_function("f", ["2", "1", "'both'"], 2, engine) == 1
+
+    value = run_matlab_function("f", ["x", "x", "'plus'"], 1, engine)
+    assert value.tolist() == [[2.0, 2.0]]
+
+    with pytest.raises(ExecutionError, match = "line 11"):
+        run_matlab_function("f", ["1", "1", "'times'"], 1, engine)
+
+    with pytest.raises(ExecutionError, match = "output arguments"):
+        run_matlab_function("f", ["1", "1", "'plus'"], 2, engine)
+
+    assert engine.calls == 5
+
+
+def test_fake_hang():
+    """ Hanging calls should time out and be cancelled."""
+
+    engine = FakeBackend({"f": plus_or_minus})
+    watchdog = Watchdog(timeout = 0.05)
+
+    with pytest.raises(TimeoutError):
+        run_matlab_function("f", ["1", "1", "'loop'"], 1, engine, None, watchdog)
+
+    assert watchdog.timeouts == 1
+    assert watchdog.restarts == 0
+
+
+def test_fake_latency():
+    """ Calls should take (at least) the simulated latency."""
+
+    engine = FakeBackend({"f": plus_or_minus}, latency = 0.05)
+
+    start = time.perf_counter()
+    run_matlab_function("f", ["1", "1", "'plus'"], 1, engine)
+    assert time.perf_counter() - start >= 0.05
+
+    with pytest.raises(TimeoutError):
+        run_matlab_function("f", ["1", "1", "'plus'"], 1, engine, 0.01,
+                            Watchdog())
+
+
+def test_fake_restart():
+    """ Restarting should clear the workspace and path."""
+
+    engine = FakeBackend()
+    setup_engine(engine, "/code", [("x", "1")])
+    engine.restart()
+
+    assert engine.restarts == 1
+    assert engine.paths == []
+    assert engine.workspace == {}
+
+
+def test_fake_batch():
+    """ The batch harness should behave like individual calls."""
+
+    engine = FakeBackend({"sub0": plus_or_minus})
+    engine.workspace["x"] = 1.0
+    cache = CallCache()
+
+    checks = [
+        ShapeCheck(["x", "x", "'both'"], 1.0, 2, engine, cache = cache),
+        ValueCheck(["200", "100", "'minus'"], 100.0, 0.01, True, 1, engine,
+                   cache = cache),
+        ErrorCheck(["1", "1", "'times'"], engine, cache = cache),
+    ]
+
+    assert run_batch("sub0", checks, cache) == 3
+    assert engine.calls == 1
+
+    code = "\n".join("error(" if i == 9 else "" for i in range(12))
+
+    assert checks[0].evaluate("A", "sub0", "")
+    assert checks[1].evaluate("A", "sub0", "")
+    assert checks[2].evaluate("A", "sub0", code)
+    assert engine.calls == 1
+
+
+def test_isolated():
+    """ Borrowed backends should be handed back as they were found."""
+
+    engine = FakeBackend()
+    engine.eval("addpath('/base')", nargout = 0)
+    engine.workspace["y"] = 1.0
+
+    borrowed = IsolatedBackend(engine)
+    setup_engine(borrowed, "/code", [("x", "[1, 2]")])
+    borrowed.workspace["y"] = 2.0
+
+    assert engine.paths == ["/base", "/code"]
+
+    borrowed.quit()
+
+    # Paths and new variables are reverted (existing ones are kept)
+    assert engine.paths == ["/base"]
+    assert list(engine.workspace) == ["y"]
+    assert engine.restarts == 0
+
+
+def test_isolated_run(tmp_path):
+    """ Grading through borrowed backends should restore them when done."""
+
+    os.chdir(str(tmp_path))
+    write_lab(str(tmp_path), {"Student A": ("f.m", 1)})
+
+    with open("lab.yaml", "w") as f:
+        f.write(LAB)
+
+    shared = FakeEngine()
+    shared.eval("addpath('/base')", nargout = 0)
+    shared.workspace["y"] = 1.0
+
+    args = parser.parse_args(["lab.yaml", "--no-cache", "--workers", "2"])
+    run(args, lambda: IsolatedBackend(shared))
+
+    assert read_grades("grades.csv")["Student A"] == ["10", "10"]
+    assert shared.paths == ["/base"]
+    assert list(shared.workspace) == ["y"]
+
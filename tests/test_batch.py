@@ -0,0 +1,124 @@
+import pytest
+import time
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+from matgrade.backends import ExecutionError, FakeBackend, Hang
+from matgrade.batch import run_batch
+from matgrade.cache import CallCache
+from matgrade.checks import ErrorCheck, ShapeCheck, ValueCheck
+from matgrade.watchdog import Watchdog
+
+
+def submission(hang = False):
+
+    # Both outputs for "both", x + 1 for "plus" (optionally hanging) and an
+    # error on line 5 otherwise
+    def sub0(x, op = "oops"):
+
+        if op == "both":
+            return x + 1, x
+        elif op == "plus" and hang:
+            raise Hang
+        elif op == "plus":
+            return x + 1
+
+        raise ExecutionError("Invalid operation (line 5)")
+
+    engine = FakeBackend({"sub0": sub0})
+    engine.workspace["x"] = 1.0
+
+    return engine
+
+
+def make_checks(engine, cache):
+
+    watchdog = Watchdog(timeout = 0.05)
+
+    return [
+        ShapeCheck(["x", "'both'"], 1.0, 2, engine, None, watchdog, cache),
+        ValueCheck(["x", "'both'"], 1.0, 0.1, False, 2, engine, None,
+                   watchdog, cache),
+        ValueCheck(["1", "'plus'"], 1.0, 0.1, False, 1, engine, None,
+                   watchdog, cache),
+        ErrorCheck(["1", "'oops'"], engine, None, watchdog, cache),
+    ]
+
+
+#------------------------------------------------------------------------------
+# Batched execution
+
+def test_batch_single_call():
+    """ All unique calls should be made in a single harness call."""
+
+    cache = CallCache()
+    engine = submission()
+    checks = make_checks(engine, cache)
+
+    assert run_batch("sub0", checks, cache) == 3
+    assert engine.calls == 1
+
+    # Checks should now be evaluated from the cache alone
+    assert checks[0].evaluate("A", "sub0", "")
+    assert checks[1].evaluate("A", "sub0", "")
+    assert not checks[2].evaluate("A", "sub0", "")
+    assert checks[3].evaluate("A", "sub0", "\n\n\nerror('Invalid')\n")
+
+    assert engine.calls == 1
+    assert cache.hits == 4
+
+
+def test_batch_errors():
+    """ Harness errors should be re-raised with their line number."""
+
+    cache = CallCache()
+    engine = submission()
+    check = ErrorCheck(["1"], engine, cache = cache)
+
+    run_batch("sub0", [check], cache)
+
+    with pytest.raises(ExecutionError, match = "line 5"):
+        cache.run(cache.key("sub0", ["1"], 1), None)
+
+
+def test_batch_slow_call():
+    """ Calls exceeding their own timeout should count as timeouts."""
+
+    def slow(x):
+        time.sleep(0.1)
+        return x
+
+    cache = CallCache()
+    engine = FakeBackend({"sub0": slow})
+    check = ShapeCheck(["1"], 1.0, 1, engine, 0.05, None, cache)
+
+    run_batch("sub0", [check], cache)
+
+    assert not check.evaluate("A", "sub0", "")
+
+    # A check allowing the call longer should run it again
+    longer = ShapeCheck(["1"], 1.0, 1, engine, 2.0, None, cache)
+
+    assert run_batch("sub0", [check, longer], cache) == 1
+    assert engine.calls == 2
+    assert longer.evaluate("A", "sub0", "")
+
+
+def test_batch_timeout():
+    """ Partial results should be kept when the harness is cancelled."""
+
+    cache = CallCache()
+    engine = submission(hang = True)
+    checks = make_checks(engine, cache)
+
+    assert run_batch("sub0", checks, cache) == 2
+
+    # First call completed, second was running and the third never started
+    assert cache.key("sub0", ["x", "'both'"], 2) in cache.entries
+
+    with pytest.raises(TimeoutError):
+        cache.run(cache.key("sub0", ["1", "'plus'"], 1), None)
+
+    assert cache.key("sub0", ["1", "'oops'"], 1) not in cache.entries
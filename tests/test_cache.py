@@ -0,0 +1,210 @@
+import pytest
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+from matgrade.backends import ExecutionError, FakeBackend, Hang
+from matgrade.cache import CallCache
+from matgrade.misc import run_matlab_function
+from matgrade.watchdog import Watchdog
+
+
+def backend():
+
+    # f returns its call as text (and 1 as a second output), bad errors and
+    # slow never returns, with every call recorded
+    calls = []
+
+    def f(*arguments):
+        call = "f({})".format(", ".join("{:g}".format(a) for a in arguments))
+        calls.append(call)
+        return call, 1
+
+    def bad():
+        calls.append("bad()")
+        raise ExecutionError("Error (line 3)")
+
+    def slow():
+        calls.append("slow()")
+        raise Hang
+
+    engine = FakeBackend({"f": f, "bad": bad, "slow": slow})
+    engine.workspace["x"] = 1.0
+
+    return engine, calls
+
+
+#------------------------------------------------------------------------------
+# CallCache
+
+def test_cache_hits():
+    """ Identical calls should only reach the engine once."""
+
+    engine, calls = backend()
+    cache = CallCache()
+
+    for i in range(3):
+        value = run_matlab_function("f", ["1", "2"], 1, engine, cache = cache)
+        assert value == "f(1, 2)"
+
+    assert calls == ["f(1, 2)"]
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_cache_keys():
+    """ Different arguments or nargout should be cached separately."""
+
+    engine, calls = backend()
+    cache = CallCache()
+
+    run_matlab_function("f", ["1"], 1, engine, cache = cache)
+    run_matlab_function("f", ["2"], 1, engine, cache = cache)
+    assert run_matlab_function("f", ["1"], 2, engine, cache = cache) == 1
+
+    assert len(calls) == 3
+    assert len(cache) == 3
+
+
+def test_cache_variables():
+    """ Changing workspace variables should invalidate cached calls."""
+
+    engine, calls = backend()
+    cache = CallCache([("x", "1")])
+    run_matlab_function("f", ["x"], 1, engine, cache = cache)
+
+    cache.fingerprint = CallCache([("x", "2")]).fingerprint
+    run_matlab_function("f", ["x"], 1, engine, cache = cache)
+
+    assert cache.misses == 2
+
+
+def test_cache_errors():
+    """ Errors should be cached and re-raised on every hit."""
+
+    engine, calls = backend()
+    cache = CallCache()
+
+    for i in range(2):
+        with pytest.raises(ExecutionError):
+            run_matlab_function("bad", [], 1, engine, cache = cache)
+
+    assert calls == ["bad()"]
+
+
+def test_cache_timeouts():
+    """ Timeouts should be cached so hanging calls only run once."""
+
+    engine, calls = backend()
+    cache = CallCache()
+    watchdog = Watchdog(timeout = 0.01)
+
+    for i in range(2):
+        with pytest.raises(TimeoutError):
+            run_matlab_function("slow", [], 1, engine, None, watchdog, cache)
+
+    assert calls == ["slow()"]
+    assert watchdog.timeouts == 1
+
+
+def test_cache_longer_timeouts():
+    """ Timeouts should only be reused for calls with no longer deadline."""
+
+    calls = []
+
+    def f():
+        calls.append(1)
+        return 1
+
+    engine = FakeBackend({"f": f}, latency = 0.3)
+    cache = CallCache()
+
+    with pytest.raises(TimeoutError):
+        run_matlab_function("f", [], 1, engine, 0.1, cache = cache)
+
+    with pytest.raises(TimeoutError):
+        run_matlab_function("f", [], 1, engine, 0.05, cache = cache)
+
+    assert len(calls) == 1
+
+    value = run_matlab_function("f", [], 1, engine, 2.0, cache = cache)
+    assert value == 1
+    assert len(calls) == 2
+
+    # Results (unlike timeouts) hold for any deadline
+    assert run_matlab_function("f", [], 1, engine, 0.1, cache = cache) == 1
+    assert len(calls) == 2
+
+
+#------------------------------------------------------------------------------
+# ResultCache
+
+from matgrade.cache import ResultCache
+
+
+def test_results_persist(tmp_path):
+    """ Results should survive closing and reopening the cache."""
+
+    filename = str(tmp_path / "cache.sqlite")
+
+    cache = ResultCache(filename)
+    key = cache.key("z = x + y", "[\"shape\"]", "sol", "vars")
+    assert cache.get(key) is None
+
+    cache.put(key, True)
+    cache.close()
+
+    cache = ResultCache(filename)
+    assert cache.get(key) is True
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_results_keys(tmp_path):
+    """ Keys should change with code, check, solution and variables."""
+
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+    key = cache.key("code", "spec", "sol", "vars")
+
+    assert key == cache.key("code", "spec", "sol", "vars")
+    assert key != cache.key("code2", "spec", "sol", "vars")
+    assert key != cache.key("code", "spec2", "sol", "vars")
+    assert key != cache.key("code", "spec", "sol2", "vars")
+    assert key != cache.key("code", "spec", "sol", "vars2")
+
+
+def test_results_eviction(tmp_path):
+    """ Least recently used entries should be evicted past the limit."""
+
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), max_entries = 2)
+
+    for key in ["a", "b", "c"]:
+        cache.put(key, False)
+
+    cache.get("a")
+    cache.evict()
+
+    assert len(cache) == 2
+    assert cache.get("a") is False
+    assert cache.get("b") is None
+
+
+def test_results_shared(tmp_path):
+    """ Caches sharing a file should see each other's results at once."""
+
+    filename = str(tmp_path / "cache.sqlite")
+
+    first = ResultCache(filename, timeout = 0.5)
+    second = ResultCache(filename, timeout = 0.5)
+
+    first.put("a", True)
+    assert second.get("a") is True
+
+    # Neither reads nor writes keep the database locked
+    second.put("b", False)
+    assert first.get("b") is False
+    first.put("c", True)
+
+    first.evict()
+    second.evict()
+
+    assert len(second) == 3
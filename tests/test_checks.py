@@ -10,7 +10,13 @@ from matgrade import ValueCheck, CheckError
 
 class CheckClass:
  
-    eng = matlab.engine.start_matlab()
+    # Reusing a shared session (if any) avoids MATLAB startup
+    sessions = matlab.engine.find_matlab()
+
+    if len(sessions) > 0:
+        eng = matlab.engine.connect_matlab(sessions[0])
+    else:
+        eng = matlab.engine.start_matlab()
 
     #--------------------------------------------------------------------------
     # ValueCheck
@@ -34,4 +40,3 @@ class CheckClass:
 
         with pycheck.raises(CheckError): 
             check = ValueCheck([['2.0', 2.0]], 4.0, 1e-6, self.eng)
-        
@@ -0,0 +1,132 @@
+import pytest
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+import numpy as np
+
+from matgrade.backends import ExecutionError, FakeBackend
+from matgrade.batch import run_samples
+from matgrade.checks import CheckError, PropertyCheck, ValueCheck
+from matgrade.checks import generate_samples
+from matgrade.misc import to_array
+from matgrade.watchdog import Watchdog
+
+
+#------------------------------------------------------------------------------
+# ValueCheck comparisons (performed locally, without the engine)
+
+
+def test_compare_absolute():
+    """ Absolute tolerance should apply to the largest deviation."""
+
+    check = ValueCheck(["x"], [[1.0, 2.0], [3.0, 4.0]], 0.1, False, 1, None)
+
+    assert check.compare(to_array([[1.05, 2.0], [3.0, 4.0]]), check.expected)
+    assert not check.compare(to_array([[1.0, 2.0], [3.0, 4.2]]), check.expected)
+
+
+def test_compare_relative():
+    """ Relative tolerance should scale deviations by the solution."""
+
+    check = ValueCheck(["x"], [100.0, 0.0], 0.01, True, 1, None)
+
+    assert check.compare(to_array([100.5, 0.0]), check.expected)
+    assert not check.compare(to_array([102.0, 0.0]), check.expected)
+    assert not check.compare(to_array([100.0, 1e-9]), check.expected)
+
+
+def test_compare_scalar():
+    """ Scalars and 1x1 arrays should compare as the same shape."""
+
+    check = ValueCheck(["x"], 4.0, 1e-6, False, 1, None)
+
+    assert to_array(4.0).shape == to_array([[4.0]]).shape
+    assert check.compare(to_array([[4.0]]), check.expected)
+
+
+def test_compare_nonfinite():
+    """ NaN and Inf should only match themselves."""
+
+    check = ValueCheck(["x"], [np.nan, np.inf, 1.0], 0.1, False, 1, None)
+
+    assert check.compare(to_array([np.nan, np.inf, 1.0]), check.expected)
+    assert not check.compare(to_array([np.nan, -np.inf, 1.0]), check.expected)
+    assert not check.compare(to_array([0.0, np.inf, 1.0]), check.expected)
+
+
+def test_compare_complex():
+    """ Complex deviations should be measured by their modulus."""
+
+    check = ValueCheck(["x"], [1 + 1j], 0.1, False, 1, None)
+
+    assert check.compare(to_array([1.05 + 1.05j]), check.expected)
+    assert not check.compare(to_array([1 + 1.2j]), check.expected)
+
+
+def test_value_not_numeric():
+    """ Non-numeric solution output should be rejected up front."""
+
+    with pytest.raises(CheckError):
+        ValueCheck(["x"], "text", 0.1, False, 1, None)
+
+    assert to_array("text") is None
+
+
+#------------------------------------------------------------------------------
+# PropertyCheck comparisons (all samples in a single engine call)
+
+
+def plus(x, y, _op):
+    return x + y
+
+
+def test_property_check():
+    """ Property checks should compare all samples in one engine call."""
+
+    def offset(x, y, op):
+        return plus(x, y, op) + (x[0, 0] > 4.5)
+
+    engine = FakeBackend({"sol": plus, "good": plus, "bad": offset})
+    watchdog = Watchdog(1.0)
+
+    samples = generate_samples(
+        [{"range": [0, 5], "size": [1, 2]}, {"range": [0, 5]}, "'plus'"],
+        200, seed = 1
+    )
+    solution = run_samples("sol", samples, 1, engine, 1.0, watchdog)
+    check = PropertyCheck(samples, solution, 1e-6, False, 1, engine, 1.0,
+                          watchdog)
+
+    engine.calls = 0
+
+    assert check.evaluate("A", "good", "")
+    assert not check.evaluate("B", "bad", "")
+    assert engine.calls == 2
+
+    # Samples are reproducible
+    assert samples == generate_samples(
+        [{"range": [0, 5], "size": [1, 2]}, {"range": [0, 5]}, "'plus'"],
+        200, seed = 1
+    )
+
+
+def test_property_errors():
+    """ Submissions should error on exactly the samples the solution does."""
+
+    def strict(x):
+        if x < 0:
+            raise ExecutionError("Negative input.")
+        return x
+
+    engine = FakeBackend({
+        "sol": strict, "lenient": lambda x: x, "strict": strict
+    })
+
+    samples = generate_samples([{"range": [-3, 3], "integer": True}], 20)
+    solution = run_samples("sol", samples, 1, engine, 1.0)
+    check = PropertyCheck(samples, solution, 1e-6, False, 1, engine, 1.0)
+
+    assert check.evaluate("A", "strict", "")
+    assert not check.evaluate("B", "lenient", "")
@@ -0,0 +1,181 @@
+import pytest
+import os
+import socket
+import threading
+import time
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+from matgrade import profiling
+from matgrade.daemon import DaemonError, WarmEngines, send, serve, submit
+
+from conftest import FakeEngine, read_grades, write_lab
+
+
+LAB = """solution: f.m
+submissions: submissions
+cache: false
+
+variables:
+  x: "[1, 2]"
+
+checks:
+  absolute_value:
+    a: [["'a'"], 0.01]
+
+---
+
+checks: a
+grade: 10
+"""
+
+
+@pytest.fixture
+def daemon(tmp_path, fake_engines):
+
+    os.chdir(str(tmp_path))
+    write_lab(str(tmp_path), {
+        "Student A": ("f.m", 1),
+        "Student B": ("f.m", 2),
+    })
+
+    with open("lab.yaml", "w") as f:
+        f.write(LAB)
+
+    factory, engines = fake_engines
+
+    address = str(tmp_path / "daemon.sock")
+
+    thread = threading.Thread(
+        target = serve, args = (address, factory, 1, 10.0)
+    )
+    thread.start()
+
+    while not os.path.exists(address):
+        time.sleep(0.01)
+
+    yield address, engines
+
+    send(address, {"command": "stop"})
+    thread.join()
+
+
+#------------------------------------------------------------------------------
+
+def test_daemon_jobs(daemon, tmp_path):
+    """ Jobs should reuse a warm engine and leave it as they found it."""
+
+    address, engines = daemon
+
+    for _ in range(2):
+
+        output = submit(["lab.yaml", "--no-cache"], str(tmp_path), address)
+        grades = read_grades("grades.csv")
+
+        assert output == ""
+        assert grades["Student A"] == ["10", "10"]
+        assert grades["Student B"] == ["0", "0"]
+
+    # One engine, cleaned up after every job
+    assert len(engines) == 1
+    assert engines[0].workspace == {}
+    assert engines[0].paths == []
+
+
+def test_daemon_errors(daemon, tmp_path):
+    """ Errors should be reported back instead of stopping the daemon."""
+
+    address, _ = daemon
+
+    output = submit(["missing.yaml"], str(tmp_path), address)
+    assert output.startswith("Grading failed")
+
+    output = submit(["lab.yaml", "--watch"], str(tmp_path), address)
+    assert "Watch mode" in output
+
+    output = submit(["lab.yaml", "--no-cache"], str(tmp_path), address)
+    assert output == ""
+
+
+def test_daemon_cleanup(daemon, tmp_path):
+    """ Jobs should not leave profiling enabled or grading files open."""
+
+    address, _ = daemon
+
+    with open("lab.yaml", "w") as f:
+        f.write(LAB.replace("cache: false", "cache: true"))
+
+    output = submit(["lab.yaml", "--profile", "profile.json"], str(tmp_path),
+                    address)
+
+    assert "Student A" in output
+    assert os.path.exists(os.path.join("submissions", ".matgrade.sqlite"))
+    assert profiling.profiler is None
+
+    if os.path.isdir("/proc/self/fd"):
+
+        files = [
+            os.path.realpath(os.path.join("/proc/self/fd", fd))
+            for fd in os.listdir("/proc/self/fd")
+        ]
+
+        assert not any(".matgrade" in f for f in files)
+
+
+def test_daemon_restart(tmp_path, monkeypatch):
+    """ Sockets left by dead daemons are replaced, and jobs wait for the new
+    daemon to listen."""
+
+    os.chdir(str(tmp_path))
+    write_lab(str(tmp_path), {"Student A": ("f.m", 1)})
+
+    with open("lab.yaml", "w") as f:
+        f.write(LAB)
+
+    address = str(tmp_path / "daemon.sock")
+
+    # Bound but never listened on, as after the daemon was killed
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(address)
+    stale.close()
+
+    with pytest.raises(DaemonError):
+        send(address, {"command": "stop"})
+
+    # Engines take a while to start, and the socket is only bound after
+    def factory():
+        time.sleep(0.3)
+        return FakeEngine()
+
+    threads = []
+
+    def popen(*args, **kwargs):
+        threads.append(threading.Thread(
+            target = serve, args = (address, factory, 1, 10.0)
+        ))
+        threads[0].start()
+
+    monkeypatch.setattr("matgrade.daemon.subprocess.Popen", popen)
+
+    output = submit(["lab.yaml", "--no-cache"], str(tmp_path), address)
+
+    assert output == ""
+    assert read_grades("grades.csv")["Student A"] == ["10", "10"]
+
+    send(address, {"command": "stop"})
+    threads[0].join()
+
+
+def test_warm_engines():
+    """ Engines should only be started when all others are lent out."""
+
+    warm = WarmEngines(FakeEngine)
+
+    first, second = warm(), warm()
+    assert first.backend is not second.backend
+
+    warm.release()
+    assert warm().backend in (first.backend, second.backend)
+    assert len(warm.idle) == 1
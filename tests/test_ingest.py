@@ -0,0 +1,102 @@
+import pytest
+import os
+import time
+import zipfile
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+from matgrade.ingest import IngestError, ingest, parse_filename
+
+
+FILES = {
+    "58877-128227 - Student A - Oct 3, 2021 1121 PM-f.m": "% Old\nz = 0\n",
+    "58877-128227 - Student A - Oct 3, 2021 1123 PM-f.m": "% New\nz = 1\n",
+    "58877-128227 - Student B - Oct 1, 2021 1018 PM-g.m": "z = 2\n",
+    "readme.txt": "Not a submission",
+}
+
+
+#------------------------------------------------------------------------------
+# File names
+
+def test_parse_filename():
+    """ File names should be parsed into a single record."""
+
+    record = parse_filename(
+        "58877-128227 - Student A - Oct 3, 2021 1123 PM-plus_or_minus.m", "x"
+    )
+
+    assert record.ids == "58877-128227"
+    assert record.student == "Student A"
+    assert record.function == "plus_or_minus.m"
+    assert record.timestamp == time.strptime("Oct 3 2021 2323", "%b %d %Y %H%M")
+    assert record.source == "x"
+
+
+def test_parse_invalid():
+    """ Unexpected file names should be skipped with a warning."""
+
+    with pytest.warns(UserWarning):
+        assert parse_filename("readme.txt", "x") is None
+
+    with pytest.warns(UserWarning):
+        assert parse_filename("1-2 - Student - yesterday-f.m", "x") is None
+
+
+#------------------------------------------------------------------------------
+# Folders and archives
+
+def check_ingested(records, contents):
+
+    assert sorted(records) == ["Student A", "Student B"]
+    assert records["Student B"].function == "g.m"
+    assert contents == {"Student A": "z = 1\n", "Student B": "z = 2\n"}
+
+
+def test_ingest_folder(tmp_path):
+    """ Only the latest submission of every student should be read."""
+
+    for filename, content in FILES.items():
+        (tmp_path / filename).write_text(content)
+
+    with pytest.warns(UserWarning):
+        check_ingested(*ingest(str(tmp_path)))
+
+
+def test_ingest_archive(tmp_path):
+    """ Archives should be read in place, only reading latest members."""
+
+    filename = str(tmp_path / "lms.zip")
+
+    with zipfile.ZipFile(filename, "w") as archive:
+        archive.writestr("section 1/", "")
+        for name, content in FILES.items():
+            archive.writestr("section 1/" + name, content)
+
+    read = []
+    original = zipfile.ZipFile.read
+
+    def spy(self, name, *args):
+        read.append(name)
+        return original(self, name, *args)
+
+    zipfile.ZipFile.read = spy
+
+    try:
+        with pytest.warns(UserWarning):
+            check_ingested(*ingest(filename))
+    finally:
+        zipfile.ZipFile.read = original
+
+    assert len(read) == 2
+    assert not any("1121 PM" in name for name in read)
+    assert not os.path.exists(str(tmp_path / "section 1"))
+
+
+def test_ingest_missing(tmp_path):
+    """ Missing folders should raise a readable error."""
+
+    with pytest.raises(IngestError):
+        ingest(str(tmp_path / "missing"))
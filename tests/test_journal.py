@@ -0,0 +1,144 @@
+import pytest
+import os
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+from matgrade import Assessment
+from matgrade.backends import Exit
+from matgrade.journal import Journal
+
+from conftest import read_grades, write_lab
+
+
+def setup(factory, resume = False):
+
+    assessment = Assessment("f.m", "submissions", factory = factory)
+    assessment.use_journal(resume)
+    assessment.add_value_check("a", ["'a'"], 0.01, False, 1)
+    assessment.add_value_check("b", ["'b'"], 0.01, False, 1)
+    assessment.add_graded_component("a", ["a"], "and", 10)
+    assessment.add_graded_component("name + b", ["name", "b"], "and", 10)
+
+    return assessment
+
+
+@pytest.fixture
+def lab(tmp_path, fake_engines):
+
+    os.chdir(str(tmp_path))
+
+    write_lab(str(tmp_path), {
+        "Student A": ("f.m", 1),
+        "Student B": ("f.m", 2),
+        "Student C": ("g.m", 3),
+    })
+
+    return fake_engines
+
+
+#------------------------------------------------------------------------------
+
+def test_resume(lab):
+    """ Resumed runs should rebuild grades without running journaled checks."""
+
+    factory, engines = lab
+
+    setup(factory).grade("grades.csv")
+    first = read_grades("grades.csv")
+
+    assessment = setup(factory, resume = True)
+    assessment.cache.clear()
+    assessment.grade("grades.csv")
+
+    calls = [c for c in engines[-1].commands if c.startswith("sub_")]
+
+    assert len(assessment.journal) == 8
+    assert calls == []
+    assert read_grades("grades.csv") == first
+
+    # Without resuming, the journal starts over
+    assessment = setup(factory)
+    assert len(assessment.journal) == 0
+
+
+def test_partial_journal(tmp_path):
+    """ A torn last line (e.g. after a crash) should be skipped."""
+
+    filename = str(tmp_path / "journal")
+
+    journal = Journal(filename)
+    journal.put(["A", "a"], True)
+    journal.close()
+
+    with open(filename, "a") as f:
+        f.write('{"key": ["A", "b"], "res')
+
+    journal = Journal(filename, resume = True)
+    journal.put(["B", "a"], False)
+    journal.close()
+
+    journal = Journal(filename, resume = True)
+    assert journal.get(["A", "a"]) is True
+    assert journal.get(["B", "a"]) is False
+    assert len(journal) == 2
+
+
+def test_engine_death(lab):
+    """ Code that kills the engine should fail checks, not the whole run."""
+
+    factory, engines = lab
+
+    assessment = setup(factory)
+
+    def exit(*arguments):
+        raise Exit
+
+    engines[0].define(assessment.calls["Student B"], exit)
+    assessment.grade("grades.csv")
+
+    grades = read_grades("grades.csv")
+
+    assert grades["Student A"] == ["10", "10", "20"]
+    assert grades["Student B"] == ["0", "0", "0"]
+    assert grades["Student C"] == ["0", "0", "0"]
+
+    # Both attempts at both of Student B's checks restart the engine
+    assert engines[0].restarts == 4
+    assert not engines[0].terminated
+
+
+def test_engine_death_batch(lab):
+    """ Engines dying in batch mode should be restarted, not the engine of
+    another worker."""
+
+    factory, engines = lab
+    calls = {}
+
+    def exit(*arguments):
+        raise Exit
+
+    def exiting():
+        engine = factory()
+        engine.define(calls.get("Student B"), exit)
+        return engine
+
+    assessment = Assessment(
+        "f.m", "submissions", workers = 2, factory = exiting, batch = True
+    )
+    assessment.add_value_check("a", ["'a'"], 0.01, False, 1)
+    assessment.add_graded_component("name + a", ["name", "a"], "and", 10)
+
+    calls.update(assessment.calls)
+    assessment.grade("grades.csv")
+
+    grades = read_grades("grades.csv")
+
+    assert grades["Student A"] == ["10", "10"]
+    assert grades["Student B"] == ["0", "0"]
+
+    # The batch and both attempts at the check restart the worker's engine
+    assert engines[0].restarts == 0
+    assert sum(e.restarts for e in engines[1:]) == 3
+    assert not any(e.terminated for e in engines)
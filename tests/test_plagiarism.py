@@ -0,0 +1,193 @@
+import pytest
+import os
+import random
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+from matgrade.plagiarism import SimilarityIndex, fingerprints, tokenize
+
+
+ORIGINAL = """function z = plus_or_minus(x, y, op)
+
+switch op
+    case {'plus'}
+      z = x + y;
+    case {'minus'}
+      z = x - y;
+    otherwise
+      error('Invalid operation')
+end
+
+for i = 1:numel(z)
+    z(i) = z(i)*2.5;
+end
+
+end
+"""
+
+RENAMED = """function result = plus_or_minus(a, b, operation)
+% Comments should not matter
+
+switch operation
+    case {'plus'}
+      result = a + b;
+    case {'minus'}
+      result = a - b;
+    otherwise
+      error('Bad operation')
+end
+
+for k = 1:numel(result)
+    result(k) = result(k)*2.5;
+end
+
+end
+"""
+
+DIFFERENT = """function out = plus_or_minus(p, q, mode)
+if strcmp(mode, 'plus')
+    out = sum([p; q], 1);
+elseif strcmp(mode, 'minus')
+    out = -diff([p; q], 1);
+else
+    out = NaN;
+end
+end
+"""
+
+
+def random_code(rng):
+
+    operators = ["+", "-", "*", "/", ".*", "./", ".^", "==", "~=", "<", ">"]
+    lines = []
+
+    for i in range(rng.randint(5, 20)):
+
+        terms = ["x"]
+        for j in range(rng.randint(1, 4)):
+            terms.append(rng.choice(operators))
+            terms.append(rng.choice(["x", "y", "1", "(x)", "y(1)"]))
+
+        statement = "y = {};".format(" ".join(terms))
+
+        if rng.random() < 0.2:
+            lines.append("if x > 1")
+            lines.append("    " + statement)
+            lines.append("end")
+        else:
+            lines.append(statement)
+
+    return "function y = f(x)\n{}\nend\n".format("\n".join(lines))
+
+
+#------------------------------------------------------------------------------
+# Tokens and fingerprints
+
+def test_tokenize():
+    """ Identifiers, numbers and strings should be normalized."""
+
+    tokens = tokenize("z = foo(x, 'bar') + 2.5e3; % comment\nend")
+
+    assert tokens == [
+        "V", "=", "V", "(", "V", ",", "S", ")", "+", "N", ";", "end"
+    ]
+
+    # Transposes are operators, not strings
+    assert tokenize("y = x';") == ["V", "=", "V", "'", ";"]
+
+
+def test_fingerprints_renamed():
+    """ Renaming variables should not change the fingerprints."""
+
+    assert fingerprints(ORIGINAL) == fingerprints(RENAMED)
+    assert fingerprints(ORIGINAL) != fingerprints(DIFFERENT)
+
+
+#------------------------------------------------------------------------------
+# SimilarityIndex
+
+def test_pairs():
+    """ Only sufficiently similar pairs should be reported."""
+
+    index = SimilarityIndex()
+    index.add("a", ORIGINAL)
+    index.add("b", RENAMED)
+    index.add("c", DIFFERENT)
+
+    pairs = index.pairs(0.5)
+
+    assert len(pairs) == 1
+    assert pairs[0][:3] == ("a", "b", 1.0)
+
+
+def test_archive_pairs():
+    """ Archived submissions should only be compared to current ones."""
+
+    index = SimilarityIndex()
+    index.add("current", DIFFERENT)
+    index.add("old1", ORIGINAL, current = False)
+    index.add("old2", RENAMED, current = False)
+
+    assert index.pairs(0.5) == []
+
+
+def test_archive_folder(tmp_path):
+    """ Archive folders should only contribute the latest submission of each
+    student (and nothing from hidden folders)."""
+
+    def write(folder, filename, code):
+
+        os.makedirs(str(tmp_path / folder), exist_ok = True)
+
+        with open(str(tmp_path / folder / filename), "w") as f:
+            f.write(code)
+
+    write("fall", "1-1 - Student X - Oct 3, 2021 1123 PM-f.m", RENAMED)
+    write("fall", "1-1 - Student X - Oct 4, 2021 1123 PM-f.m", DIFFERENT)
+    write("fall", "1-2 - Student Y - Oct 3, 2021 1123 PM-f.m",
+          "% Copied\n" + RENAMED)
+    write("fall/.code", "sol.m", ORIGINAL)
+    write("fall/.code", "sub_abc.m", ORIGINAL)
+
+    index = SimilarityIndex()
+    index.add("current", ORIGINAL)
+    index.add_folder(str(tmp_path / "fall"))
+
+    assert len(index.names) == 3
+
+    pairs = index.pairs(0.5)
+
+    assert [p[:3] for p in pairs] == [
+        ("current", "fall/1-2 - Student Y - Oct 3, 2021 1123 PM-f.m", 1.0)
+    ]
+
+
+def test_report():
+    """ Reports should use the provided labels."""
+
+    index = SimilarityIndex()
+    index.add("a1b2c", ORIGINAL)
+    index.add("d3e4f", RENAMED)
+
+    html = index.report(index.pairs(), {"a1b2c": "Student A (a1b2c)"})
+
+    assert "Student A (a1b2c)" in html
+    assert "d3e4f" in html
+
+
+def test_scale():
+    """ Thousands of submissions should be indexed without O(n^2) pairs."""
+
+    rng = random.Random(0)
+    codes = [random_code(rng) for i in range(2000)]
+
+    index = SimilarityIndex()
+    for i, code in enumerate(codes):
+        index.add(str(i), code)
+
+    index.add("copy", codes[0])
+
+    pairs = index.pairs(0.9)
+    assert ("0", "copy", 1.0) in [p[:3] for p in pairs]
@@ -0,0 +1,195 @@
+import pytest
+import os
+import subprocess
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+import yaml
+
+from matgrade import load, parser
+from matgrade.plan import PlanError, compile_plan
+
+from conftest import read_grades, write_lab
+
+
+LAB = """solution: f.m
+submissions: submissions
+
+variables:
+  x: "[1, 2]"
+
+checks:
+  shape:
+    s: [["x"]]
+  absolute_value:
+    a: [["x"], 0.01]
+    b: [["x"], 0.1, 2]
+  error:
+    e: ["'e'"]
+
+---
+
+checks: [a, s]
+grade: 10
+
+---
+
+name: either
+checks: [b, e]
+combination: or
+grade: 5
+"""
+
+# Generous compared to measured start-up times (a few tens of ms), as the
+# point is to catch heavy dependencies creeping back into package imports
+BUDGET = 0.25
+
+
+def documents(tmp_path, lab = LAB):
+
+    os.chdir(str(tmp_path))
+
+    with open("f.m", "w") as f:
+        f.write("function y = f(x)\ny = x;\n")
+
+    return list(yaml.load_all(lab, yaml.Loader))
+
+
+def test_compile(tmp_path):
+    """ Plans list checks, distinct solution calls and components. """
+
+    plan = compile_plan(documents(tmp_path))
+
+    assert [c["name"] for c in plan["checks"]] == ["s", "a", "b", "e"]
+    assert plan["calls"] == [[["x"], 1], [["x"], 2]]
+    assert [c["name"] for c in plan["components"]] == ["a + s", "either"]
+
+    # Digests change with the solution
+    with open("f.m", "a") as f:
+        f.write("% changed\n")
+
+    changed = compile_plan(list(yaml.load_all(LAB, yaml.Loader)))
+    assert changed["digest"] != plan["digest"]
+
+
+def test_compile_errors(tmp_path):
+    """ Undefined references and missing solutions are reported. """
+
+    with pytest.raises(PlanError):
+        compile_plan(documents(tmp_path, LAB.replace("[b, e]", "[b, c]")))
+
+    with pytest.raises(PlanError):
+        compile_plan(documents(tmp_path, LAB.replace("    e:", "    s:")))
+
+    os.remove("f.m")
+
+    with pytest.raises(PlanError):
+        compile_plan(list(yaml.load_all(LAB, yaml.Loader)))
+
+
+GRADED = """solution: f.m
+submissions: submissions
+
+checks:
+  shape:
+    s: [["'s'"]]
+  absolute_value:
+    a: [["'a'"], 0.01]
+  error:
+    e: ["'e'"]
+
+---
+
+checks: [a, s]
+grade: 10
+"""
+
+
+def load_lab(fake_engines, argv = ()):
+
+    factory, engines = fake_engines
+    first = len(engines)
+
+    args = parser.parse_args(["lab.yaml"] + list(argv))
+    assessment = load("lab.yaml", args, factory)
+    assessment.grade("grades.csv")
+    assessment.close()
+
+    # Solution calls made while loading
+    return [c for c in engines[first].commands if c.startswith("sol(")]
+
+
+def test_load(tmp_path, capsys, fake_engines):
+    """ Labs are loaded from their compiled plan, with the same errors. """
+
+    os.chdir(str(tmp_path))
+    write_lab(str(tmp_path), {"Student A": ("f.m", 1)})
+
+    with open("lab.yaml", "w") as f:
+        f.write(GRADED.replace("[a, s]", "[a, c]"))
+
+    with pytest.raises(SystemExit):
+        load_lab(fake_engines)
+
+    assert capsys.readouterr().out.strip() == \
+        "\"c\" check is undefined (referenced by \"a + c\")"
+
+
+def test_saved_solutions(tmp_path, fake_engines):
+    """ Numeric solution outputs are saved and only recomputed when the
+    solution or checks change. """
+
+    os.chdir(str(tmp_path))
+    write_lab(str(tmp_path), {"Student A": ("f.m", 1)})
+
+    with open("lab.yaml", "w") as f:
+        f.write(GRADED)
+
+    assert sorted(load_lab(fake_engines)) == ["sol('a')", "sol('s')"]
+    assert os.path.exists(os.path.join("submissions",
+                                       ".matgrade.solutions.npz"))
+
+    grades = read_grades("grades.csv")
+
+    assert load_lab(fake_engines) == []
+    assert read_grades("grades.csv") == grades == {
+        "student": ["a + s", "total"], "Student A": ["10", "10"]
+    }
+
+    assert sorted(load_lab(fake_engines, ["--no-cache"])) == \
+        ["sol('a')", "sol('s')"]
+
+    with open("lab.yaml", "w") as f:
+        f.write(GRADED.replace("'a'", "'b'"))
+
+    assert load_lab(fake_engines) == ["sol('b')"]
+
+    with open("f.m", "w") as f:
+        f.write("function z = f(x)\nz = 2\nend\n")
+
+    assert sorted(load_lab(fake_engines)) == ["sol('b')", "sol('s')"]
+
+
+def test_import_budget():
+    """ Importing the package does not pull in heavy dependencies. """
+
+    heavy = ["numpy", "pandas", "requests", "yaml", "matlab"]
+    code = "import sys, matgrade, matgrade.plan, matgrade.shard; " + \
+           "print(' '.join(m for m in {} if m in sys.modules))".format(heavy)
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd = root,
+        capture_output = True, text = True, check = True
+    )
+
+    assert result.stdout.strip() == ""
+
+    # Cumulative time (in microseconds) of the top-level package import
+    lines = [l for l in result.stderr.splitlines() if l.endswith("| matgrade")]
+    cumulative = int(lines[0].split("|")[1])
+
+    assert cumulative/1e6 < BUDGET
@@ -0,0 +1,79 @@
+import pytest
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+from matgrade.backends import FakeBackend
+from matgrade.checks import NameCheck, ShapeCheck
+from matgrade.pool import EnginePool, PoolError
+
+
+def factory(engines, calls = None):
+
+    # Submission functions return 1, recording their names
+    def resolve(name, paths):
+
+        def call(*arguments):
+            calls.append(name)
+            return 1.0
+
+        return call
+
+    def start():
+        engines.append(FakeBackend(resolver = resolve))
+        return engines[-1]
+
+    return start
+
+
+#------------------------------------------------------------------------------
+# EnginePool
+
+def test_pool_setup():
+    """ Each engine should get the code path and replayed variables."""
+
+    engines = []
+    pool = EnginePool(factory(engines), 3, "/code", [("x", "[1, 1]")])
+    pool.start()
+
+    assert len(engines) == 3
+
+    for engine in engines:
+        assert engine.paths == ["/code"]
+        assert engine.workspace["x"].tolist() == [[1, 1]]
+
+
+def test_pool_evaluate():
+    """ Results from all workers should be merged for every student."""
+
+    engines = []
+    calls = []
+    pool = EnginePool(factory(engines, calls), 4, "/code", [("x", "1")])
+
+    names = {"Student {}".format(i): "f" for i in range(20)}
+    checks = {
+        "name": NameCheck(names, "f"),
+        "shape": ShapeCheck(["x"], 1.0, 1, None),
+    }
+    tasks = [(s, "sub{}".format(i), "") for i, s in enumerate(names)]
+
+    results = pool.evaluate(tasks, checks)
+
+    assert len(results) == 20
+
+    for student in names:
+        assert results[student] == {"name": True, "shape": True}
+
+    # Every call should have gone to exactly one pool engine
+    assert sorted(calls) == sorted("sub{}".format(i) for i in range(20))
+
+    # And the original check should not have been rebound
+    assert checks["shape"].engine is None
+
+
+def test_pool_size():
+    """ A pool without workers should be rejected."""
+
+    with pytest.raises(PoolError):
+        EnginePool(factory([]), 0, "/code", [])
@@ -0,0 +1,98 @@
+import pytest
+import csv
+import json
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+from matgrade import profiling
+from matgrade.backends import ExecutionError, FakeBackend, Hang
+from matgrade.misc import run_matlab_function
+from matgrade.watchdog import Watchdog
+
+
+def fail():
+    raise ExecutionError("Error using f (line 2)\nNope")
+
+
+def hang():
+    raise Hang
+
+
+@pytest.fixture
+def profiler():
+
+    yield profiling.enable()
+    profiling.disable()
+
+
+@pytest.fixture
+def engine():
+
+    return FakeBackend({"ok": lambda: 1.0, "fail": fail, "hang": hang})
+
+
+def evaluate(function, engine):
+
+    watchdog = Watchdog(0.05, grace = 0.05)
+
+    try:
+        run_matlab_function(function, [], 1, engine, watchdog = watchdog)
+    except (ExecutionError, TimeoutError):
+        return False
+
+    return True
+
+
+#------------------------------------------------------------------------------
+
+def test_attribution(profiler, engine):
+    """ Engine calls should be counted against the running evaluation."""
+
+    profiler.measure("A", "ok", evaluate, "ok", engine)
+    profiler.measure("A", "fail", evaluate, "fail", engine)
+    profiler.measure("B", "hang", evaluate, "hang", engine)
+
+    # Calls outside of evaluations count as setup
+    run_matlab_function("ok", [], 1, engine)
+
+    records = {(r["student"], r["check"]): r for r in profiler.records}
+
+    assert records[("A", "ok")]["calls"] == 1
+    assert records[("A", "ok")]["passed"] is True
+    assert records[("A", "fail")]["errors"] == 1
+    assert records[("B", "hang")]["timeouts"] == 1
+    assert records[("B", "hang")]["time"] >= 0.05
+    assert profiler.setup["calls"] == 1
+
+
+def test_rollups(profiler, engine, tmp_path):
+    """ Timings should roll up per check and per student."""
+
+    for student in ["A", "B"]:
+        profiler.measure(student, "ok", evaluate, "ok", engine)
+        profiler.measure(student, "fail", evaluate, "fail", engine)
+
+    summary = profiler.summary()
+
+    assert summary["checks"]["ok"]["evaluations"] == 2
+    assert summary["checks"]["fail"]["errors"] == 2
+    assert summary["students"]["A"]["calls"] == 2
+    assert "Slowest checks:" in profiler.report()
+
+    profiler.write(str(tmp_path / "profile.json"))
+    profiler.write(str(tmp_path / "profile.csv"))
+
+    with open(str(tmp_path / "profile.json")) as f:
+        assert len(json.load(f)["evaluations"]) == 4
+
+    with open(str(tmp_path / "profile.csv")) as f:
+        assert len(list(csv.DictReader(f))) == 4
+
+
+def test_disabled(engine):
+    """ Nothing should be recorded unless profiling is enabled."""
+
+    assert profiling.profiler is None
+    assert evaluate("ok", engine)
@@ -0,0 +1,107 @@
+import pytest
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+import numpy as np
+
+from matgrade.grades import tabulate
+from matgrade.results import FAIL, PASS, UNKNOWN, ResultMatrix
+
+
+COMPONENTS = [
+    {"name": "a + b", "checks": ["a", "b"], "combination": "and", "value": 10},
+    {"name": "b / c", "checks": ["b", "c"], "combination": "or", "value": 5},
+]
+
+
+def test_matrix():
+    """ Outcomes take a byte each and unevaluated checks stay unknown. """
+
+    matrix = ResultMatrix(["a", "b"])
+    matrix.update({
+        "A": {"a": True, "b": True},
+        "B": {"a": False, "c": True},
+    })
+
+    assert matrix.matrix.dtype == np.int8
+    assert matrix.matrix[matrix.rows["A"], matrix.columns["c"]] == UNKNOWN
+    assert matrix.matrix[matrix.rows["B"], matrix.columns["a"]] == FAIL
+    assert matrix.matrix[matrix.rows["B"], matrix.columns["c"]] == PASS
+
+    assert matrix.get("A") == {"a": True, "b": True}
+    assert matrix.get("B") == {"a": False, "c": True}
+
+    # Discarded rows are reused
+    matrix.discard("A")
+    assert "A" not in matrix and len(matrix) == 1
+
+    matrix.update({"C": {"a": True, "b": False, "c": False}})
+    assert matrix.get("C") == {"a": True, "b": False, "c": False}
+    assert matrix.get("B") == {"a": False, "c": True}
+
+
+def test_grades():
+    """ Components reduce over their checks and totals add up. """
+
+    matrix = ResultMatrix()
+    matrix.update({
+        "A": {"a": True, "b": True},
+        "B": {"a": False, "b": False, "c": True},
+        "C": {"a": False, "b": False, "c": False},
+    })
+
+    grades, totals = matrix.grades(COMPONENTS, ["C", "A", "B"])
+
+    assert grades.tolist() == [[0, 0], [10, 5], [0, 5]]
+    assert totals.tolist() == [0, 15, 5]
+
+    content = tabulate(COMPONENTS, matrix, ["A", "B"])
+
+    assert content == {
+        "student": ["A", "B"], "a + b": [10, 0], "b / c": [5, 5],
+        "total": [15, 5]
+    }
+
+
+def test_fractional_grades():
+    """ Integer grades should stay integers next to fractional ones. """
+
+    matrix = ResultMatrix()
+    matrix.update({
+        "A": {"a": True, "b": True, "c": True},
+        "B": {"a": True, "b": True, "c": False},
+    })
+
+    components = [
+        COMPONENTS[0],
+        {"name": "c", "checks": ["c"], "combination": "and", "value": 2.5},
+    ]
+    content = tabulate(components, matrix, ["A", "B"])
+
+    assert content == {
+        "student": ["A", "B"], "a + b": [10, 10], "c": [2.5, 0],
+        "total": [12.5, 10]
+    }
+    assert type(content["a + b"][0]) is int
+    assert type(content["total"][1]) is int
+
+
+def test_growth():
+    """ Students are added one at a time without losing results. """
+
+    matrix = ResultMatrix()
+
+    for i in range(100):
+        matrix.update({i: {"a": i % 2 == 0}})
+
+    assert len(matrix) == 100
+    assert matrix.matrix.shape[0] < 200
+
+    grades, totals = matrix.grades(
+        [{"name": "a", "checks": ["a"], "combination": "and", "value": 1}],
+        list(range(100))
+    )
+
+    assert totals.sum() == 50
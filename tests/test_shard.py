@@ -0,0 +1,153 @@
+import pytest
+import multiprocessing
+import os
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+from matgrade import Assessment
+from matgrade.cache import ResultCache
+from matgrade.shard import ShardError, merge, read_shard, shard
+
+from conftest import FakeEngine, read_grades, write_lab
+
+
+def setup(tolerance = 0.01, cached = False):
+
+    assessment = Assessment("f.m", "submissions", factory = FakeEngine)
+
+    if cached:
+        assessment.use_result_cache()
+
+    assessment.add_value_check("a", ["'a'"], tolerance, False, 1)
+    assessment.add_graded_component("name + a", ["name", "a"], "and", 10)
+    assessment.add_graded_component("a", ["a"], "or", 5)
+
+    return assessment
+
+
+def grade_shard(path, index, count, tolerance = 0.01, cached = False):
+
+    os.chdir(path)
+
+    filename = "shard-{}-of-{}.json".format(index, count)
+    setup(tolerance, cached).grade_shard(filename, index, count)
+
+
+@pytest.fixture
+def lab(tmp_path):
+
+    os.chdir(str(tmp_path))
+
+    write_lab(str(tmp_path), {
+        "Student {}".format(i): ("f.m" if i % 3 else "g.m", i % 2 + 1)
+        for i in range(12)
+    })
+
+    return str(tmp_path)
+
+
+def run_shards(path, count, tolerances = None, cached = False):
+
+    if tolerances is None:
+        tolerances = [0.01]*count
+
+    # One process per shard, as if run on separate machines
+    processes = [
+        multiprocessing.Process(
+            target = grade_shard,
+            args = (path, i + 1, count, tolerances[i], cached)
+        )
+        for i in range(count)
+    ]
+
+    for process in processes:
+        process.start()
+
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    return [
+        os.path.join(path, "shard-{}-of-{}.json".format(i + 1, count))
+        for i in range(count)
+    ]
+
+
+#------------------------------------------------------------------------------
+
+def test_partition():
+    """ Every student should land in exactly one (stable) shard."""
+
+    students = ["Student {}".format(i) for i in range(100)]
+    shards = [shard(s, 4) for s in students]
+
+    assert set(shards) == {1, 2, 3, 4}
+    assert shards == [shard(s, 4) for s in students]
+
+
+def test_merge(lab):
+    """ Merged shards should match grading everything on one machine."""
+
+    filenames = run_shards(lab, 3)
+
+    assert merge(filenames, "merged.csv") == 12
+
+    setup().grade("grades.csv")
+
+    merged = read_grades("merged.csv")
+    single = read_grades("grades.csv")
+
+    assert merged == single
+
+    content = read_shard(filenames[0])
+    assert set(content["timings"]["students"]) == set(content["results"])
+
+
+def test_merge_cached(lab):
+    """ Shards sharing the result cache should grade (and regrade from the
+    cache) concurrently."""
+
+    for i in range(2):
+        filenames = run_shards(lab, 4, cached = True)
+        assert merge(filenames, "merged.csv") == 12
+
+    setup().grade("grades.csv")
+
+    assert read_grades("merged.csv") == read_grades("grades.csv")
+    cache = ResultCache(os.path.join("submissions", ".matgrade.sqlite"))
+    assert len(cache) > 0
+
+
+def test_merge_validation(lab):
+    """ Shards from different configurations or incomplete sets should be
+    rejected."""
+
+    filenames = run_shards(lab, 2, [0.01, 0.5])
+
+    with pytest.raises(ShardError):
+        merge(filenames, "merged.csv")
+
+    with pytest.raises(ShardError):
+        merge(filenames[:1], "merged.csv")
+
+
+def test_plan_fingerprint(lab):
+    """ Shards loaded from the same lab plan should match even when their
+    timeouts were calibrated differently."""
+
+    first = setup()
+    second = setup()
+    first.plan = second.plan = "digest"
+
+    # As calibrated on a slower machine
+    second.checks["a"].timeout = 2.0
+
+    assert first.fingerprint() == second.fingerprint()
+
+    second.plan = "other"
+    assert first.fingerprint() != second.fingerprint()
+
+    first.close()
+    second.close()
@@ -0,0 +1,116 @@
+import pytest
+import json
+import os
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+from matgrade import Assessment
+from matgrade.sinks import CSVSink, SinkError, open_sink
+
+from conftest import HangingEngine, read_grades, write_lab
+
+
+@pytest.fixture
+def lab(tmp_path):
+
+    os.chdir(str(tmp_path))
+
+    write_lab(str(tmp_path), {
+        "Student A": ("f.m", 1),
+        "Student B": ("f.m", 2),
+        "Student C": ("g.m", 9),
+    })
+
+    assessment = Assessment(
+        "f.m", "submissions", timeout = 0.1, factory = HangingEngine
+    )
+    assessment.add_value_check("a", ["'a'"], 0.01, False, 1)
+    assessment.add_graded_component("name + a", ["name", "a"], "and", 10)
+    assessment.add_graded_component("a", ["a"], "or", 5)
+
+    return assessment
+
+
+def test_sinks(lab):
+    """ Rows of every student are written in each format. """
+
+    lab.add_sink(open_sink("progress.csv"))
+    lab.add_sink(open_sink("progress.jsonl"))
+    lab.grade("grades.csv")
+
+    assert read_grades("progress.csv") == read_grades("grades.csv")
+
+    with open("progress.jsonl") as f:
+        rows = {row["student"]: row for row in map(json.loads, f)}
+
+    assert rows["Student A"]["grades"] == {"name + a": 10, "a": 5}
+    assert rows["Student A"]["total"] == 15
+    assert rows["Student A"]["checks"]["a"]["passed"]
+    assert rows["Student A"]["checks"]["a"]["time"] >= 0
+    assert rows["Student A"]["checks"]["a"]["error"] is None
+    assert rows["Student A"]["duration"] >= 0
+
+    # Errors (here a timeout) are reported with the check
+    assert rows["Student C"]["total"] == 0
+    assert not rows["Student C"]["checks"]["a"]["passed"]
+    assert rows["Student C"]["checks"]["a"]["error"] == "Timed out"
+
+    assert not any(f.endswith(".tmp") for f in os.listdir("."))
+
+
+def test_no_sinks(lab):
+    """ Check details are only kept when rows are streamed. """
+
+    lab.grade("grades.csv")
+
+    assert len(lab.details) == 0
+    assert len(lab.results) == 3
+
+
+def test_streaming(lab):
+    """ Files are published while grading and complete when done. """
+
+    sink = CSVSink("progress.csv", interval = 3600)
+    lab.add_sink(sink)
+
+    seen = []
+    publish = sink.publish
+
+    def watched():
+        publish()
+        seen.append(read_grades("progress.csv"))
+
+    sink.publish = watched
+    lab.grade("grades.csv")
+
+    # Published for the first student, then only once grading is done
+    assert len(seen) == 2
+    assert len(seen[0]) == 2
+    assert len(seen[1]) == 4
+
+    # Regraded students replace their row
+    lab.grade("grades.csv", ["Student B"])
+    assert len(seen[-1]) == 4
+
+
+def test_parquet(lab):
+    """ Parquet output (with pyarrow installed) has a column per check. """
+
+    parquet = pytest.importorskip("pyarrow.parquet")
+
+    lab.add_sink(open_sink("progress.parquet"))
+    lab.grade("grades.csv")
+
+    table = parquet.read_table("progress.parquet").to_pydict()
+
+    assert sorted(table["student"]) == ["Student A", "Student B", "Student C"]
+    assert "passed:a" in table and "total" in table
+
+
+def test_unknown_format():
+    """ Only known extensions are accepted. """
+
+    with pytest.raises(SinkError):
+        open_sink("progress.xlsx")
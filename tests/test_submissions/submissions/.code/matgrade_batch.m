@@ -0,0 +1,41 @@
+function results = matgrade_batch(f, calls)
+% Runs each {nargout, {argument expressions}} row of calls against function f,
+% recording the last output, error message/line and run time. Progress is
+% mirrored to the base workspace so partial results survive a cancellation.
+
+assignin('base', 'matgrade_batch_results', {});
+results = cell(1, size(calls, 1));
+
+for i = 1:size(calls, 1)
+
+    n = calls{i, 1};
+    expressions = calls{i, 2};
+
+    result = struct('value', [], 'message', '', 'line', 0, 'time', 0);
+    outputs = cell(1, n);
+
+    start = tic;
+    try
+        inputs = cell(1, numel(expressions));
+        for j = 1:numel(expressions)
+            inputs{j} = evalin('base', expressions{j});
+        end
+
+        [outputs{:}] = feval(f, inputs{:});
+        result.value = outputs{n};
+    catch e
+        result.message = e.message;
+        for k = 1:numel(e.stack)
+            if strcmp(e.stack(k).name, f)
+                result.line = e.stack(k).line;
+                break
+            end
+        end
+    end
+    result.time = toc(start);
+
+    results{i} = result;
+    assignin('base', 'matgrade_batch_results', results);
+end
+
+end
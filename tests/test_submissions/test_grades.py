@@ -17,7 +17,12 @@ from matgrade import matgrade
 @pytest.fixture(scope = 'session', autouse = True)
 @patch(
     'argparse.ArgumentParser.parse_args',
-    return_value=argparse.Namespace(path = "lab.yaml", moss = None)
+    return_value=argparse.Namespace(
+        path = "lab.yaml", moss = None, plagiarism = False, archive = [],
+        workers = 1, batch = False, no_cache = True, profile = None,
+        watch = False, session = None, daemon = False, resume = False,
+        shard = None, output = []
+    )
 )
 def grades(placeholder):
 
@@ -0,0 +1,117 @@
+import pytest
+import os
+import time
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+from matgrade import Assessment
+from matgrade.ingest import ingest, refresh
+from matgrade.watch import Watcher, watch
+
+from conftest import read_grades, write_lab
+
+
+def add(folder, student, value, time = "Oct 3, 2021 1123 PM"):
+
+    filename = "1-1 - {} - {}-f.m".format(student, time)
+
+    with open(os.path.join(folder, filename), "w") as f:
+        f.write("function z = f(x)\nz = {}\nend\n".format(value))
+
+    return filename
+
+
+@pytest.fixture
+def lab(tmp_path, fake_engines):
+
+    os.chdir(str(tmp_path))
+
+    solution, submissions = write_lab(str(tmp_path), {
+        "Student A": ("f.m", 1),
+        "Student B": ("f.m", 2),
+    })
+
+    factory, engines = fake_engines
+
+    assessment = Assessment(solution, submissions, factory = factory)
+    assessment.add_value_check("a", ["'a'"], 0.01, False, 1)
+    assessment.add_graded_component("a", ["a"], "and", 10)
+    assessment.grade("grades.csv")
+
+    return assessment, engines[0]
+
+
+#------------------------------------------------------------------------------
+
+def test_refresh(tmp_path):
+    """ Only new, changed or removed submissions should be reported."""
+
+    _, folder = write_lab(str(tmp_path), {"Student A": ("f.m", 1)})
+    folder = str(tmp_path / folder)
+    records, contents = ingest(folder)
+
+    # Touched but unchanged
+    name = os.path.basename(records["Student A"].source)
+    os.utime(os.path.join(folder, name))
+    assert refresh(folder, records, contents, [name])[2] == set()
+
+    # Newer submission and new student
+    names = [
+        add(folder, "Student A", 2, "Oct 4, 2021 1123 PM"),
+        add(folder, "Student B", 1)
+    ]
+    records, contents, changed = refresh(folder, records, contents, names)
+
+    assert changed == {"Student A", "Student B"}
+    assert "z = 2" in contents["Student A"]
+
+    # Removed files trigger a rescan
+    os.remove(os.path.join(folder, names[1]))
+    records, contents, changed = refresh(folder, records, contents, names[1:])
+
+    assert changed == {"Student B"}
+    assert "Student B" not in records
+
+
+def test_watch(lab, tmp_path):
+    """ New submissions should be graded without regrading everyone."""
+
+    assessment, engine = lab
+    folder = str(tmp_path / "submissions")
+
+    watcher = Watcher(folder, interval = 0.05, debounce = 0.1, polling = True)
+
+    add(folder, "Student C", 1)
+    add(folder, "Student B", 1, "Oct 4, 2021 1123 PM")
+
+    engine.commands = []
+    watch(assessment, "grades.csv", watcher, rounds = 1)
+
+    grades = read_grades("grades.csv")
+    calls = [c for c in engine.commands if c.startswith("sub_")]
+
+    assert grades["Student A"] == ["10", "10"]
+    assert grades["Student B"] == ["10", "10"]
+    assert grades["Student C"] == ["10", "10"]
+
+    # Student B and C now share Student A's code (which was already run)
+    assert len(calls) == 0
+
+
+def test_limit(lab, tmp_path):
+    """ Bulk uploads should be graded a limited number at a time."""
+
+    assessment, _ = lab
+    folder = str(tmp_path / "submissions")
+
+    watcher = Watcher(folder, interval = 0.05, debounce = 0.1, polling = True)
+
+    for i in range(5):
+        add(folder, "Student {}".format(i), i)
+
+    watch(assessment, "grades.csv", watcher, limit = 2, rounds = 2)
+
+    grades = read_grades("grades.csv")
+    assert len([s for s in grades if s.startswith("Student ")]) == 2 + 4
@@ -0,0 +1,104 @@
+import pytest
+import threading
+
+import sys
+sys.path.append('../')
+sys.path.append('../matgrade')
+
+from matgrade.backends import FakeBackend, Hang, Stuck
+from matgrade.misc import run_matlab_function
+from matgrade.watchdog import Interrupted, Watchdog
+
+
+def hang(*arguments):
+    raise Hang
+
+
+def stuck(*arguments):
+    raise Stuck
+
+
+#------------------------------------------------------------------------------
+# Watchdog
+
+def test_result():
+    """ Completed calls should return their value without a timeout."""
+
+    engine = FakeBackend({"f": lambda x: x + 1})
+    watchdog = Watchdog(timeout = 0.05)
+
+    assert run_matlab_function("f", ["1"], 1, engine, None, watchdog) == 2
+    assert watchdog.timeouts == 0
+    assert engine.cancels == 0
+
+
+def test_timeout_cancels():
+    """ Hanging calls should be cancelled and raise TimeoutError."""
+
+    engine = FakeBackend({"f": hang})
+    watchdog = Watchdog(timeout = 0.05)
+
+    with pytest.raises(TimeoutError):
+        run_matlab_function("f", ["1"], 1, engine, None, watchdog)
+
+    assert engine.cancels == 1
+    assert watchdog.timeouts == 1
+    assert watchdog.restarts == 0
+
+
+def test_timeout_per_call():
+    """ An explicit timeout should override the watchdog default."""
+
+    engine = FakeBackend({"f": hang})
+    watchdog = Watchdog(timeout = 10.0)
+
+    with pytest.raises(TimeoutError):
+        run_matlab_function("f", ["1"], 1, engine, 0.05, watchdog)
+
+
+def test_restart_unconfirmed():
+    """ Calls that ignore cancellation should trigger an engine restart."""
+
+    restarts = []
+
+    engine = FakeBackend({"f": stuck})
+    watchdog = Watchdog(0.05, 0.05, 0.05, lambda: restarts.append(True))
+
+    with pytest.raises(TimeoutError):
+        run_matlab_function("f", ["1"], 1, engine, None, watchdog)
+
+    assert len(restarts) == 1
+    assert watchdog.restarts == 1
+
+
+def test_restart_unhealthy():
+    """ A failed health probe after cancellation should trigger a restart."""
+
+    restarts = []
+
+    # Every call (including the health probe) outlasts the probe deadline
+    engine = FakeBackend({"f": hang}, latency = 0.2)
+    watchdog = Watchdog(0.05, 0.05, 0.05, lambda: restarts.append(True))
+
+    with pytest.raises(TimeoutError):
+        run_matlab_function("f", ["1"], 1, engine, None, watchdog)
+
+    assert len(restarts) == 1
+
+
+def test_interrupt():
+    """ Interrupting should cancel the waited on call through its backend."""
+
+    engine = FakeBackend({"f": hang})
+    watchdog = Watchdog(timeout = 10.0)
+
+    timer = threading.Timer(0.05, watchdog.interrupt)
+    timer.start()
+
+    with pytest.raises(Interrupted):
+        run_matlab_function("f", ["1"], 1, engine, None, watchdog)
+
+    timer.join()
+
+    assert engine.cancels == 1
+    assert watchdog.timeouts == 0